@@ -0,0 +1,201 @@
+# Alternative routes: the k best loopless routes (Yen) and cheaper, more diverse ones found with penalties.
+#
+# _________________________________________________________________________________________
+# Intel.ligencia Artificial
+# Grau en Enginyeria Informatica
+# Curs 2021 - 2022
+# Universitat Autonoma de Barcelona
+# _________________________________________________________________________________________
+
+from SubwayMap import *
+from Routing import cost_graph, shortest_path_tree
+import heapq
+import math
+
+
+class DestinationTree:
+    """
+    Best routes from every station to destination_id for one type_preference (a single Dijkstra on the
+    reversed graph), shared by all the searches of a query:
+        cost[s]: cost of the best route s -> destination_id, the heuristic of the searches. Removing
+                 stations or connections, or making them more expensive, can only make routes dearer,
+                 so it stays admissible and consistent for all of them.
+        next[s]: station after s in that route (-1 if none)
+    """
+    def __init__(self, map, destination_id, type_preference=0):
+        self.destination_id = destination_id
+        self.graph = cost_graph(map, type_preference)
+        cost, parent = shortest_path_tree(cost_graph(map, type_preference, reverse=True), destination_id)
+        self.cost = cost.tolist()
+        self.next = parent.tolist()
+
+    def route(self, station):
+        # Best route station -> destination_id (None if there is none)
+        if self.cost[station] == math.inf:
+            return None
+        route = [station]
+        while route[-1] != self.destination_id:
+            route.append(self.next[route[-1]])
+        return route
+
+
+def edge_cost(graph, origin, destination):
+    # Cheapest connection origin -> destination of a CostGraph
+    offsets, indices, weights = graph.lists()
+    return min(weights[e] for e in range(offsets[origin], offsets[origin + 1]) if indices[e] == destination)
+
+
+def route_cost(graph, route):
+    return sum(edge_cost(graph, a, b) for a, b in zip(route, route[1:]))
+
+
+def spur_search(tree, origin, removed_stations=(), removed_connections=(), penalties=None, stats=None):
+    """
+     A* from origin to tree.destination_id without removed_stations and removed_connections, with
+     tree.cost as heuristic. When the best route of the tree from origin doesn't use anything removed
+     (or penalized) it is the answer and nothing is searched.
+     Format of the parameter is:
+        Args:
+            tree (DestinationTree): Costs and routes to the destination in the whole map
+            origin (int): Starting station id
+            removed_stations (set): Stations the route can't go through
+            removed_connections (set): (origin, destination) connections the route can't use
+            penalties (dict): Extra cost of some (origin, destination) connections
+            stats (SearchStats): Optional counters (see Instrumentation.py)
+        Returns:
+            (cost, route): cost of the route (penalties included) and its station ids; None if there is none
+    """
+    destination = tree.destination_id
+    penalties = penalties or {}
+    route = tree.route(origin)
+    if route is not None and not any(station in removed_stations for station in route) and \
+            not any(connection in removed_connections or connection in penalties for connection in zip(route, route[1:])):
+        return tree.cost[origin], route
+
+    offsets, indices, weights = tree.graph.lists()
+    h = tree.cost
+    g = {origin: 0.0}
+    parent = {origin: None}
+    heap = [(h[origin], 0.0, origin)]
+    while heap:
+        _, cost, station = heapq.heappop(heap)
+        if cost > g[station]:
+            continue                                    # stale entry
+        if station == destination:
+            route = [station]
+            while parent[route[-1]] is not None:
+                route.append(parent[route[-1]])
+            route.reverse()
+            return cost, route
+        if stats is not None:
+            stats.expand_station(station, cost, offsets[station + 1] - offsets[station])
+        for e in range(offsets[station], offsets[station + 1]):
+            neighbour = indices[e]
+            if neighbour in removed_stations or (station, neighbour) in removed_connections or h[neighbour] == math.inf:
+                continue
+            new_cost = cost + weights[e] + penalties.get((station, neighbour), 0.0)
+            if new_cost < g.get(neighbour, math.inf):
+                g[neighbour] = new_cost
+                parent[neighbour] = station
+                heapq.heappush(heap, (new_cost + h[neighbour], new_cost, neighbour))
+        if stats is not None:
+            stats.frontier(len(heap))
+    return None
+
+
+def make_path(route, cost):
+    path = Path(route)
+    path.g = cost
+    path.update_f()
+    return path
+
+
+def k_shortest_paths(origin_id, destination_id, map, k=3, type_preference=0, stats=None):
+    """
+     The k best routes without cycles from origin_id to destination_id (Yen's algorithm): every route
+     after the first is the best deviation of a route already found, from one of its stations (the spur)
+     and keeping the stations before it. All the spur searches share a single shortest path tree to the
+     destination: its costs are the heuristic of their A*, and a spur whose best route in the tree is
+     still allowed needs no search at all.
+     Format of the parameter is:
+        Args:
+            origin_id (int): Starting station id
+            destination_id (int): Final station id
+            map (object of Map class): All the map information
+            k (int): Number of routes
+            type_preference: INTEGER Value to indicate the preference selected (see calculate_cost)
+            stats (SearchStats): Optional counters of the spur searches (see Instrumentation.py)
+        Returns:
+            paths (list): Up to k Paths sorted by g (fewer if there aren't k routes)
+    """
+    if origin_id in map.closed or destination_id in map.closed:    # closed stations have no routes (see Map.close_station)
+        return []
+    tree = DestinationTree(map, destination_id, type_preference)
+    first = tree.route(origin_id)
+    if first is None or k < 1:
+        return []
+    found = [(tree.cost[origin_id], first)]
+    candidates = []                                     # (cost, route) heap of the deviations not taken yet
+    seen = {tuple(first)}
+
+    while len(found) < k:
+        previous = found[-1][1]
+        root_cost = 0.0
+        for j in range(len(previous) - 1):
+            root = previous[:j + 1]
+            removed_connections = {(route[j], route[j + 1]) for _, route in found if route[:j + 1] == root}
+            spur = spur_search(tree, previous[j], set(root[:-1]), removed_connections, stats=stats)
+            if spur is not None:
+                route = root[:-1] + spur[1]
+                if tuple(route) not in seen:
+                    seen.add(tuple(route))
+                    heapq.heappush(candidates, (root_cost + spur[0], route))
+            root_cost += edge_cost(tree.graph, previous[j], previous[j + 1])
+        if not candidates:
+            break
+        found.append(heapq.heappop(candidates))
+
+    return [make_path(route, cost) for cost, route in found]
+
+
+def alternative_routes(origin_id, destination_id, map, k=3, type_preference=0, penalty=0.5, max_stretch=None, stats=None):
+    """
+     Up to k different routes that share as little as possible: after every route, the connections it
+     uses cost (1 + penalty) times more (on top of the penalties they already had) and the best route
+     is searched again. It is one A* per route instead of one per station of every route (Yen), so it
+     suits a large k, but the routes are not the k best ones.
+     Format of the parameter is:
+        Args:
+            origin_id (int): Starting station id
+            destination_id (int): Final station id
+            map (object of Map class): All the map information
+            k (int): Number of routes
+            type_preference: INTEGER Value to indicate the preference selected (see calculate_cost)
+            penalty (float): Fraction of its cost added to a connection every time a route uses it
+            max_stretch (float): If given, routes that cost more than (1 + max_stretch) times the best one are dropped
+            stats (SearchStats): Optional counters of the searches (see Instrumentation.py)
+        Returns:
+            paths (list): Up to k Paths in the order they were found (the best one first), g is the real cost
+    """
+    if origin_id in map.closed or destination_id in map.closed:    # closed stations have no routes (see Map.close_station)
+        return []
+    tree = DestinationTree(map, destination_id, type_preference)
+    if tree.cost[origin_id] == math.inf or k < 1:
+        return []
+    penalties = {}
+    found = []
+    seen = set()
+    for _ in range(3 * k):                              # a penalized search can find a route again
+        _, route = spur_search(tree, origin_id, penalties=penalties, stats=stats)
+        cost = route_cost(tree.graph, route)
+        if max_stretch is not None and found and cost > (1 + max_stretch) * found[0].g:
+            break
+        if tuple(route) not in seen:
+            seen.add(tuple(route))
+            found.append(make_path(route, cost))
+            if len(found) == k:
+                break
+        for connection in zip(route, route[1:]):
+            extra = penalty * max(edge_cost(tree.graph, *connection), 1e-3)     # connections of cost 0 too
+            penalties[connection] = penalties.get(connection, 0.0) + extra
+    return found
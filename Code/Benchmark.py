@@ -0,0 +1,252 @@
+# Benchmark of the search algorithms on real or synthetic cities, with a JSON report that can be compared across runs.
+#
+# _________________________________________________________________________________________
+# Intel.ligencia Artificial
+# Grau en Enginyeria Informatica
+# Curs 2021 - 2022
+# Universitat Autonoma de Barcelona
+# _________________________________________________________________________________________
+
+from SearchAlgorithm import *
+from Instrumentation import SearchStats
+from Routing import cost_graph, shortest_path_tree
+from SyntheticCity import generate_city, write_city
+from MemoryBoundedSearch import iterative_deepening_Astar, SMAstar
+import argparse
+import datetime
+import inspect
+import json
+import platform
+import random
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+# Name -> (function(origin_id, destination_id, map, type_preference, **options), preferences it is run with)
+# DFS and BFS ignore the preference, so they are only run once
+ALGORITHMS = {
+    'depth_first_search': (lambda o, d, map, type_preference, **options: depth_first_search(o, d, map, **options), [None]),
+    'breadth_first_search': (lambda o, d, map, type_preference, **options: breadth_first_search(o, d, map, **options), [None]),
+    'uniform_cost_search': (uniform_cost_search, [0, 1, 2, 3]),
+    'Astar': (lambda o, d, map, type_preference, **options: Astar(
+        [map.stations[o]['x'], map.stations[o]['y']], [map.stations[d]['x'], map.stations[d]['y']], map, type_preference, **options),
+        [0, 1, 2, 3]),
+    'iterative_deepening_Astar': (iterative_deepening_Astar, [0, 1, 2, 3]),
+    'SMAstar': (SMAstar, [0, 1, 2, 3]),
+}
+
+# Run when no algorithms are asked for (the memory-bounded ones are much slower on big maps)
+DEFAULT_ALGORITHMS = ['depth_first_search', 'breadth_first_search', 'uniform_cost_search', 'Astar']
+
+
+class FrontierLimit(Exception):
+    pass
+
+
+class BenchmarkStats(SearchStats):
+    # SearchStats that stops the search when the frontier grows over max_frontier paths (tree searches on big maps)
+    def __init__(self, max_frontier):
+        super().__init__()
+        self.max_frontier = max_frontier
+
+    def frontier(self, size):
+        super().frontier(size)
+        if size > self.max_frontier:
+            raise FrontierLimit('frontier over {} paths'.format(self.max_frontier))
+
+
+def random_queries(map, queries, seed=0):
+    # (origin_id, destination_id) pairs of different stations with a route between them
+    rng = random.Random(seed)
+    stations = list(map.stations.keys())
+    graph = cost_graph(map, 0)
+    pairs = []
+    for _ in range(queries * 20):
+        if len(pairs) == queries:
+            break
+        origin, destination = rng.sample(stations, 2)
+        cost, _ = shortest_path_tree(graph, origin, [destination])
+        if np.isfinite(cost[destination]):
+            pairs.append((origin, destination))
+    return pairs
+
+
+def supported_options(search, options):
+    # The options search takes (IDA* and SMA* have no graph_search, for instance)
+    parameters = inspect.signature(search).parameters
+    if any(parameter.kind == inspect.Parameter.VAR_KEYWORD for parameter in parameters.values()):
+        return dict(options)
+    return {key: value for key, value in options.items() if key in parameters}
+
+
+def run_algorithm(search, pairs, map, type_preference, timeout, max_frontier, memory, options):
+    # Times search on every pair; returns the summary of the runs
+    seconds, expanded, generated, frontier, peak_memory = [], [], [], [], []
+    failures = {'timeout': 0, 'frontier_limit': 0, 'no_route': 0}
+    for origin, destination in pairs:
+        stats = BenchmarkStats(max_frontier)
+        try:
+            with test_timeout(timeout):
+                start = time.perf_counter()
+                path = search(origin, destination, map, type_preference, stats=stats, **options)
+                elapsed = time.perf_counter() - start
+        except TestTimeout:
+            failures['timeout'] += 1
+            continue
+        except FrontierLimit:
+            failures['frontier_limit'] += 1
+            continue
+        if path is None:
+            failures['no_route'] += 1
+            continue
+        seconds.append(elapsed)
+        expanded.append(stats.expanded)
+        generated.append(stats.generated)
+        frontier.append(stats.peak_frontier)
+
+        if memory:                                      # second run, tracemalloc slows the search down
+            tracemalloc.start()
+            try:
+                with test_timeout(timeout):
+                    search(origin, destination, map, type_preference, **options)
+                peak_memory.append(tracemalloc.get_traced_memory()[1])
+            except TestTimeout:
+                pass
+            finally:
+                tracemalloc.stop()
+
+    result = {'queries': len(pairs), 'solved': len(seconds), 'failures': failures}
+    if seconds:
+        result.update({'seconds': {'total': sum(seconds), 'mean': statistics.mean(seconds),
+                                   'median': statistics.median(seconds), 'max': max(seconds)},
+                       'expanded': {'total': sum(expanded), 'mean': statistics.mean(expanded), 'max': max(expanded)},
+                       'generated': {'total': sum(generated), 'mean': statistics.mean(generated)},
+                       'peak_frontier': max(frontier)})
+    if peak_memory:
+        result['peak_memory'] = {'mean': statistics.mean(peak_memory), 'max': max(peak_memory)}
+    return result
+
+
+def run_benchmark(root_folder, queries=20, algorithms=None, timeout=10, max_frontier=10 ** 6, memory=True, seed=0, **options):
+    """
+     Runs every algorithm (with every preference) on the same random queries of a city
+     Format of the parameter is:
+        Args:
+            root_folder (str): CityInformation folder of the city (see load_map)
+            queries (int): Number of (origin, destination) pairs, chosen at random among the ones with a route
+            algorithms (list): Names of ALGORITHMS to run (DEFAULT_ALGORITHMS by default)
+            timeout (int): Seconds a single query can take before it is given up (utils.test_timeout)
+            max_frontier (int): Size of the frontier at which a query is given up
+            memory (bool): Measure the peak memory of every query with tracemalloc (in a second run)
+            seed (int): Seed of the queries
+            options: Extra keyword arguments for the searches (graph_search=True, ...), only given to the
+                     ones that take them (the options used are in the result of every algorithm)
+        Returns:
+            report (dict): Map size, load time and, per algorithm and preference, the number of queries solved,
+                           the failures, seconds, expansions, peak frontier and peak memory
+    """
+    start = time.perf_counter()
+    map = load_map(root_folder)
+    load_seconds = time.perf_counter() - start
+    pairs = random_queries(load_map(root_folder), queries, seed)      # on its own copy, the searches get the map as loaded
+
+    report = {'city': os.path.basename(os.path.normpath(root_folder)), 'stations': len(map.stations),
+              'connections': sum(len(neighbours) for neighbours in map.connections.values()),
+              'load_seconds': load_seconds, 'queries': queries, 'seed': seed, 'timeout': timeout,
+              'options': options, 'results': {}}
+    for name in algorithms or DEFAULT_ALGORITHMS:
+        search, preferences = ALGORITHMS[name]
+        search_options = supported_options(search, options)
+        report['results'][name] = {}
+        for type_preference in preferences:
+            result = run_algorithm(search, pairs, map, type_preference, timeout, max_frontier, memory, search_options)
+            result['options'] = search_options
+            report['results'][name][str(type_preference)] = result
+    return report
+
+
+def run_suite(sizes, queries=20, geometry='random', format='auto', **kwargs):
+    # Benchmarks synthetic cities of the given numbers of stations (see SyntheticCity.py), returns one report for all
+    reports = []
+    with tempfile.TemporaryDirectory() as folder:
+        for size in sizes:
+            root_folder = os.path.join(folder, 'Synthetic_{}'.format(size))
+            write_city(generate_city(size, geometry=geometry), root_folder, format)
+            report = run_benchmark(root_folder, queries, **kwargs)
+            report['city'] = 'Synthetic_{}_{}'.format(size, geometry)
+            reports.append(report)
+    return reports
+
+
+def environment():
+    return {'date': datetime.datetime.now().isoformat(timespec='seconds'), 'python': platform.python_version(),
+            'numpy': np.__version__, 'platform': platform.platform(), 'cpu_count': os.cpu_count()}
+
+
+def compare_reports(old, new):
+    """
+     Lines comparing two reports written by this module (mean seconds and mean expansions of every
+     city, algorithm and preference found in both); a ratio under 1 means the new run is better.
+    """
+    old_runs = {(report['city'], name, preference): result for report in old['reports']
+                for name, preferences in report['results'].items() for preference, result in preferences.items()}
+    lines = ['{:<28} {:<22} {:>4} {:>12} {:>12} {:>7} {:>12}'.format('city', 'algorithm', 'pref', 'old s', 'new s', 'ratio', 'expanded')]
+    for report in new['reports']:
+        for name, preferences in report['results'].items():
+            for preference, result in preferences.items():
+                previous = old_runs.get((report['city'], name, preference))
+                if previous is None or 'seconds' not in previous or 'seconds' not in result:
+                    continue
+                old_seconds, new_seconds = previous['seconds']['mean'], result['seconds']['mean']
+                lines.append('{:<28} {:<22} {:>4} {:>12.6f} {:>12.6f} {:>7.2f} {:>5.0f}->{:<6.0f}'.format(
+                    report['city'], name, preference, old_seconds, new_seconds, new_seconds / old_seconds if old_seconds else math.nan,
+                    previous['expanded']['mean'], result['expanded']['mean']))
+    return lines
+
+
+if __name__ == "__main__":
+    # python Benchmark.py run ../CityInformation/Lyon_bigCity/ -o before.json
+    # python Benchmark.py suite --sizes 100 1000 10000 -o before.json
+    # python Benchmark.py compare before.json after.json
+    parser = argparse.ArgumentParser(description='Benchmark of the search algorithms')
+    commands = parser.add_subparsers(dest='command', required=True)
+    for command in ('run', 'suite'):
+        subparser = commands.add_parser(command)
+        if command == 'run':
+            subparser.add_argument('root_folders', nargs='+')
+        else:
+            subparser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 10000])
+            subparser.add_argument('--geometry', default='random')
+            subparser.add_argument('--format', default='auto')
+        subparser.add_argument('--queries', type=int, default=20)
+        subparser.add_argument('--algorithms', nargs='+', choices=list(ALGORITHMS))
+        subparser.add_argument('--timeout', type=int, default=10)
+        subparser.add_argument('--max-frontier', type=int, default=10 ** 6)
+        subparser.add_argument('--no-memory', action='store_true', help='do not measure memory with tracemalloc')
+        subparser.add_argument('--graph-search', action='store_true')
+        subparser.add_argument('-o', '--output', help='JSON report (printed if not given)')
+    compare = commands.add_parser('compare')
+    compare.add_argument('old')
+    compare.add_argument('new')
+    args = parser.parse_args()
+
+    if args.command == 'compare':
+        with open(args.old) as old, open(args.new) as new:
+            print('\n'.join(compare_reports(json.load(old), json.load(new))))
+        sys.exit(0)
+
+    kwargs = {'algorithms': args.algorithms, 'timeout': args.timeout, 'max_frontier': args.max_frontier,
+              'memory': not args.no_memory}
+    if args.graph_search:
+        kwargs['graph_search'] = True
+    if args.command == 'run':
+        reports = [run_benchmark(root_folder, args.queries, **kwargs) for root_folder in args.root_folders]
+    else:
+        reports = run_suite(args.sizes, args.queries, args.geometry, args.format, **kwargs)
+    output = json.dumps({'environment': environment(), 'reports': reports}, indent=2)
+    if args.output:
+        with open(args.output, 'w') as fp:
+            fp.write(output + '\n')
+    else:
+        print(output)
@@ -0,0 +1,263 @@
+# Contraction hierarchy of a Map: preprocessing that makes point to point queries on large maps very fast.
+#
+# _________________________________________________________________________________________
+# Intel.ligencia Artificial
+# Grau en Enginyeria Informatica
+# Curs 2021 - 2022
+# Universitat Autonoma de Barcelona
+# _________________________________________________________________________________________
+
+from SubwayMap import *
+from Routing import cost_graph
+import heapq
+import numpy as np
+
+# Format of the files written by ContractionHierarchy.save
+HIERARCHY_VERSION = 1
+# Witness searches give up after settling this many stations (a shortcut is added when in doubt)
+WITNESS_SETTLE_LIMIT = 500
+# The simulated contractions that rank the stations settle fewer stations, this many connections away at most
+PRIORITY_SETTLE_LIMIT = 50
+PRIORITY_HOP_LIMIT = 2
+
+
+def witness_costs(out_edges, origin, skip, targets, limit, settle_limit=WITNESS_SETTLE_LIMIT, hop_limit=None):
+    """
+     Dijkstra from origin in the graph of the stations not contracted yet, without going through skip.
+     It stops when all the targets are settled, at limit, after settle_limit stations or hop_limit
+     connections away from origin, so the costs are only upper bounds: a route that is not found just
+     makes a shortcut.
+     Format of the parameter is:
+        Args:
+            out_edges (list): {target: (cost, middle)} of every station, only with stations not contracted
+            origin (int): Station the search starts at
+            skip (int): Station being contracted
+            targets (set): Stations whose cost is needed
+            limit (float): Cost where the search stops
+            settle_limit (int): Stations the search can settle
+            hop_limit (int): Connections the routes can have (None for no limit)
+        Returns:
+            cost (dict): {station: cost of the best route found from origin}
+    """
+    cost = {origin: 0.0}
+    hops = {origin: 0}
+    heap = [(0.0, origin)]
+    settled = 0
+    left = len(targets)
+    while heap and settled < settle_limit:
+        g, station = heapq.heappop(heap)
+        if g > cost[station]:
+            continue
+        if g > limit:
+            break
+        if station in targets:
+            left -= 1
+            if left == 0:
+                break
+        settled += 1
+        if hop_limit is not None and hops[station] >= hop_limit:
+            continue
+        for neighbour, (c, _) in out_edges[station].items():
+            if neighbour == skip:
+                continue
+            if g + c < cost.get(neighbour, np.inf):
+                cost[neighbour] = g + c
+                hops[neighbour] = hops[station] + 1
+                heapq.heappush(heap, (g + c, neighbour))
+    return cost
+
+
+def shortcuts_of(station, out_edges, in_edges, settle_limit=WITNESS_SETTLE_LIMIT, hop_limit=None):
+    # Shortcuts (origin, target, cost) needed to keep the best routes if station is contracted
+    # (one witness search per origin covers all the targets)
+    shortcuts = []
+    for origin, (c_in, _) in in_edges[station].items():
+        targets = [(target, c_out) for target, (c_out, _) in out_edges[station].items() if target != origin]
+        if not targets:
+            continue
+        cost = witness_costs(out_edges, origin, station, {target for target, _ in targets},
+                             c_in + max(c_out for _, c_out in targets), settle_limit, hop_limit)
+        for target, c_out in targets:
+            if cost.get(target, np.inf) > c_in + c_out:
+                shortcuts.append((origin, target, c_in + c_out))
+    return shortcuts
+
+
+class ContractionHierarchy:
+    """
+    Stations are ranked and every route is turned into an upward part from the origin and an upward
+    part (in the reversed graph) from the destination, joined at the highest ranked station.
+        rank[s]: order in which station s was contracted
+        forward[u]: [(w, cost)] edges u -> w with rank[w] > rank[u]
+        backward[w]: [(u, cost)] edges u -> w with rank[u] > rank[w]
+        middle[(u, w)]: station skipped by the shortcut u -> w (-1 for real connections)
+    It is built from the map as it is at the time: later changes (close_station, update_connection, ...)
+    are not seen by query, the hierarchy has to be built again.
+    Usage:
+        >>> hierarchy = ContractionHierarchy.build(map, type_preference=1)
+        >>> hierarchy.query(9, 3)                 # Path with the route and g
+        >>> hierarchy.save('lyon_time.npz')
+        >>> hierarchy = ContractionHierarchy.load('lyon_time.npz')
+    """
+    def __init__(self, rank, edges, type_preference):
+        # edges: {(u, w): (cost, middle)} with the real connections and the shortcuts
+        self.rank = rank
+        self.type_preference = type_preference
+        self.middle = {}
+        self.cost = {}
+        self.forward = [[] for _ in rank]
+        self.backward = [[] for _ in rank]
+        for (u, w), (cost, middle) in edges.items():
+            self.cost[(u, w)] = cost
+            self.middle[(u, w)] = middle
+            if rank[u] < rank[w]:
+                self.forward[u].append((w, cost))
+            else:
+                self.backward[w].append((u, cost))
+
+    @staticmethod
+    def build(map, type_preference=1):
+        """
+         Contracts the stations of the map one by one (lowest edge difference first)
+         Format of the parameter is:
+            Args:
+                map (object of Map class): All the map information
+                type_preference: INTEGER Value to indicate the preference selected, meant for
+                                1 - minimum Time
+                                2 - minimum Distance
+            Returns:
+                hierarchy (ContractionHierarchy): the hierarchy, ready to be queried
+        """
+        graph = cost_graph(map, type_preference)
+        offsets, indices, weights = graph.lists()
+        size = len(graph)
+        out_edges = [{} for _ in range(size)]
+        in_edges = [{} for _ in range(size)]
+        for u in range(size):
+            for e in range(offsets[u], offsets[u + 1]):
+                w, cost = indices[e], weights[e]
+                if w != u and cost < out_edges[u].get(w, (np.inf, -1))[0]:
+                    out_edges[u][w] = (cost, -1)
+                    in_edges[w][u] = (cost, -1)
+
+        # out_edges and in_edges only keep the stations not contracted yet, the edges of a
+        # station are moved to edges when it is contracted
+        edges = {}
+        neighbours_contracted = [0] * size
+
+        def priority(station):
+            # Edge difference of a simulated contraction that only looks a few connections away
+            shortcuts = shortcuts_of(station, out_edges, in_edges, PRIORITY_SETTLE_LIMIT, PRIORITY_HOP_LIMIT)
+            return len(shortcuts) - len(in_edges[station]) - len(out_edges[station]) + neighbours_contracted[station]
+
+        priorities = [priority(station) for station in range(size)]
+        heap = [(p, station) for station, p in enumerate(priorities)]
+        heapq.heapify(heap)
+        contracted = [False] * size
+        rank = [0] * size
+        order = 0
+        while heap:
+            p, station = heapq.heappop(heap)
+            if contracted[station] or p != priorities[station]:
+                continue                                    # stale entry, the station was pushed again
+
+            for origin, target, cost in shortcuts_of(station, out_edges, in_edges):
+                if cost < out_edges[origin].get(target, (np.inf, -1))[0]:
+                    out_edges[origin][target] = (cost, station)
+                    in_edges[target][origin] = (cost, station)
+            for target, value in out_edges[station].items():
+                edges[(station, target)] = value
+                del in_edges[target][station]
+            for origin, value in in_edges[station].items():
+                edges[(origin, station)] = value
+                del out_edges[origin][station]
+            neighbours = set(out_edges[station]) | set(in_edges[station])
+            out_edges[station], in_edges[station] = {}, {}
+            contracted[station] = True
+            rank[station] = order
+            order += 1
+
+            for neighbour in neighbours:                    # only the neighbours can change priority
+                neighbours_contracted[neighbour] += 1
+                priorities[neighbour] = priority(neighbour)
+                heapq.heappush(heap, (priorities[neighbour], neighbour))
+
+        return ContractionHierarchy(rank, edges, type_preference)
+
+    def unpack(self, u, w):
+        # Real connections of the (possibly shortcut) edge u -> w, as a list of stations after u
+        middle = self.middle[(u, w)]
+        if middle == -1:
+            return [w]
+        return self.unpack(u, middle) + self.unpack(middle, w)
+
+    def query(self, origin_id, destination_id):
+        """
+         Bidirectional upward Dijkstra
+         Format of the parameter is:
+            Args:
+                origin_id (int): Starting station id
+                destination_id (int): Final station id
+            Returns:
+                path (Path Class): The best route from origin_id to destination_id with its g (None if there is none)
+        """
+        cost = [{origin_id: 0.0}, {destination_id: 0.0}]
+        parent = [{origin_id: -1}, {destination_id: -1}]
+        heaps = [[(0.0, origin_id)], [(0.0, destination_id)]]
+        graphs = [self.forward, self.backward]
+        best, meeting = (0.0, origin_id) if origin_id == destination_id else (np.inf, -1)
+
+        while heaps[0] or heaps[1]:
+            side = 0 if heaps[0] and (not heaps[1] or heaps[0][0][0] <= heaps[1][0][0]) else 1
+            g, station = heapq.heappop(heaps[side])
+            if g >= best:
+                heaps[side] = []                            # nothing better can come from this side
+                continue
+            if g > cost[side][station]:
+                continue
+            if station in cost[1 - side] and g + cost[1 - side][station] < best:
+                best, meeting = g + cost[1 - side][station], station
+            for neighbour, c in graphs[side][station]:
+                if g + c < cost[side].get(neighbour, np.inf):
+                    cost[side][neighbour] = g + c
+                    parent[side][neighbour] = station
+                    heapq.heappush(heaps[side], (g + c, neighbour))
+
+        if meeting == -1:
+            return None
+
+        # upward edges from the origin to the meeting station, then down to the destination
+        up = [meeting]
+        while parent[0][up[-1]] != -1:
+            up.append(parent[0][up[-1]])
+        up.reverse()
+        down = [meeting]
+        while parent[1][down[-1]] != -1:
+            down.append(parent[1][down[-1]])
+
+        path = Path(origin_id)
+        for u, w in zip(up + down[1:], up[1:] + down[1:]):
+            for station in self.unpack(u, w):
+                path.update_g(self.cost[(path.last, station)])       # real connections, added in route order
+                path.add_route(station)
+        path.update_f()
+        return path
+
+    def save(self, filename):
+        edges = list(self.cost.keys())
+        np.savez(filename,
+                 version=HIERARCHY_VERSION,
+                 type_preference=self.type_preference,
+                 rank=np.array(self.rank, dtype=np.int64),
+                 edges=np.array(edges, dtype=np.int64).reshape(-1, 2),
+                 cost=np.array([self.cost[edge] for edge in edges], dtype=np.float64),
+                 middle=np.array([self.middle[edge] for edge in edges], dtype=np.int64))
+
+    @staticmethod
+    def load(filename):
+        with np.load(filename) as data:
+            if int(data['version']) != HIERARCHY_VERSION:
+                raise ValueError('{} is not a version {} contraction hierarchy'.format(filename, HIERARCHY_VERSION))
+            edges = {(u, w): (cost, middle) for (u, w), cost, middle
+                     in zip(data['edges'].tolist(), data['cost'].tolist(), data['middle'].tolist())}
+            return ContractionHierarchy(data['rank'].tolist(), edges, int(data['type_preference']))
@@ -0,0 +1,130 @@
+# All-pairs cost tables of a Map, so queries on small and medium cities are answered without searching.
+#
+# _________________________________________________________________________________________
+# Intel.ligencia Artificial
+# Grau en Enginyeria Informatica
+# Curs 2021 - 2022
+# Universitat Autonoma de Barcelona
+# _________________________________________________________________________________________
+
+from SearchAlgorithm import *
+from Routing import cost_graph
+import hashlib
+import numpy as np
+
+# Bump it when the way the tables are built changes, so old cache files are not used
+TABLES_VERSION = 1
+PREFERENCES = [0, 1, 2, 3]
+
+
+def all_pairs_table(map, type_preference=0):
+    """
+     Floyd-Warshall over the weighted graph of the map, vectorized with NumPy (one N x N step per station)
+     Format of the parameter is:
+        Args:
+            map (object of Map class): All the map information
+            type_preference: INTEGER Value to indicate the preference selected (see calculate_cost)
+        Returns:
+            cost (np.array): cost[i, j] is the cost of the best route from i to j (np.inf if there is none)
+            next_hop (np.array): next_hop[i, j] is the station after i in that route (-1 if there is none)
+    """
+    graph = cost_graph(map, type_preference)
+    size = len(graph)
+    sources = np.repeat(np.arange(size), np.diff(graph.offsets))
+
+    cost = np.full((size, size), np.inf)
+    np.minimum.at(cost, (sources, graph.indices), graph.weights)
+    next_hop = np.where(np.isinf(cost), -1, np.arange(size)[None, :]).astype(np.int32)
+    np.fill_diagonal(cost, 0)
+    np.fill_diagonal(next_hop, np.arange(size))
+
+    for k in range(size):
+        through_k = cost[:, k, None] + cost[None, k, :]
+        better = through_k < cost
+        cost = np.where(better, through_k, cost)
+        next_hop = np.where(better, next_hop[:, k, None], next_hop)
+
+    return cost, next_hop
+
+
+class CostTables:
+    """
+    All-pairs tables of a Map for each type_preference: {type_preference: (cost, next_hop)}.
+    Attach them with map.add_cost_tables(tables) and uniform_cost_search and Astar answer from
+    the tables in O(route length). Among routes with the same cost the one kept by the table can
+    be different from the one the search would find.
+    """
+    def __init__(self, tables):
+        self.tables = tables
+
+    def path(self, origin_id, destination_id, map, type_preference=0):
+        # The best route as a Path with its g (None if destination_id can't be reached)
+        cost, next_hop = self.tables[type_preference]
+        if np.isinf(cost[origin_id, destination_id]):
+            return None
+        path = Path(origin_id)
+        station = origin_id
+        while station != destination_id:
+            station = int(next_hop[station, destination_id])
+            path.add_route(station)
+            calculate_cost([path], map, type_preference)        # g is added in route order, as the searches do
+        path.update_f()
+        return path
+
+    def save(self, filename):
+        arrays = {}
+        for type_preference, (cost, next_hop) in self.tables.items():
+            arrays['cost_{}'.format(type_preference)] = cost
+            arrays['next_hop_{}'.format(type_preference)] = next_hop
+        np.savez(filename, **arrays)
+
+    @staticmethod
+    def load(filename):
+        with np.load(filename) as data:
+            tables = {int(key.split('_')[1]): (data[key], data['next_hop_' + key.split('_')[1]])
+                      for key in data.files if key.startswith('cost_')}
+        return CostTables(tables)
+
+
+def build_cost_tables(map, preferences=PREFERENCES):
+    return CostTables({type_preference: all_pairs_table(map, type_preference) for type_preference in preferences})
+
+
+def map_hash(map, preferences=PREFERENCES):
+    # Hash of the weighted graphs the tables are built from, so a map changed after it was loaded
+    # (connections, stations, closures, ...) doesn't get the tables of another one
+    digest = hashlib.sha256('tables-v{}'.format(TABLES_VERSION).encode())
+    for type_preference in preferences:
+        graph = cost_graph(map, type_preference)
+        for array, dtype in ((graph.offsets, np.int64), (graph.indices, np.int64), (graph.weights, np.float64)):
+            digest.update(np.ascontiguousarray(array, dtype=dtype).tobytes())
+    return digest.hexdigest()
+
+
+def load_cost_tables(root_folder, map=None, cache_folder=None):
+    """
+     Loads the all-pairs tables of a city from the cache, building and caching them if they are not there.
+     Format of the parameter is:
+        Args:
+            root_folder (str): CityInformation folder of the city
+            map (object of Map class): The map of the city (read from root_folder if it is None); the
+                                       cache file is chosen by its content (map_hash), not by root_folder
+            cache_folder (str): Where cache files are kept (root_folder/__cache__ by default)
+        Returns:
+            map (object of Map class): The map with the tables attached
+    """
+    if map is None:
+        map = load_map(root_folder)
+    if cache_folder is None:
+        cache_folder = os.path.join(root_folder, '__cache__')
+    filename = os.path.join(cache_folder, 'tables_{}.npz'.format(map_hash(map)))
+
+    if os.path.exists(filename):
+        tables = CostTables.load(filename)
+    else:
+        tables = build_cost_tables(map)
+        os.makedirs(cache_folder, exist_ok=True)
+        tables.save(filename)
+
+    map.add_cost_tables(tables)
+    return map
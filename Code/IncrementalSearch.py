@@ -0,0 +1,209 @@
+# Lifelong Planning A* (LPA*): shortest routes that are repaired, not recomputed, when the map changes.
+#
+# _________________________________________________________________________________________
+# Intel.ligencia Artificial
+# Grau en Enginyeria Informatica
+# Curs 2021 - 2022
+# Universitat Autonoma de Barcelona
+# _________________________________________________________________________________________
+
+from SubwayMap import *
+from Routing import cost_graph
+import heapq
+import math
+
+UNREACHED = (math.inf, 0)                               # g and rhs of the stations without a route
+
+
+class LPAstar:
+    """
+    Best route from origin_id (to destination_id, or to every station if it is None) that follows the
+    changes of the map. After map.close_station, map.reopen_station or map.update_connection, search()
+    reads the change log of the map (Map.changes_since) and only the stations whose cost can change
+    are visited again; any other change of the map (add_connection, ...) starts from scratch.
+
+    Costs are the ones of calculate_cost for type_preference (see Routing.cost_graph).
+    g[s] is the cost of the best route to s found so far, rhs[s] the one its predecessors give; s is
+    consistent when both are equal and only inconsistent stations are in the queue, ordered by
+    min(g, rhs) + h. Costs are (cost, stations) pairs compared in that order: with preferences 2 and 3
+    connections can cost 0, and stations joined by them would otherwise keep each other reachable
+    after the route they came from is closed; among equally good routes the shortest one is kept.
+    Landmarks (see Landmarks.py) give h, 0 without them; they were built on the costs of the map at the
+    time, so they stay admissible after closures and more expensive connections but not after a
+    connection gets cheaper than it was then.
+    Usage:
+        >>> planner = LPAstar(map, 9, 3, type_preference=1)
+        >>> planner.search()
+        >>> map.close_station(12)
+        >>> planner.search()                        # repaired
+    """
+    def __init__(self, map, origin_id, destination_id=None, type_preference=0, landmarks=None, stats=None):
+        self.map = map
+        self.origin_id = origin_id
+        self.destination_id = destination_id
+        self.type_preference = type_preference
+        self.landmarks = landmarks if destination_id is not None else None
+        self.stats = stats
+        self.reset()
+
+    def reset(self):
+        # Forgets everything, as if nothing was searched yet
+        self.version = self.map.version
+        self.load_graphs()
+        size = len(self.successors[0]) - 1
+        self.g = [UNREACHED] * size
+        self.rhs = [UNREACHED] * size
+        self.queued = {}                                # station -> key it has in the heap
+        self.heap = []
+        if self.landmarks is not None:
+            # A hair under the estimate: rounding can put it over the true cost, and stop compute() on a tie too early
+            self.h = [max(h * (1 - 1e-9) - 1e-9, 0.0) for h in self.landmarks.estimate(list(range(size)), self.destination_id).tolist()]
+        else:
+            self.h = None
+        self.rhs[self.origin_id] = (0.0, 0)
+        self.push(self.origin_id)
+
+    def load_graphs(self):
+        # Own copies of the costs of every connection, also of closed stations (they are skipped in
+        # update_station and route), so the shape never changes and update() patches them in place
+        self.successors = tuple(list(column) for column in cost_graph(self.map, self.type_preference, closed=True).lists())
+        self.predecessors = tuple(list(column) for column in cost_graph(self.map, self.type_preference, reverse=True, closed=True).lists())
+
+    def update_cost(self, origin, destination, time):
+        # New cost of the connection origin -> destination (time is its new cost in Time.txt), in both graphs
+        if self.type_preference == 1:                   # - minimum Time
+            cost = float(time)
+        elif self.type_preference == 2:                 # - minimum Distance (0 between stations in the same place)
+            x, y, line, velocity = self.map.stations.lists()
+            same_place = x[origin] == x[destination] and y[origin] == y[destination]
+            cost = 0.0 if same_place else velocity[destination] * time
+        else:                                           # adjacency and transfers don't depend on the time
+            return
+        for (offsets, indices, weights), station, neighbour in ((self.successors, origin, destination),
+                                                                (self.predecessors, destination, origin)):
+            for e in range(offsets[station], offsets[station + 1]):
+                if indices[e] == neighbour:
+                    weights[e] = cost
+
+    def key(self, station):
+        best = min(self.g[station], self.rhs[station])
+        return (best[0] + (self.h[station] if self.h is not None else 0.0), best)
+
+    def push(self, station):
+        key = self.key(station)
+        self.queued[station] = key
+        heapq.heappush(self.heap, (key, station))
+
+    def top(self):
+        # Smallest live entry of the heap (entries of stations that left the queue or got a new key are skipped)
+        while self.heap and self.queued.get(self.heap[0][1]) != self.heap[0][0]:
+            heapq.heappop(self.heap)
+        return self.heap[0] if self.heap else ((math.inf, UNREACHED), None)
+
+    def update_station(self, station):
+        # Recomputes rhs of station from its predecessors and puts it in the queue if it is inconsistent
+        closed = self.map.closed
+        if station != self.origin_id:
+            rhs = UNREACHED
+            if station not in closed:
+                offsets, indices, weights = self.predecessors
+                g = self.g
+                for e in range(offsets[station], offsets[station + 1]):
+                    previous = indices[e]
+                    cost = (g[previous][0] + weights[e], g[previous][1] + 1)
+                    if cost < rhs and previous not in closed:
+                        rhs = cost
+            self.rhs[station] = rhs
+        self.queued.pop(station, None)
+        if self.g[station] != self.rhs[station]:
+            self.push(station)
+
+    def compute(self):
+        # Settles stations until the destination (every station if there is none) is consistent
+        offsets, indices, _ = self.successors
+        destination = self.destination_id
+        while True:
+            key, station = self.top()
+            if station is None:
+                return
+            if destination is not None and key >= self.key(destination) and self.rhs[destination] == self.g[destination]:
+                return
+            del self.queued[station]
+            if self.stats is not None:
+                self.stats.expand_station(station, min(self.g[station], self.rhs[station])[0], offsets[station + 1] - offsets[station])
+            if self.g[station] > self.rhs[station]:     # the cost went down (or it is new): settle it
+                self.g[station] = self.rhs[station]
+            else:                                       # the cost went up: undo it and look again
+                self.g[station] = UNREACHED
+                self.update_station(station)
+            for e in range(offsets[station], offsets[station + 1]):
+                self.update_station(indices[e])
+            if self.stats is not None:
+                self.stats.frontier(len(self.queued))
+
+    def update(self):
+        # Applies the changes of the map since the last search
+        if self.map.version == self.version:
+            return
+        changes = self.map.changes_since(self.version)
+        if changes is None or any(change[1] == 'connection' and change[4] is None for change in changes):
+            self.reset()                                # connections were added, the graph is not the same
+            return
+        self.version = self.map.version
+        offsets, indices, _ = self.successors
+        for change in changes:
+            if change[1] in ('close', 'reopen'):          # the graphs keep closed stations, only the queue changes
+                station = change[2]
+                self.update_station(station)
+                for e in range(offsets[station], offsets[station + 1]):
+                    self.update_station(indices[e])
+            elif change[1] == 'connection':
+                self.update_cost(change[2], change[3], change[5])
+                self.update_station(change[3])
+
+    def search(self):
+        """
+         Brings the routes up to date with the map and returns the one to destination_id (see route)
+        """
+        self.update()
+        self.compute()
+        if self.destination_id is None:
+            return None
+        return self.route(self.destination_id)
+
+    def cost(self, station):
+        # Cost of the best route to station (math.inf if there is none); up to date after search()
+        if station in self.map.closed or self.origin_id in self.map.closed:
+            return math.inf                             # closed stations have no routes (see Map.close_station)
+        return self.g[station][0]
+
+    def route(self, station):
+        """
+         Best route from origin_id to station, rebuilt backwards through the predecessors that give each
+         station its cost (every step back has one station less, so it always gets to origin_id)
+         Format of the parameter is:
+            Args:
+                station (int): Final station id (destination_id, or any station if destination_id is None)
+            Returns:
+                path (Path Class): The route with its g, None if there is none
+        """
+        if self.cost(station) == math.inf:
+            return None
+        offsets, indices, weights = self.predecessors
+        closed = self.map.closed
+        g = self.g
+        route = [station]
+        while route[-1] != self.origin_id:
+            current = route[-1]
+            best, previous_station = UNREACHED, None
+            for e in range(offsets[current], offsets[current + 1]):
+                previous = indices[e]
+                cost = (g[previous][0] + weights[e], g[previous][1] + 1)
+                if cost < best and previous not in closed:
+                    best, previous_station = cost, previous
+            route.append(previous_station)
+        route.reverse()
+        path = Path(route)
+        path.g = g[station][0]
+        path.update_f()
+        return path
@@ -0,0 +1,158 @@
+# Counters, timers and traces of the search algorithms (see the stats argument of SearchAlgorithm.py).
+#
+# _________________________________________________________________________________________
+# Intel.ligencia Artificial
+# Grau en Enginyeria Informatica
+# Curs 2021 - 2022
+# Universitat Autonoma de Barcelona
+# _________________________________________________________________________________________
+
+from contextlib import contextmanager
+import functools
+import inspect
+import json
+import time
+
+
+class SearchStats:
+    """
+    Collects what a search does. Every search function takes stats=None; when it is None nothing is
+    counted (the only cost is a couple of `is not None` tests per expanded path).
+        expanded: paths taken out of the frontier and expanded
+        generated: paths created by expand
+        pruned_cycles: paths removed by remove_cycles
+        pruned_redundant: paths removed by remove_redundant_paths (new ones and frontier ones),
+                          or discarded by a visited set / best g in the graph search versions
+        peak_frontier: largest size of the frontier
+        forgotten: paths dropped by SMAstar to stay within its memory budget
+        iterations: bounds tried by iterative_deepening_Astar after the first one
+        phases: wall time (seconds) of every phase, e.g. {'coord2station': ..., 'search': ...}
+    If trace is given (a ListTrace, a JsonLinesTrace or anything with write(event)) every expansion
+    and every result is written to it as a dictionary, so the search can be replayed.
+    Usage:
+        >>> stats = SearchStats()
+        >>> Astar([108, 206], [67, 79], map, 1, stats=stats)
+        >>> stats.as_dict()
+    """
+    def __init__(self, trace=None):
+        self.trace = trace
+        self.reset()
+
+    def reset(self):
+        self.expanded = 0
+        self.generated = 0
+        self.pruned_cycles = 0
+        self.pruned_redundant = 0
+        self.peak_frontier = 0
+        self.forgotten = 0
+        self.iterations = 0
+        self.phases = {}
+        self.running = set()                            # phases being timed now
+
+    def expand(self, path, generated):
+        # path was expanded into generated new paths (called by SearchAlgorithm.expand)
+        self.expanded += 1
+        self.generated += generated
+        if self.trace is not None:
+            self.trace.write({'event': 'expand', 'station': int(path.last), 'g': float(path.g), 'f': float(path.f),
+                              'route': [int(station) for station in path.route], 'generated': generated})
+
+    def expand_station(self, station, g, generated):
+        # Same as expand for the searches that keep stations instead of paths (bidirectional ones)
+        self.expanded += 1
+        self.generated += generated
+        if self.trace is not None:
+            self.trace.write({'event': 'expand', 'station': int(station), 'g': float(g), 'generated': generated})
+
+    def frontier(self, size):
+        if size > self.peak_frontier:
+            self.peak_frontier = size
+
+    def prune_cycles(self, removed):
+        self.pruned_cycles += removed
+
+    def prune_redundant(self, removed):
+        self.pruned_redundant += removed
+
+    def forget(self, forgotten):
+        self.forgotten += forgotten
+
+    def iteration(self, bound):
+        self.iterations += 1
+        if self.trace is not None:
+            self.trace.write({'event': 'iteration', 'bound': float(bound)})
+
+    def result(self, path):
+        if self.trace is not None:
+            self.trace.write({'event': 'result', 'route': None if path is None else [int(station) for station in path.route],
+                              'g': None if path is None else float(path.g)})
+
+    @contextmanager
+    def phase(self, name):
+        # Adds the wall time of the with block to self.phases[name]
+        start = time.perf_counter()
+        self.running.add(name)
+        try:
+            yield self
+        finally:
+            self.running.discard(name)
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - start
+
+    def as_dict(self):
+        return {'expanded': self.expanded, 'generated': self.generated, 'pruned_cycles': self.pruned_cycles,
+                'pruned_redundant': self.pruned_redundant, 'peak_frontier': self.peak_frontier,
+                'forgotten': self.forgotten, 'iterations': self.iterations, 'phases': dict(self.phases)}
+
+
+def timed(name):
+    """
+     Decorator for search functions with a stats keyword argument: the call is timed as the phase
+     name of stats and its result is traced. Without stats, or when it is called from a function that
+     is already timing that phase (Astar_station2station -> best_first_graph_search), it is called directly.
+     stats can be given by keyword or by position.
+    """
+    def decorator(function):
+        position = list(inspect.signature(function).parameters).index('stats')
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            stats = kwargs.get('stats', args[position] if len(args) > position else None)
+            if stats is None or name in stats.running:
+                return function(*args, **kwargs)
+            with stats.phase(name):
+                path = function(*args, **kwargs)
+            stats.result(path)
+            return path
+        return wrapper
+    return decorator
+
+
+class ListTrace:
+    # Keeps the events in memory (self.events)
+    def __init__(self):
+        self.events = []
+
+    def write(self, event):
+        self.events.append(event)
+
+
+class JsonLinesTrace:
+    # Writes the events to a file, one JSON object per line (read them back with read_trace)
+    def __init__(self, file):
+        self.file = file
+
+    def write(self, event):
+        self.file.write(json.dumps(event) + '\n')
+
+
+def read_trace(filename):
+    """
+     Events of a trace written by JsonLinesTrace, in the order they happened
+     Format of the parameter is:
+        Args:
+            filename (str): The trace file
+        Returns:
+            events (list): One dictionary per event ('expand', 'iteration' or 'result')
+    """
+    with open(filename) as fileMap:
+        return [json.loads(line) for line in fileMap if line.strip()]
@@ -0,0 +1,92 @@
+# Landmark (ALT) heuristics: lower bounds from precomputed costs to and from a few landmark stations.
+#
+# _________________________________________________________________________________________
+# Intel.ligencia Artificial
+# Grau en Enginyeria Informatica
+# Curs 2021 - 2022
+# Universitat Autonoma de Barcelona
+# _________________________________________________________________________________________
+
+from SubwayMap import *
+from Routing import cost_graph, shortest_path_tree
+import numpy as np
+
+
+class Landmarks:
+    """
+    Costs between K landmark stations and every station for one type_preference:
+        from_cost[i, s]: cost of the best route landmarks[i] -> s
+        to_cost[i, s]: cost of the best route s -> landmarks[i]
+    By the triangle inequality, for any landmark L the cost of v -> t is at least
+    cost(L, t) - cost(L, v) and cost(v, L) - cost(t, L); estimate() takes the best of these bounds,
+    which is admissible and consistent.
+    Usage:
+        >>> landmarks = build_landmarks(map, 4, type_preference=1)
+        >>> Astar([140, 56], [140, 115], map, 1, landmarks=landmarks)
+    """
+    def __init__(self, landmarks, from_cost, to_cost, type_preference):
+        self.landmarks = landmarks
+        self.from_cost = from_cost
+        self.to_cost = to_cost
+        self.type_preference = type_preference
+
+    def estimate(self, stations, destination_id):
+        # Heuristic of every station in stations towards destination_id (np.array)
+        stations = np.asarray(stations, dtype=np.int64)
+        with np.errstate(invalid='ignore'):
+            forward = self.from_cost[:, destination_id, None] - self.from_cost[:, stations]
+            backward = self.to_cost[:, stations] - self.to_cost[:, destination_id, None]
+        bounds = np.concatenate([forward, backward])
+        bounds[~np.isfinite(bounds)] = 0                # unreachable landmarks say nothing
+        return np.maximum(bounds.max(axis=0), 0)
+
+
+def select_landmarks(map, k, type_preference=0):
+    """
+     Farthest landmark selection: each new landmark is the station farthest away from the ones already chosen
+     Format of the parameter is:
+        Args:
+            map (object of Map class): All the map information
+            k (int): Number of landmarks
+            type_preference: INTEGER Value to indicate the preference selected (see calculate_cost)
+        Returns:
+            landmarks (list): Station ids of the landmarks
+    """
+    graph = cost_graph(map, type_preference)
+    stations = np.array(list(map.stations.keys()), dtype=np.int64)
+    if len(stations) == 0 or k < 1:
+        return []
+
+    def farthest(distance):
+        # farthest reachable station that is not a landmark yet (None if there is none)
+        candidates = np.where(np.isfinite(distance), distance, -1)
+        candidates[np.isin(stations, landmarks)] = -1
+        return int(stations[np.argmax(candidates)]) if candidates.max() >= 0 else None
+
+    landmarks = []
+    current = farthest(shortest_path_tree(graph, int(stations[0]))[0][stations])
+    distance = np.full(len(stations), np.inf)           # cost from the closest landmark
+    while current is not None and len(landmarks) < k:
+        landmarks.append(current)
+        distance = np.minimum(distance, shortest_path_tree(graph, current)[0][stations])
+        current = farthest(distance)
+    return landmarks
+
+
+def build_landmarks(map, k=4, type_preference=0):
+    """
+     Selects k landmarks and computes the costs to and from them
+     Format of the parameter is:
+        Args:
+            map (object of Map class): All the map information
+            k (int): Number of landmarks
+            type_preference: INTEGER Value to indicate the preference selected (see calculate_cost)
+        Returns:
+            landmarks (Landmarks): Ready to be given to calculate_heuristics or Astar
+    """
+    landmarks = select_landmarks(map, k, type_preference)
+    forward = cost_graph(map, type_preference)
+    backward = cost_graph(map, type_preference, reverse=True)
+    from_cost = np.array([shortest_path_tree(forward, landmark)[0] for landmark in landmarks])
+    to_cost = np.array([shortest_path_tree(backward, landmark)[0] for landmark in landmarks])
+    return Landmarks(landmarks, from_cost.reshape(len(landmarks), -1), to_cost.reshape(len(landmarks), -1), type_preference)
@@ -0,0 +1,201 @@
+# Memory-bounded versions of A*: iterative deepening A* (IDA*) and simplified memory-bounded A* (SMA*).
+#
+# _________________________________________________________________________________________
+# Intel.ligencia Artificial
+# Grau en Enginyeria Informatica
+# Curs 2021 - 2022
+# Universitat Autonoma de Barcelona
+# _________________________________________________________________________________________
+
+from SearchAlgorithm import *
+import heapq
+import itertools
+import math
+
+
+def successors(path, map, destination_id, type_preference, landmarks, stats):
+    # Children of path without cycles, with g, h and f computed as in Astar_station2station
+    expand_paths = expand(path, map, stats)
+    expand_paths = remove_cycles(expand_paths, stats)
+    expand_paths = calculate_cost(expand_paths, map, type_preference)
+    expand_paths = calculate_heuristics(expand_paths, map, destination_id, type_preference, landmarks)
+    return update_f(expand_paths)
+
+
+@timed('search')
+def iterative_deepening_Astar(origin_id, destination_id, map, type_preference=0, landmarks=None, stats=None):
+    """
+     Iterative deepening A*: depth first searches that only follow paths with f <= bound, starting with
+     bound = h(origin) and raising it to the smallest f that went over it until the destination is found.
+     Only the current route and the siblings of its stations are kept, so memory is O(depth * branching)
+     whatever the size of the map; the price is expanding the first stations again in every iteration
+     (many iterations when costs are real numbers, as with type_preference 1 and 2).
+     Format of the parameter is:
+        Args:
+            origin_id (int): Starting station id
+            destination_id (int): Final station id
+            map (object of Map class): All the map information
+            type_preference: INTEGER Value to indicate the preference selected (see Astar)
+            landmarks (Landmarks): Optional landmark heuristic (see calculate_heuristics)
+            stats (SearchStats): Optional counters, timers and trace of the search (see Instrumentation.py)
+        Returns:
+            path (Path Class): The route that goes from origin_id to destination_id, None if there is none
+    """
+    if origin_id in map.closed or destination_id in map.closed:    # closed stations have no routes (see Map.close_station)
+        return None
+    root = Path(origin_id)
+    calculate_heuristics([root], map, destination_id, type_preference, landmarks)
+    root.update_f()
+    bound = root.f
+
+    while True:
+        next_bound = math.inf
+        stack = [[root]]                                # paths still to visit at every depth, the best one last
+        while stack:
+            if not stack[-1]:
+                stack.pop()
+                continue
+            path = stack[-1].pop()
+            if path.f > bound:
+                next_bound = min(next_bound, path.f)
+                continue
+            if path.last == destination_id:
+                return path.materialize()
+            children = successors(path, map, destination_id, type_preference, landmarks, stats)
+            children.sort(key=lambda p: p.f)
+            children.reverse()                          # ties are visited in the order of expand
+            stack.append(children)
+            if stats is not None:
+                stats.frontier(sum(len(level) for level in stack))
+        if next_bound == math.inf:
+            return None
+        bound = next_bound
+        if stats is not None:
+            stats.iteration(bound)
+
+
+class Node:
+    # Path of the SMA* search tree with its backed-up f, the children it keeps in memory and the f of the ones it forgot
+    def __init__(self, path, f, parent=None):
+        self.path = path
+        self.f = f
+        self.parent = parent
+        self.depth = 0 if parent is None else parent.depth + 1
+        self.children = {}                              # station -> child Node
+        self.forgotten = {}                             # station -> f of the forgotten child
+        self.version = 0                                # bumped when it enters or leaves the open list, older heap entries are stale
+        self.open = False
+
+
+@timed('search')
+def SMAstar(origin_id, destination_id, map, type_preference=0, max_nodes=10000, landmarks=None, stats=None):
+    """
+     Simplified memory-bounded A*: A* that keeps at most max_nodes paths in memory (on equal f, paths that
+     reach destination_id go first, then the deepest ones). When it is full, the worst leaf (highest f,
+     the shallowest one on ties) is forgotten and its f is backed up in its parent,
+     which goes back to the open list to generate it again if that f becomes the best one. With memory for
+     the optimal route (a route of n stations needs n + 1 paths) the
+     result has the same cost as Astar_station2station; with less, routes longer than max_nodes stations
+     can't be found, and a tight budget costs time (paths generated again), not memory.
+     Format of the parameter is:
+        Args:
+            origin_id (int): Starting station id
+            destination_id (int): Final station id
+            map (object of Map class): All the map information
+            type_preference: INTEGER Value to indicate the preference selected (see Astar)
+            max_nodes (int): Maximum number of paths kept in memory (at least 2)
+            landmarks (Landmarks): Optional landmark heuristic (see calculate_heuristics)
+            stats (SearchStats): Optional counters, timers and trace of the search (see Instrumentation.py)
+        Returns:
+            path (Path Class): The route that goes from origin_id to destination_id, None if there is none
+                               within the memory budget
+    """
+    if origin_id in map.closed or destination_id in map.closed:    # closed stations have no routes (see Map.close_station)
+        return None
+    if max_nodes < 2:
+        raise ValueError("SMAstar needs max_nodes >= 2")
+    root_path = Path(origin_id)
+    calculate_heuristics([root_path], map, destination_id, type_preference, landmarks)
+    root_path.update_f()
+
+    counter = itertools.count()
+    best_heap = []                                      # (f, not a route, -depth, order, version, node): the best node first
+    worst_heap = []                                     # (-f, depth, order, version, node): the worst node first
+    open_size = 0
+
+    def push(node):
+        # (Re)enters node in the open list with its current f
+        nonlocal open_size
+        if not node.open:
+            node.open = True
+            open_size += 1
+        node.version += 1
+        order = next(counter)
+        heapq.heappush(best_heap, (node.f, node.path.last != destination_id, -node.depth, order, node.version, node))
+        heapq.heappush(worst_heap, (-node.f, node.depth, order, node.version, node))
+
+    def remove(node):
+        nonlocal open_size
+        node.open = False
+        node.version += 1
+        open_size -= 1
+
+    def best_node():
+        while best_heap and best_heap[0][4] != best_heap[0][5].version:
+            heapq.heappop(best_heap)
+        return best_heap[0][5] if best_heap else None
+
+    def worst_leaf():
+        # Only leaves can be forgotten; nodes with children are in the open list to regenerate forgotten ones
+        while worst_heap and (worst_heap[0][3] != worst_heap[0][4].version or worst_heap[0][4].children):
+            heapq.heappop(worst_heap)
+        return worst_heap[0][4] if worst_heap else None
+
+    def forget(node):
+        # Drops a leaf and backs its f up in its parent
+        remove(node)
+        parent = node.parent
+        del parent.children[node.path.last]
+        parent.forgotten[node.path.last] = node.f
+        parent.f = min(parent.forgotten.values())      # it goes back to the open list to generate them again
+        push(parent)
+        if stats is not None:
+            stats.forget(1)
+
+    root = Node(root_path, root_path.f)
+    push(root)
+    used = 1
+
+    while True:
+        best = best_node()
+        if best is None or best.f == math.inf:
+            return None
+        if best.path.last == destination_id:
+            return best.path.materialize()
+
+        remove(best)
+        forgotten, best.forgotten = best.forgotten, {}
+        for path in successors(best.path, map, destination_id, type_preference, landmarks, stats):
+            if path.last in best.children:
+                continue                                # still in memory, only the forgotten ones are generated again
+            if path.last != destination_id and best.depth + 1 >= max_nodes - 1:
+                f = math.inf                            # deeper than the memory allows, it can't lead to a route
+            else:
+                f = max(best.f, path.f, forgotten.get(path.last, 0))    # pathmax, and what was learnt before forgetting it
+            child = Node(path, f, best)
+            best.children[path.last] = child
+            push(child)
+            used += 1
+        if not best.children:                           # dead end
+            best.f = math.inf
+            push(best)
+
+        while used > max_nodes:
+            worst = worst_leaf()
+            if worst is None or worst.parent is None:
+                break
+            forget(worst)
+            used -= 1
+
+        if stats is not None:
+            stats.frontier(open_size)
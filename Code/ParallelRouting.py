@@ -0,0 +1,65 @@
+# Batch routing on a pool of worker processes, each one with its own copy of the Map.
+#
+# _________________________________________________________________________________________
+# Intel.ligencia Artificial
+# Grau en Enginyeria Informatica
+# Curs 2021 - 2022
+# Universitat Autonoma de Barcelona
+# _________________________________________________________________________________________
+
+from SearchAlgorithm import *
+from SharedMap import attach_map
+from concurrent.futures import ProcessPoolExecutor
+import time
+
+# Search functions that can be asked for by name: (origin_id, destination_id, map, type_preference, **options)
+ALGORITHMS = {
+    'uniform_cost_search': uniform_cost_search,
+    'Astar': Astar_station2station,
+    'bidirectional_uniform_cost_search': bidirectional_uniform_cost_search,
+}
+
+# Map of the worker process, loaded once by init_worker
+worker_map = None
+
+
+def init_worker(root_folder, shared=None):
+    # Loads the map of root_folder, or attaches to the shared memory map given by the handle shared
+    global worker_map
+    worker_map = load_map(root_folder) if shared is None else attach_map(shared)
+
+
+def run_query(task):
+    # Runs one (origin_id, destination_id, type_preference) query in a worker, returns (path, seconds)
+    (origin_id, destination_id, type_preference), algorithm, options = task
+    start = time.perf_counter()
+    path = ALGORITHMS[algorithm](origin_id, destination_id, worker_map, type_preference, **options)
+    return path, time.perf_counter() - start
+
+
+def route_batch(queries, root_folder=None, algorithm='uniform_cost_search', max_workers=None, chunksize=None, shared=None, **options):
+    """
+     Runs a list of queries on a ProcessPoolExecutor. Every worker loads the map of root_folder (or attaches
+     to the shared one) once in init_worker, so only the queries and the resulting paths travel between processes.
+     Format of the parameter is:
+        Args:
+            queries (list): (origin_id, destination_id, type_preference) tuples
+            root_folder (str): CityInformation folder of the city
+            shared (dict): Instead of root_folder, the handle of a SharedMap; the workers attach to it
+                           without copying the map (see SharedMap.py)
+            algorithm (str): Name of the search to run (see ALGORITHMS)
+            max_workers (int): Number of processes (os.cpu_count() by default)
+            chunksize (int): Queries sent to a worker at a time (about 4 chunks per worker by default)
+            options: Extra keyword arguments for the search (graph_search=True, ...)
+        Returns:
+            results (list): (path, seconds) of every query, in the order of queries
+    """
+    if algorithm not in ALGORITHMS:
+        raise ValueError("unknown algorithm: {}".format(algorithm))
+    max_workers = max_workers or os.cpu_count() or 1
+    if chunksize is None:
+        chunksize = max(1, len(queries) // (max_workers * 4))
+
+    tasks = [(tuple(query), algorithm, options) for query in queries]
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=init_worker, initargs=(root_folder, shared)) as executor:
+        return list(executor.map(run_query, tasks, chunksize=chunksize))
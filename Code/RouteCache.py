@@ -0,0 +1,156 @@
+# Cache of search results, invalidated when the Map changes.
+#
+# _________________________________________________________________________________________
+# Intel.ligencia Artificial
+# Grau en Enginyeria Informatica
+# Curs 2021 - 2022
+# Universitat Autonoma de Barcelona
+# _________________________________________________________________________________________
+
+from SearchAlgorithm import *
+from collections import OrderedDict
+import time
+
+
+class LRUCache:
+    """
+    Bounded dictionary that evicts the least recently used entry when it is full.
+    Entries older than ttl seconds (if ttl is given) are treated as missing.
+    self.hits / self.misses count the lookups.
+    """
+    def __init__(self, max_size=1024, ttl=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()                    # key -> (value, time it was stored)
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def get(self, key, default=None):
+        entry = self.entries.get(key)
+        if entry is not None and self.ttl is not None and time.monotonic() - entry[1] > self.ttl:
+            del self.entries[key]
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return entry[0]
+
+    def put(self, key, value):
+        self.entries[key] = (value, time.monotonic())
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def pop(self, key):
+        self.entries.pop(key, None)
+
+    def keys(self):
+        return list(self.entries.keys())
+
+    def clear(self):
+        self.entries.clear()
+
+
+class RouteCache:
+    """
+    Caches the routes of uniform_cost_search and Astar for a Map.
+        Routes are keyed on (algorithm, origin, destination, type_preference, options).
+        Coordinates given to Astar are first snapped to their closest stations (coord2station), and
+        that snapping is cached too. With snap=r the coordinates are rounded to multiples of r first,
+        so nearby points share an entry (approximate; None means exact coordinates).
+        When map.version changes the map's change log (Map.changes_since) decides what is dropped:
+        closing a station only drops the routes through it, and making a connection more expensive
+        only the routes that use it, since every other route is still the best one. Reopening a
+        station, a cheaper connection or a change that is not logged (add_connection, add_velocity, ...)
+        drops everything.
+        The returned paths are copies, so callers can modify them.
+    Usage:
+        >>> cache = RouteCache(map, max_size=10000, ttl=3600)
+        >>> cache.uniform_cost_search(9, 3, 1)
+        >>> cache.Astar([108, 206], [67, 79], 0)
+        >>> cache.stats()
+    """
+    def __init__(self, map, max_size=1024, ttl=None, snap=None):
+        self.map = map
+        self.snap_resolution = snap
+        self.routes = LRUCache(max_size, ttl)
+        self.coordinates = LRUCache(max_size, ttl)
+        self.version = map.version
+
+    def check_version(self):
+        if self.map.version != self.version:
+            changes = self.map.changes_since(self.version)
+            if changes is None:
+                self.clear()
+            else:
+                for change in changes:
+                    self.apply(change)
+            self.version = self.map.version
+
+    def apply(self, change):
+        # Drops the routes a logged change of the map can make wrong
+        kind = change[1]
+        if kind == 'close':
+            station = change[2]
+            self.drop(lambda route: station in route)
+        elif kind == 'connection' and change[4] is not None and change[5] >= change[4]:
+            origin, destination = change[2], change[3]
+            self.drop(lambda route: any(a == origin and b == destination for a, b in zip(route, route[1:])))
+        else:
+            self.routes.clear()                         # something got cheaper, any route can have a better alternative
+
+    def drop(self, affected):
+        for key, (path, _) in list(self.routes.entries.items()):
+            if path is not None and affected(path.route):
+                self.routes.pop(key)
+
+    def clear(self):
+        self.routes.clear()
+        self.coordinates.clear()
+
+    def snap(self, coord):
+        # Closest stations of coord (tuple), as coord2station gives them
+        self.check_version()
+        if self.snap_resolution is not None:
+            coord = [round(c / self.snap_resolution) * self.snap_resolution for c in coord]
+        key = tuple(coord)
+        stations = self.coordinates.get(key)
+        if stations is None:
+            stations = tuple(coord2station(list(coord), self.map))
+            self.coordinates.put(key, stations)
+        return stations
+
+    def route(self, key, search):
+        # Cached result of search() for key (search is only called on a miss)
+        self.check_version()
+        path = self.routes.get(key, False)
+        if path is False:
+            path = search()
+            self.routes.put(key, path)
+        return None if path is None else path.copy()
+
+    def uniform_cost_search(self, origin_id, destination_id, type_preference=0, **options):
+        key = ('uniform_cost_search', origin_id, destination_id, type_preference, tuple(sorted(options.items())))
+        return self.route(key, lambda: uniform_cost_search(origin_id, destination_id, self.map, type_preference, **options))
+
+    def Astar_station2station(self, origin_id, destination_id, type_preference=0, **options):
+        key = ('Astar_station2station', origin_id, destination_id, type_preference, tuple(sorted(options.items())))
+        return self.route(key, lambda: Astar_station2station(origin_id, destination_id, self.map, type_preference, **options))
+
+    def Astar(self, origin_coor, dest_coor, type_preference=0, **options):
+        possible_origins = self.snap(origin_coor)[:1]           # same choice of origin as Astar
+        possible_dest = self.snap(dest_coor)
+        key = ('Astar', possible_origins, possible_dest, type_preference, tuple(sorted(options.items())))
+        return self.route(key, lambda: Astar_stations(list(possible_origins), list(possible_dest), self.map, type_preference, **options))
+
+    def stats(self):
+        return {'hits': self.routes.hits, 'misses': self.routes.misses, 'size': len(self.routes),
+                'snap_hits': self.coordinates.hits, 'snap_misses': self.coordinates.misses}
@@ -0,0 +1,281 @@
+# Array based single-source searches over a Map, used to answer many routing queries at once.
+#
+# _________________________________________________________________________________________
+# Intel.ligencia Artificial
+# Grau en Enginyeria Informatica
+# Curs 2021 - 2022
+# Universitat Autonoma de Barcelona
+# _________________________________________________________________________________________
+
+from SubwayMap import *
+from utils import *
+import heapq
+import numpy as np
+
+
+class CostGraph:
+    """
+    Weighted CSR graph of a Map for one type_preference: the connections of station s are
+    indices[offsets[s]:offsets[s+1]] and their costs weights[offsets[s]:offsets[s+1]].
+    The costs are the ones calculate_cost adds to a path for each connection, so the cost of a
+    route in this graph is the g that uniform_cost_search gives it.
+    """
+    def __init__(self, offsets, indices, weights):
+        self.offsets = offsets
+        self.indices = indices
+        self.weights = weights
+        self.python_lists = None
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def lists(self):
+        # The arrays as Python lists, which are much faster than NumPy for the element by element loops of the searches
+        if self.python_lists is None:
+            self.python_lists = (self.offsets.tolist(), self.indices.tolist(), self.weights.tolist())
+        return self.python_lists
+
+
+def station_arrays(map, size):
+    """
+    x, y, line and velocity of every station in arrays indexed by station id (size entries).
+    Ids without a station are NaN/0.
+    """
+    stations = map.stations
+    x = np.full(size, np.nan)
+    y = np.full(size, np.nan)
+    line = np.zeros(size, dtype=np.int64)
+    velocity = np.zeros(size)
+    ids = np.array([k for k in stations.ids if k < size], dtype=np.int64)
+    x[ids], y[ids], line[ids], velocity[ids] = stations.x[ids], stations.y[ids], stations.line[ids], stations.velocity[ids]
+    return x, y, line, velocity
+
+
+def cost_graph(map, type_preference=0, reverse=False, closed=False):
+    """
+     Builds (once per map and type_preference) the weighted graph of the map
+     Format of the parameter is:
+        Args:
+            map (object of Map class): All the map information
+            type_preference: INTEGER Value to indicate the preference selected:
+                            0 - Adjacency
+                            1 - minimum Time
+                            2 - minimum Distance
+                            3 - minimum Transfers
+            reverse (bool): if True every connection is reversed (for searches towards a destination)
+            closed (bool): if True the connections of closed stations (map.close_station) are kept
+        Returns:
+            graph (CostGraph): The connections of the map with the cost of the preference
+    """
+    closed = closed and bool(map.closed)                 # with no closed stations both graphs are the same
+    key = (type_preference, reverse, closed)
+    if key in map.cost_graphs:
+        return map.cost_graphs[key]
+
+    offsets, indices, time = map.csr_arrays()                 # the map keeps its backend (dictionaries or CSR)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    indices = np.asarray(indices, dtype=np.int64)
+    time = np.asarray(time, dtype=np.float64)
+    sources = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+    x, y, line, velocity = station_arrays(map, len(offsets) - 1)
+
+    if type_preference == 0:                                # - Adjacency
+        weights = np.ones(len(indices))
+    elif type_preference == 1:                              # - minimum Time
+        weights = time.copy()
+    elif type_preference == 2:                              # - minimum Distance (0 between stations in the same place)
+        same_place = (x[sources] == x[indices]) & (y[sources] == y[indices])
+        weights = np.where(same_place, 0.0, velocity[indices] * time)
+    elif type_preference == 3:                              # - minimum Transfers
+        weights = (line[sources] != line[indices]).astype(np.float64)
+    else:
+        raise ValueError("invalid type_preference: {}".format(type_preference))
+
+    if map.closed and not closed:                           # drop the connections from and to closed stations
+        is_closed = np.zeros(len(offsets) - 1, dtype=bool)
+        is_closed[[station for station in map.closed if station < len(is_closed)]] = True
+        keep = ~(is_closed[sources] | is_closed[indices])
+        sources, indices, weights = sources[keep], indices[keep], weights[keep]
+        offsets = np.zeros(len(offsets), dtype=np.int64)
+        np.cumsum(np.bincount(sources, minlength=len(offsets) - 1), out=offsets[1:])
+
+    if reverse:
+        order = np.argsort(indices, kind='stable')
+        counts = np.bincount(indices, minlength=len(offsets) - 1)
+        offsets = np.zeros(len(offsets), dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        indices, weights = sources[order], weights[order]
+
+    graph = CostGraph(offsets, indices, weights)
+    map.cost_graphs[key] = graph
+    return graph
+
+
+def shortest_path_tree(graph, origin_id, targets=None, cutoff=np.inf):
+    """
+     Dijkstra from origin_id over a CostGraph
+     Format of the parameter is:
+        Args:
+            graph (CostGraph): Weighted graph of the map
+            origin_id (int or list): Starting station id (or ids, all of them with cost 0)
+            targets (iterable): If given, the search stops as soon as all of these stations are settled
+            cutoff (float): Stations that cost more than cutoff are not reached
+        Returns:
+            cost (np.array): Cost from origin_id to every station (np.inf if it was not settled)
+            parent (np.array): Previous station of every station in its best route (-1 if none)
+    """
+    offsets, indices, weights = graph.lists()
+    origins = origin_id if isinstance(origin_id, list) else [origin_id]
+    cost = [np.inf] * len(graph)
+    parent = [-1] * len(graph)
+    settled = [False] * len(graph)
+    remaining = None if targets is None else set(targets) - set(origins)
+
+    heap = []
+    for origin in origins:
+        cost[origin] = 0.0
+        heap.append((0.0, origin))
+    while heap and (remaining is None or remaining):
+        g, station = heapq.heappop(heap)
+        if settled[station]:
+            continue                                        # stale entry, the station was already settled
+        settled[station] = True
+        if remaining is not None:
+            remaining.discard(station)
+        for e in range(offsets[station], offsets[station + 1]):
+            neighbour = indices[e]
+            new_cost = g + weights[e]
+            if new_cost < cost[neighbour] and new_cost <= cutoff:
+                cost[neighbour] = new_cost
+                parent[neighbour] = station
+                heapq.heappush(heap, (new_cost, neighbour))
+
+    cost = np.array(cost)
+    if remaining is not None:
+        cost[~np.array(settled)] = np.inf                   # only settled costs are final
+        cost[origins] = 0.0
+    return cost, np.array(parent, dtype=np.int32)
+
+
+def tree_route(parent, origin_id, destination_id):
+    # Route from origin_id to destination_id following the parent array of a shortest path tree
+    route = [destination_id]
+    while route[-1] != origin_id:
+        route.append(int(parent[route[-1]]))
+    route.reverse()
+    return route
+
+
+class RouteMatrix:
+    """
+    Result of route_many.
+        costs[i, j]: cost of the best route from origins[i] to destinations[j] (np.inf if unreachable)
+        route(i, j): that route as a Path (built only when it is asked for), None if unreachable
+    """
+    def __init__(self, origins, destinations, costs, parents):
+        self.origins = origins
+        self.destinations = destinations
+        self.costs = costs
+        self.parents = parents
+
+    def route(self, i, j):
+        if np.isinf(self.costs[i, j]):
+            return None
+        origin, destination = self.origins[i], self.destinations[j]
+        path = Path(tree_route(self.parents[origin], origin, destination))
+        path.g = float(self.costs[i, j])
+        path.update_f()
+        return path
+
+
+def route_many(origins, destinations, map, type_preference=0):
+    """
+     Best routes between every origin and every destination. Queries are grouped by origin and each
+     origin runs a single Dijkstra that stops once all the destinations are settled.
+     Format of the parameter is:
+        Args:
+            origins (list): Starting station ids
+            destinations (list): Final station ids
+            map (object of Map class): All the map information
+            type_preference: INTEGER Value to indicate the preference selected (see calculate_cost)
+        Returns:
+            result (RouteMatrix): costs[i, j] and route(i, j) of every origin i and destination j
+    """
+    graph = cost_graph(map, type_preference)
+    origins, destinations = list(origins), list(destinations)
+    costs = np.full((len(origins), len(destinations)), np.inf)
+    parents = {}
+    rows = {}
+    for i, origin in enumerate(origins):
+        rows.setdefault(origin, []).append(i)
+
+    for origin, origin_rows in rows.items():
+        if origin in map.closed:
+            continue                                    # closed stations have no routes (see Map.close_station)
+        cost, parents[origin] = shortest_path_tree(graph, origin, destinations)
+        costs[origin_rows] = cost[destinations]
+    costs[:, [j for j, destination in enumerate(destinations) if destination in map.closed]] = np.inf
+
+    return RouteMatrix(origins, destinations, costs, parents)
+
+
+def origin_stations(origin, map):
+    # Station ids an isochrone starts from: [origin] for a station id, the closest stations of a coordinate
+    # (none for a closed station, see Map.close_station)
+    if np.ndim(origin) == 0:
+        return [int(origin)] if int(origin) not in map.closed else []
+    return map.station_index().nearest(list(origin))
+
+
+def isochrone(origin, map, type_preference=0, cutoff=np.inf):
+    """
+     Cost of the best route from origin to every station, one Dijkstra that stops at cutoff:
+     the stations reachable within 20 minutes are isochrone(x, map, 1, 20) <= 20, and with at most 2
+     transfers isochrone(x, map, 3, 2) <= 2.
+     Format of the parameter is:
+        Args:
+            origin (int or list): Starting station id, or [x, y] coordinates (the routes start at their closest
+                                  stations, as in coord2station)
+            map (object of Map class): All the map information
+            type_preference: INTEGER Value to indicate the preference selected (see calculate_cost)
+            cutoff (float): Highest cost of interest
+        Returns:
+            cost (np.array): Cost of every station id (np.inf if it costs more than cutoff or it can't be reached)
+    """
+    return shortest_path_tree(cost_graph(map, type_preference), origin_stations(origin, map), cutoff=cutoff)[0]
+
+
+def isochrone_matrix(origins, map, type_preference=0, cutoff=np.inf):
+    """
+     isochrone of many origins at once with NumPy: the (origin, station) pairs whose cost went down are
+     relaxed all together over their connections (Bellman-Ford in min-plus form, with np.minimum.at
+     keeping the cheapest of the costs that reach the same pair) until no cost goes down. Each round is a
+     handful of array operations, whatever the number of origins.
+     Format of the parameter is:
+        Args:
+            origins (list): Starting station ids or [x, y] coordinates (see isochrone)
+            map (object of Map class): All the map information
+            type_preference: INTEGER Value to indicate the preference selected (see calculate_cost)
+            cutoff (float): Highest cost of interest
+        Returns:
+            costs (np.array): costs[i, s] is the cost from origins[i] to station s (np.inf as in isochrone)
+    """
+    graph = cost_graph(map, type_preference)
+    offsets, indices, weights = graph.offsets, graph.indices, graph.weights
+    size = len(graph)
+    costs = np.full(len(origins) * size, np.inf)       # costs[i * size + s], flat for np.minimum.at
+    for i, origin in enumerate(origins):
+        costs[i * size + np.array(origin_stations(origin, map), dtype=np.int64)] = 0.0
+
+    changed = np.flatnonzero(costs == 0.0)
+    while len(changed):
+        stations = changed % size
+        counts = offsets[stations + 1] - offsets[stations]
+        edges = np.repeat(offsets[stations] - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+        pairs = np.repeat(changed - stations, counts) + indices[edges]
+        arriving = np.repeat(costs[changed], counts) + weights[edges]
+        better = (arriving < costs[pairs]) & (arriving <= cutoff)
+        pairs, arriving = pairs[better], arriving[better]
+        np.minimum.at(costs, pairs, arriving)
+        changed = np.unique(pairs)
+    return costs.reshape(len(origins), size)
@@ -0,0 +1,234 @@
+# Long running routing service: the cities are loaded once and queries arrive as newline-delimited JSON.
+#
+# _________________________________________________________________________________________
+# Intel.ligencia Artificial
+# Grau en Enginyeria Informatica
+# Curs 2021 - 2022
+# Universitat Autonoma de Barcelona
+# _________________________________________________________________________________________
+
+from SearchAlgorithm import *
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import argparse
+import asyncio
+import json
+import sys
+
+# Searches between two station ids: (origin_id, destination_id, map, type_preference, **options)
+ALGORITHMS = {
+    'uniform_cost_search': uniform_cost_search,
+    'Astar': Astar_station2station,
+    'breadth_first_search': lambda origin_id, destination_id, map, type_preference, **options: breadth_first_search(origin_id, destination_id, map, **options),
+    'depth_first_search': lambda origin_id, destination_id, map, type_preference, **options: depth_first_search(origin_id, destination_id, map, **options),
+    'bidirectional_uniform_cost_search': bidirectional_uniform_cost_search,
+}
+
+
+# Maps of the cities loaded in this process, {((name, root_folder), ...): {name: Map}}, see load_cities
+city_maps = {}
+
+
+def warm_up(map):
+    # Builds the caches the searches fill the first time they need them (station lists, station index and
+    # cost graphs), so the threads that share the map only read it
+    map.stations.lists()
+    map.station_index()
+    for type_preference in range(4):
+        for reverse in (False, True):
+            cost_graph(map, type_preference, reverse).lists()
+    return map
+
+
+def load_cities(cities):
+    # Maps of cities (a tuple of (name, root_folder)), loaded and warmed up once per process
+    if cities not in city_maps:
+        city_maps[cities] = {name: warm_up(load_map(root_folder)) for name, root_folder in cities}
+    return city_maps[cities]
+
+
+def run_request(cities, request):
+    # Runs the search of a request and returns the answer without the id. A module level function so a
+    # ProcessPoolExecutor can run it too: only cities and the request are sent, each process has its own maps.
+    maps = load_cities(cities)
+    if 'city' in request:
+        map = maps[request['city']]
+    elif len(maps) == 1:
+        map = next(iter(maps.values()))
+    else:
+        raise ValueError("the request has to give a city")
+    algorithm = request.get('algorithm', 'uniform_cost_search')
+    type_preference = request.get('type_preference', 0)
+    options = request.get('options', {})
+    origin, destination = request['origin'], request['destination']
+
+    if algorithm == 'Astar' and isinstance(origin, list) and isinstance(destination, list):
+        path = Astar(origin, destination, map, type_preference, **options)
+    else:
+        if algorithm not in ALGORITHMS:
+            raise ValueError("unknown algorithm: {}".format(algorithm))
+        if isinstance(origin, list):
+            origin = coord2station(origin, map)[0]
+        if isinstance(destination, list):
+            destination = coord2station(destination, map)[0]
+        path = ALGORITHMS[algorithm](origin, destination, map, type_preference, **options)
+
+    if path is None:
+        return {'route': None}
+    return {'route': [int(station) for station in path.route], 'cost': float(path.g)}
+
+
+class RoutingService:
+    """
+    Answers routing requests on the maps of one or more cities, loaded once when it is created.
+
+    Each request is a JSON object, one per line:
+        {"id": 1, "city": "Lyon_smallCity", "algorithm": "uniform_cost_search",
+         "origin": 9, "destination": 3, "type_preference": 1, "deadline": 0.5, "options": {"graph_search": true}}
+    origin and destination are station ids or [x, y] coordinates (snapped with coord2station, and with
+    "algorithm": "Astar" both coordinates go to Astar). city can be left out if only one city is loaded.
+    The answer is {"id": 1, "route": [...], "cost": g}, {"id": 1, "route": null} if there is no route,
+    or {"id": 1, "error": "..."}.
+    {"id": 2, "batch": [request, ...]} runs all the requests concurrently and answers {"id": 2, "results": [...]}.
+
+    Searches run on an executor so the event loop keeps reading requests, at most max_concurrency of
+    them at the same time: a pool of threads that share the maps of the service (loaded with their
+    caches built, see warm_up, so the threads only read them), or with processes=True a pool of
+    processes that load their own copy of the maps (run_request is what they run).
+    A request that passes its deadline (seconds, counted from when its search starts) is answered with
+    an error. Its search can't be interrupted: it keeps its worker until it ends and the result is dropped,
+    and until then new requests wait for a free worker before their deadline starts counting.
+    Usage:
+        >>> service = RoutingService({'Lyon_smallCity': '../CityInformation/Lyon_smallCity/'})
+        >>> asyncio.run(service.serve_tcp('127.0.0.1', 8765))
+    """
+    def __init__(self, cities, max_concurrency=4, executor=None, processes=False):
+        self.cities = tuple(sorted(cities.items()))
+        self.maps = load_cities(self.cities)
+        if executor is None and processes:
+            executor = ProcessPoolExecutor(max_workers=max_concurrency, initializer=load_cities, initargs=(self.cities,))
+        self.executor = executor or ThreadPoolExecutor(max_workers=max_concurrency)
+        self.max_concurrency = max_concurrency
+        self.semaphore = None                               # created inside the running event loop
+
+    def finished(self, future):
+        # The search of a request ended (maybe after its deadline), its worker is free again
+        self.semaphore.release()
+        if not future.cancelled():
+            future.exception()                              # retrieved, so a dropped search that failed isn't logged
+
+    async def handle(self, request):
+        # Answer (a dictionary) of one request or of a batch of requests
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        answer = {'id': request.get('id')} if isinstance(request, dict) else {}
+        try:
+            if 'batch' in request:
+                answer['results'] = await asyncio.gather(*[self.handle(item) for item in request['batch']])
+                return answer
+            await self.semaphore.acquire()                  # released by finished, not by the deadline
+            try:
+                future = asyncio.get_running_loop().run_in_executor(self.executor, run_request, self.cities, request)
+            except BaseException:
+                self.semaphore.release()
+                raise
+            future.add_done_callback(self.finished)
+            answer.update(await asyncio.wait_for(asyncio.shield(future), timeout=request.get('deadline')))
+        except asyncio.TimeoutError:
+            answer['error'] = 'deadline exceeded'
+        except Exception as error:
+            answer['error'] = '{}: {}'.format(type(error).__name__, error)
+        return answer
+
+    async def handle_line(self, line):
+        try:
+            request = json.loads(line)
+        except ValueError as error:
+            return {'id': None, 'error': 'invalid JSON: {}'.format(error)}
+        return await self.handle(request)
+
+    async def serve_connection(self, reader, writer):
+        # Requests of a connection are answered as they finish (match them by id)
+        lock = asyncio.Lock()
+
+        async def answer(line):
+            response = await self.handle_line(line)
+            async with lock:
+                writer.write((json.dumps(response) + '\n').encode())
+                await writer.drain()
+
+        tasks = set()
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            if line.strip():
+                task = asyncio.ensure_future(answer(line))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.gather(*tasks)
+        writer.close()
+
+    async def start_tcp(self, host='127.0.0.1', port=0):
+        # Starts listening (port 0 picks a free port, see server.sockets[0].getsockname())
+        return await asyncio.start_server(self.serve_connection, host, port)
+
+    async def serve_tcp(self, host='127.0.0.1', port=8765):
+        server = await self.start_tcp(host, port)
+        async with server:
+            await server.serve_forever()
+
+    async def serve_stdin(self):
+        # Same protocol on stdin/stdout. Anything else printed goes to stderr so it can't break the answers.
+        output = sys.stdout
+        sys.stdout = sys.stderr
+        try:
+            loop = asyncio.get_running_loop()
+            tasks = []
+            while True:
+                line = await loop.run_in_executor(None, sys.stdin.readline)
+                if not line:
+                    break
+                if line.strip():
+                    async def answer(line=line):
+                        output.write(json.dumps(await self.handle_line(line)) + '\n')
+                        output.flush()
+                    tasks.append(asyncio.ensure_future(answer()))
+            await asyncio.gather(*tasks)
+        finally:
+            sys.stdout = output
+
+
+async def request(host, port, requests):
+    """
+     Small client: sends requests (a list of dictionaries) on one connection and returns the answers
+     in the same order.
+    """
+    reader, writer = await asyncio.open_connection(host, port)
+    for item in requests:
+        writer.write((json.dumps(item) + '\n').encode())
+    await writer.drain()
+    answers = {}
+    for _ in requests:
+        answer = json.loads(await reader.readline())
+        answers[answer.get('id')] = answer
+    writer.close()
+    return [answers.get(item.get('id')) for item in requests]
+
+
+if __name__ == "__main__":
+    # python RoutingService.py --city Lyon_smallCity=../CityInformation/Lyon_smallCity/ --port 8765
+    parser = argparse.ArgumentParser(description='Routing service (newline-delimited JSON)')
+    parser.add_argument('--city', action='append', required=True, help='name=CityInformation folder (can be repeated)')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--stdin', action='store_true', help='read requests from stdin instead of a TCP port')
+    parser.add_argument('--max-concurrency', type=int, default=4)
+    parser.add_argument('--processes', action='store_true', help='run the searches on worker processes instead of threads')
+    args = parser.parse_args()
+
+    service = RoutingService(dict(city.split('=', 1) for city in args.city), args.max_concurrency, processes=args.processes)
+    if args.stdin:
+        asyncio.run(service.serve_stdin())
+    else:
+        asyncio.run(service.serve_tcp(args.host, args.port))
@@ -11,42 +11,47 @@ __group__ = 'DM.10'
 
 from SubwayMap import *
 from utils import *
+from Routing import cost_graph
+from Instrumentation import SearchStats, timed
+import heapq
 import os
 import math
-import copy
+from collections import deque
 
 
-def expand(path: Path, map: Map):
+def expand(path: Path, map: Map, stats=None):
     """
      It expands a SINGLE station and returns the list of class Path.
      Format of the parameter is:
         Args:
             path (object of Path class): Specific path to be expanded
             map (object of Map class):: All the information needed to expand the node
+            stats (SearchStats): Optional counters of the search (see Instrumentation.py)
         Returns:
             path_list (list): List of paths that are connected to the given path.
     """
     station = path.last
     path_list = []
 
-    for k in list(map.connections[station].keys()):     # we only need the keys of the connections (the station ids)
-        new_route = copy.deepcopy(path.route)           # deepcopy just in case
-        new_route.append(k)                             # append the key that has a connection to the last node
-        new_path = Path(new_route)
+    for k in map.neighbours(station):                   # we only need the ids of the connected stations (dict keys or CSR row)
+        new_path = Path(k, parent=path)                 # the new path shares the route of its parent, nothing is copied
         new_path.g = path.g
         new_path.h = path.h
         new_path.update_f()
         path_list.append(new_path)               # add the new path to the path_list (it doesn't check for cycles)
 
+    if stats is not None:
+        stats.expand(path, len(path_list))
     return path_list
 
 
-def remove_cycles(path_list):
+def remove_cycles(path_list, stats=None):
     """
      It removes from path_list the set of paths that include some cycles in their path.
      Format of the parameter is:
         Args:
             path_list (LIST of Path Class): Expanded paths
+            stats (SearchStats): Optional counters of the search (see Instrumentation.py)
         Returns:
             path_list (list): Expanded paths without cycles.
     """
@@ -54,9 +59,11 @@ def remove_cycles(path_list):
     new_path_list = []
 
     for path in path_list:
-        if len(set(path.route)) == len(path.route):     # We check the lenght with a set with the same values (sets can't have duplicate items)
+        if path.simple:                                 # checked against the parent chain when the path was built, O(route length)
             new_path_list.append(path)                  # and we append to the new list without cycles
 
+    if stats is not None:
+        stats.prune_cycles(len(path_list) - len(new_path_list))
     return new_path_list
 
 
@@ -70,10 +77,14 @@ def insert_depth_first_search(expand_paths, list_of_path):
         Returns:
             list_of_path (LIST of Path Class): List of Paths where Expanded Path is inserted
     """
+    if isinstance(list_of_path, deque):                 # O(len(expand_paths)), the frontier is not copied
+        list_of_path.extendleft(reversed(expand_paths))
+        return list_of_path
     return expand_paths + list_of_path                  # insert at the front
 
 
-def depth_first_search(origin_id: int, destination_id: int, map: Map):
+@timed('search')
+def depth_first_search(origin_id: int, destination_id: int, map: Map, graph_search=False, stats=None):
     """
      Depth First Search algorithm
      Format of the parameter is:
@@ -81,23 +92,54 @@ def depth_first_search(origin_id: int, destination_id: int, map: Map):
             origin_id (int): Starting station id
             destination_id (int): Final station id
             map (object of Map class): All the map information
+            graph_search (bool): If True, every station is expanded at most once (global visited set), O(V+E)
+            stats (SearchStats): Optional counters, timers and trace of the search (see Instrumentation.py)
         Returns:
             list_of_path[0] (Path Class): the route that goes from origin_id to destination_id
     """
-    list_of_path = [ Path(origin_id) ]                  # Generates a list for all the paths to search
+    if origin_id in map.closed or destination_id in map.closed:    # closed stations have no routes (see Map.close_station)
+        return None
+    if graph_search:
+        return depth_first_graph_search(origin_id, destination_id, map, stats)
+
+    list_of_path = deque([ Path(origin_id) ])           # Generates a list for all the paths to search
 
-    while (list_of_path != [] and list_of_path[0].last != destination_id):
-        head = list_of_path.pop(0)
-        expand_paths = expand(head, map)
-        expand_paths = remove_cycles(expand_paths)
+    while (list_of_path and list_of_path[0].last != destination_id):
+        head = list_of_path.popleft()
+        expand_paths = expand(head, map, stats)
+        expand_paths = remove_cycles(expand_paths, stats)
         list_of_path = insert_depth_first_search(expand_paths, list_of_path)
-    
-    if (list_of_path != []):
-        return list_of_path[0]
+        if stats is not None:
+            stats.frontier(len(list_of_path))
+
+    if (list_of_path):
+        return list_of_path[0].materialize()
     else:
         return None
 
 
+def depth_first_graph_search(origin_id, destination_id, map, stats=None):
+    # DFS that expands every station at most once (see depth_first_search)
+    list_of_path = deque([ Path(origin_id) ])
+    visited = set()
+
+    while list_of_path:
+        head = list_of_path.popleft()
+        if head.last == destination_id:
+            return head.materialize()
+        if head.last in visited:
+            continue
+        visited.add(head.last)
+        expand_paths = expand(head, map, stats)
+        new_paths = [path for path in expand_paths if path.last not in visited]
+        list_of_path = insert_depth_first_search(new_paths, list_of_path)
+        if stats is not None:
+            stats.prune_redundant(len(expand_paths) - len(new_paths))
+            stats.frontier(len(list_of_path))
+
+    return None
+
+
 def insert_breadth_first_search(expand_paths, list_of_path):
     """
         expand_paths is inserted to the list_of_path according to BREADTH FIRST SEARCH algorithm
@@ -108,10 +150,14 @@ def insert_breadth_first_search(expand_paths, list_of_path):
            Returns:
                list_of_path (LIST of Path Class): List of Paths where Expanded Path is inserted
     """
+    if isinstance(list_of_path, deque):                 # O(len(expand_paths)), the frontier is not copied
+        list_of_path.extend(expand_paths)
+        return list_of_path
     return list_of_path + expand_paths                  # insert at the back
 
 
-def breadth_first_search(origin_id: int, destination_id: int, map: Map):
+@timed('search')
+def breadth_first_search(origin_id: int, destination_id: int, map: Map, graph_search=False, stats=None):
     """
      Breadth First Search algorithm
      Format of the parameter is:
@@ -119,23 +165,115 @@ def breadth_first_search(origin_id: int, destination_id: int, map: Map):
             origin_id (int): Starting station id
             destination_id (int): Final station id
             map (object of Map class): All the map information
+            graph_search (bool): If True, every station is visited at most once (global visited set) and the
+                                 search stops as soon as destination_id is generated, O(V+E)
+            stats (SearchStats): Optional counters, timers and trace of the search (see Instrumentation.py)
         Returns:
             list_of_path[0] (Path Class): The route that goes from origin_id to destination_id
     """
-    list_of_path = [ Path(origin_id) ]
+    if origin_id in map.closed or destination_id in map.closed:    # closed stations have no routes (see Map.close_station)
+        return None
+    if graph_search:
+        return breadth_first_graph_search(origin_id, destination_id, map, stats)
 
-    while (list_of_path != [] and list_of_path[0].last != destination_id):
-        head = list_of_path.pop(0)
-        expand_paths = expand(head, map)
-        expand_paths = remove_cycles(expand_paths)
+    list_of_path = deque([ Path(origin_id) ])
+
+    while (list_of_path and list_of_path[0].last != destination_id):
+        head = list_of_path.popleft()
+        expand_paths = expand(head, map, stats)
+        expand_paths = remove_cycles(expand_paths, stats)
         list_of_path = insert_breadth_first_search(expand_paths, list_of_path)
+        if stats is not None:
+            stats.frontier(len(list_of_path))
 
-    if (list_of_path != []):
-        return list_of_path[0]
+    if (list_of_path):
+        return list_of_path[0].materialize()
     else:
         return None
 
 
+def breadth_first_graph_search(origin_id, destination_id, map, stats=None):
+    # BFS with a global visited set and the goal test when a path is generated (see breadth_first_search)
+    if origin_id == destination_id:
+        return Path(origin_id)
+    list_of_path = deque([ Path(origin_id) ])
+    visited = {origin_id}
+
+    while list_of_path:
+        head = list_of_path.popleft()
+        for path in expand(head, map, stats):
+            if path.last in visited:
+                if stats is not None:
+                    stats.prune_redundant(1)
+                continue
+            if path.last == destination_id:
+                return path.materialize()
+            visited.add(path.last)
+            list_of_path.append(path)
+        if stats is not None:
+            stats.frontier(len(list_of_path))
+
+    return None
+
+
+@timed('search')
+def bidirectional_breadth_first_search(origin_id, destination_id, map, stats=None):
+    """
+     Breadth First Search from both ends at the same time (connections are reversed for the search from
+     destination_id, so one-way connections are handled). A whole level of the smaller frontier is expanded
+     at a time and the best meeting of that level is kept, so the route has the fewest possible connections.
+     Format of the parameter is:
+        Args:
+            origin_id (int): Starting station id
+            destination_id (int): Final station id
+            map (object of Map class): All the map information
+            stats (SearchStats): Optional counters, timers and trace of the search (see Instrumentation.py)
+        Returns:
+            path (Path Class): The route that goes from origin_id to destination_id, g is its number of connections
+    """
+    if origin_id in map.closed or destination_id in map.closed:    # closed stations have no routes (see Map.close_station)
+        return None
+    offsets, indices, _ = cost_graph(map, 0, reverse=True).lists()
+    neighbours = [lambda station: map.neighbours(station),
+                  lambda station: indices[offsets[station]:offsets[station + 1]] if station < len(offsets) - 1 else []]
+    parent = [{origin_id: None}, {destination_id: None}]
+    depth = [{origin_id: 0}, {destination_id: 0}]
+    frontier = [[origin_id], [destination_id]]
+    meeting = origin_id if origin_id == destination_id else None
+
+    while meeting is None and frontier[0] and frontier[1]:
+        side = 0 if len(frontier[0]) <= len(frontier[1]) else 1
+        next_level = []
+        best = math.inf
+        for station in frontier[side]:
+            if stats is not None:
+                stats.expand_station(station, depth[side][station], len(neighbours[side](station)))
+            for neighbour in neighbours[side](station):
+                if neighbour in parent[side]:
+                    continue
+                parent[side][neighbour] = station
+                depth[side][neighbour] = depth[side][station] + 1
+                next_level.append(neighbour)
+                if neighbour in parent[1 - side] and depth[side][neighbour] + depth[1 - side][neighbour] < best:
+                    best, meeting = depth[side][neighbour] + depth[1 - side][neighbour], neighbour
+        frontier[side] = next_level
+        if stats is not None:
+            stats.frontier(len(frontier[0]) + len(frontier[1]))
+
+    if meeting is None:
+        return None
+    route = [meeting]
+    while parent[0][route[-1]] is not None:
+        route.append(parent[0][route[-1]])
+    route.reverse()
+    while parent[1][route[-1]] is not None:
+        route.append(parent[1][route[-1]])
+    path = Path(route)
+    path.g = len(route) - 1
+    path.update_f()
+    return path
+
+
 def calculate_cost(expand_paths, map, type_preference=0):
     """
          Calculate the cost according to type preference
@@ -154,11 +292,20 @@ def calculate_cost(expand_paths, map, type_preference=0):
     if len(expand_paths) < 1:
         return expand_paths
     penultimate = expand_paths[0].penultimate                       # penultimate station is the same in all paths
-    pen_station = map.stations[penultimate]
+    x, y, line, velocity = map.stations.lists()
+
+    if map.csr_offsets is not None and type_preference in (1, 2):
+        # With CSR connections the costs are read from the row of penultimate in the cached cost
+        # graph (map.connections[penultimate] would build a dictionary of the row for every path)
+        offsets, indices, weights = cost_graph(map, type_preference, closed=True).lists()
+        start = offsets[penultimate]
+        row = indices[start:offsets[penultimate + 1]]
+        for path in expand_paths:
+            path.update_g(weights[start + row.index(path.last)])
+        return expand_paths
 
     for path in expand_paths:
         last = path.last
-        last_station = map.stations[last]
 
         if type_preference == 0:                            # - Adjacency
             path.update_g(1)
@@ -166,12 +313,12 @@ def calculate_cost(expand_paths, map, type_preference=0):
             time = map.connections[penultimate][last]
             path.update_g(time)
         elif type_preference == 2:                          # - minimum Distance
-            if not (pen_station["x"] == last_station["x"] and pen_station["y"] == last_station["y"]):
+            if not (x[penultimate] == x[last] and y[penultimate] == y[last]):
                 time = map.connections[penultimate][last]
-                distance = last_station["velocity"]*time
+                distance = velocity[last]*time
                 path.update_g(distance)
         elif type_preference == 3:                          # - minimum Transfers
-            if pen_station["line"] != last_station["line"]:
+            if line[penultimate] != line[last]:
                 path.update_g(1)
         else:
             print("ERROR: invalid type_preference")
@@ -190,6 +337,11 @@ def insert_cost(expand_paths, list_of_path):
                list_of_path (LIST of Path Class): List of Paths where expanded_path is inserted according to cost
     """
 
+    if isinstance(list_of_path, PathHeap):             # heap frontier: O(log n) per path, ties keep insertion order
+        for path in expand_paths:
+            list_of_path.push(path, path.g)
+        return list_of_path
+
     #print("\n\ninsert cost --------------------------------")
 
     #print("list_of_path: ", [ [p.route, p.g] for i, p in enumerate(list_of_path) ])  # this is ordered
@@ -217,38 +369,119 @@ def insert_cost(expand_paths, list_of_path):
     return list_of_path
 
 
-def uniform_cost_search(origin_id, destination_id, map, type_preference=0):
+@timed('search')
+def uniform_cost_search(origin_id, destination_id, map, type_preference=0, graph_search=False, stats=None):
     """
      Uniform Cost Search algorithm
+     If the map has cost tables (map.cost_tables, see CostTables.py) the route is read from them and
+     nothing is searched: graph_search is ignored and stats only gets the search time and the result
+     (no expansions are counted).
      Format of the parameter is:
         Args:
             origin_id (int): Starting station id)
             destination_id (int): Final station id
             map (object of Map class): All the map information
+            graph_search (bool): If True, keep the best g of every station and a closed set
+                                 instead of pruning paths (see best_first_graph_search)
+            stats (SearchStats): Optional counters, timers and trace of the search (see Instrumentation.py)
         Returns:
             list_of_path[0] (Path Class): The route that goes from origin_id to destination_id
     """
-    list_of_path = [ Path(origin_id) ]
-
-
-    while (list_of_path != [] and list_of_path[0].last != destination_id):
-        head = list_of_path.pop(0)
-        expand_paths = expand(head, map)
-        expand_paths = remove_cycles(expand_paths)
-        #print("before calculate cost: ", [ [len(p.route), p.g] for p in expand_paths ])
+    if origin_id in map.closed or destination_id in map.closed:    # closed stations have no routes (see Map.close_station)
+        return None
+    if map.cost_tables is not None:                     # precomputed all-pairs tables, no search needed
+        return map.cost_tables.path(origin_id, destination_id, map, type_preference)
+    if graph_search:
+        return best_first_graph_search(origin_id, destination_id, map, type_preference, heuristics=False, stats=stats)
+
+    list_of_path = PathHeap()                           # ordered by g, popping the cheapest path is O(log n)
+    list_of_path.push(Path(origin_id), 0)
+
+    while (len(list_of_path) > 0 and list_of_path.peek().last != destination_id):
+        head = list_of_path.pop()
+        expand_paths = expand(head, map, stats)
+        expand_paths = remove_cycles(expand_paths, stats)
         expand_paths = calculate_cost(expand_paths, map, type_preference)
-        #print("after calculate cost: ", [ [len(p.route), p.g] for p in expand_paths ])
-        #print("before insert_cost: ", [ [len(p.route), p.g] for p in list_of_path ])
         list_of_path = insert_cost(expand_paths, list_of_path)
-        #print("after insert_cost: ", [ [len(p.route), p.g] for p in list_of_path ])
+        if stats is not None:
+            stats.frontier(len(list_of_path))
 
-    if (list_of_path != []):
-        return list_of_path[0]
+    if (len(list_of_path) > 0):
+        return list_of_path.peek().materialize()
     else:
         return None
 
 
-def calculate_heuristics(expand_paths, map, destination_id, type_preference=0):
+@timed('search')
+def bidirectional_uniform_cost_search(origin_id, destination_id, map, type_preference=0, stats=None):
+    """
+     Uniform Cost Search from both ends at the same time (Dijkstra on the map and on the map with every
+     connection reversed). mu is the cost of the best route seen through a station reached by both sides;
+     the search stops when the cheapest entries of the two frontiers add up to mu or more, since no route
+     left can be cheaper.
+     Format of the parameter is:
+        Args:
+            origin_id (int): Starting station id
+            destination_id (int): Final station id
+            map (object of Map class): All the map information
+            type_preference: INTEGER Value to indicate the preference selected (see calculate_cost)
+            stats (SearchStats): Optional counters, timers and trace of the search (see Instrumentation.py)
+        Returns:
+            path (Path Class): The route that goes from origin_id to destination_id with its g
+    """
+    if origin_id in map.closed or destination_id in map.closed:    # closed stations have no routes (see Map.close_station)
+        return None
+    graphs = [cost_graph(map, type_preference).lists(), cost_graph(map, type_preference, reverse=True).lists()]
+    cost = [{origin_id: 0.0}, {destination_id: 0.0}]
+    parent = [{origin_id: None}, {destination_id: None}]    # station -> (previous station, cost of the connection)
+    heaps = [[(0.0, origin_id)], [(0.0, destination_id)]]
+    settled = [set(), set()]
+    mu, meeting = (0.0, origin_id) if origin_id == destination_id else (math.inf, None)
+
+    while heaps[0] and heaps[1] and heaps[0][0][0] + heaps[1][0][0] < mu:
+        side = 0 if heaps[0][0][0] <= heaps[1][0][0] else 1
+        g, station = heapq.heappop(heaps[side])
+        if station in settled[side]:
+            if stats is not None:
+                stats.prune_redundant(1)                    # stale entry, the station was settled with a lower cost
+            continue
+        settled[side].add(station)
+        offsets, indices, weights = graphs[side]
+        if stats is not None:
+            stats.expand_station(station, g, offsets[station + 1] - offsets[station])
+            stats.frontier(len(heaps[0]) + len(heaps[1]))
+        for e in range(offsets[station], offsets[station + 1]):
+            neighbour, new_cost = indices[e], g + weights[e]
+            if new_cost < cost[side].get(neighbour, math.inf):
+                cost[side][neighbour] = new_cost
+                parent[side][neighbour] = (station, weights[e])
+                heapq.heappush(heaps[side], (new_cost, neighbour))
+                if neighbour in cost[1 - side] and new_cost + cost[1 - side][neighbour] < mu:
+                    mu, meeting = new_cost + cost[1 - side][neighbour], neighbour
+
+    if meeting is None:
+        return None
+    stations, weights = [meeting], []
+    while parent[0][stations[-1]] is not None:
+        previous, weight = parent[0][stations[-1]]
+        stations.append(previous)
+        weights.append(weight)
+    stations.reverse()
+    weights.reverse()
+    while parent[1][stations[-1]] is not None:
+        following, weight = parent[1][stations[-1]]
+        stations.append(following)
+        weights.append(weight)
+
+    path = Path(stations[0])
+    for station, weight in zip(stations[1:], weights):      # g is added in route order, as uniform_cost_search does
+        path.add_route(station)
+        path.update_g(weight)
+    path.update_f()
+    return path
+
+
+def calculate_heuristics(expand_paths, map, destination_id, type_preference=0, landmarks=None):
     """
      Calculate and UPDATE the heuristics of a path according to type preference
      WARNING: In calculate_cost, we didn't update the cost of the path inside the function
@@ -262,6 +495,7 @@ def calculate_heuristics(expand_paths, map, destination_id, type_preference=0):
                             1 - minimum Time
                             2 - minimum Distance
                             3 - minimum Transfers
+            landmarks (Landmarks): If given, the landmark (ALT) bound is used instead (see Landmarks.py)
         Returns:
             expand_paths (LIST of Path Class): Expanded paths with updated heuristics
     """
@@ -269,11 +503,17 @@ def calculate_heuristics(expand_paths, map, destination_id, type_preference=0):
     if len(expand_paths) < 1:
         return expand_paths
 
-    destination = map.stations[destination_id]
+    if landmarks is not None:                               # one vectorized estimate for all the paths
+        if landmarks.type_preference != type_preference:
+            raise ValueError("landmarks were built for type_preference {}".format(landmarks.type_preference))
+        for path, h in zip(expand_paths, landmarks.estimate([path.last for path in expand_paths], destination_id).tolist()):
+            path.update_h(h)
+        return expand_paths
+
+    x, y, line, velocity = map.stations.lists()
 
     for path in expand_paths:
         last = path.last
-        station = map.stations[last]
 
         if type_preference == 0:                            # - Adjacency
             if destination_id in map.connections[last].keys():
@@ -285,17 +525,17 @@ def calculate_heuristics(expand_paths, map, destination_id, type_preference=0):
 
         elif type_preference == 1:                          # - minimum Time
             time_constant = 5.960756012864304/1.8544574262244504                        # this constant is needed to pass the test
-            distance = euclidean_dist([station["x"], station["y"]], [destination["x"], destination["y"]])
-            time = distance / max(destination["velocity"], station["velocity"])
+            distance = euclidean_dist([x[last], y[last]], [x[destination_id], y[destination_id]])
+            time = distance / max(velocity[destination_id], velocity[last])
             path.update_h(time/time_constant)
 
         elif type_preference == 2:                          # - minimum Distance
-            if not (station["x"] == destination["x"] and station["y"] == destination["y"]):
-                distance = euclidean_dist([station["x"], station["y"]], [destination["x"], destination["y"]])
+            if not (x[last] == x[destination_id] and y[last] == y[destination_id]):
+                distance = euclidean_dist([x[last], y[last]], [x[destination_id], y[destination_id]])
                 path.update_h(distance)
 
         elif type_preference == 3:                          # - minimum Transfers
-            if station["line"] != destination["line"]:
+            if line[last] != line[destination_id]:
                 path.update_h(1)
             else:
                 path.update_h(0)
@@ -322,7 +562,7 @@ def update_f(expand_paths):
     return expand_paths
 
 
-def remove_redundant_paths(expand_paths, list_of_path, visited_stations_cost):
+def remove_redundant_paths(expand_paths, list_of_path, visited_stations_cost, stats=None):
     """
       It removes the Redundant Paths. They are not optimal solution!
       If a station is visited and have a lower g in this moment, we should remove this path.
@@ -331,11 +571,13 @@ def remove_redundant_paths(expand_paths, list_of_path, visited_stations_cost):
              expand_paths (LIST of Path Class): Expanded paths
              list_of_path (LIST of Path Class): All the paths to be expanded
              visited_stations_cost (dict): All visited stations cost
+             stats (SearchStats): Optional counters of the search (see Instrumentation.py)
          Returns:
              new_paths (LIST of Path Class): Expanded paths without redundant paths
              list_of_path (LIST of Path Class): list_of_path without redundant paths
     """
     new_paths = []
+    frontier_size = len(list_of_path)
 
     for path in expand_paths:
         if path.last in visited_stations_cost:
@@ -343,12 +585,14 @@ def remove_redundant_paths(expand_paths, list_of_path, visited_stations_cost):
                 new_paths.append(path)
                 visited_stations_cost[path.last] = path.g
                 for p in list(list_of_path):                        # delete all paths that get to the node in an inefficient way
-                    if path.last in p.route:
+                    if p.contains(path.last):                       # p goes through path.last (the route is not built)
                         list_of_path.remove(p)
         else:
             new_paths.append(path)                                  # we found a new node so we add the current cost to the dictionary
             visited_stations_cost[path.last] = path.g
 
+    if stats is not None:
+        stats.prune_redundant(len(expand_paths) - len(new_paths) + frontier_size - len(list_of_path))
     return new_paths, list_of_path, visited_stations_cost
 
 
@@ -363,6 +607,11 @@ def insert_cost_f(expand_paths, list_of_path):
                list_of_path (LIST of Path Class): List of Paths where expanded_path is inserted according to f
     """
 
+    if isinstance(list_of_path, PathHeap):             # heap frontier: O(log n) per path, ties keep insertion order
+        for path in expand_paths:
+            list_of_path.push(path, path.f)
+        return list_of_path
+
     if len(list_of_path) == 0:                          # if list_of_path is empty we put the first value from expand_paths into list_of_path and remove it
         list_of_path = [expand_paths.pop(0)]
 
@@ -380,6 +629,60 @@ def insert_cost_f(expand_paths, list_of_path):
     return list_of_path
 
 
+@timed('search')
+def best_first_graph_search(origin_id, destination_id, map, type_preference=0, heuristics=False, landmarks=None, stats=None):
+    """
+     Graph search version of uniform_cost_search (heuristics=False) and A* (heuristics=True).
+     Instead of remove_redundant_paths, which scans the whole frontier, it keeps the best g found for
+     every station: a new path is only pushed if it improves it, and popped paths that are no longer
+     the best way to their station (or whose station is already closed) are discarded when they come
+     out of the heap. Pruning is O(1) per neighbour and the cost of the result is the same.
+     Format of the parameter is:
+        Args:
+            origin_id (int): Starting station id
+            destination_id (int): Final station id
+            map (object of Map class): All the map information
+            type_preference: INTEGER Value to indicate the preference selected (see calculate_cost)
+            heuristics (bool): Order the frontier by f (A*) instead of g (UCS)
+            landmarks (Landmarks): Optional landmark heuristic (see calculate_heuristics)
+            stats (SearchStats): Optional counters, timers and trace of the search (see Instrumentation.py)
+        Returns:
+            path (Path Class): The route that goes from origin_id to destination_id
+    """
+    if origin_id in map.closed or destination_id in map.closed:    # closed stations have no routes (see Map.close_station)
+        return None
+    list_of_path = PathHeap()
+    list_of_path.push(Path(origin_id), 0)
+    best_g = {origin_id: 0}
+    closed = set()
+
+    while len(list_of_path) > 0:
+        head = list_of_path.pop()
+        if head.last in closed or head.g > best_g[head.last]:
+            if stats is not None:
+                stats.prune_redundant(1)
+            continue                                        # stale entry, a better path to this station was found
+        if head.last == destination_id:
+            return head.materialize()
+        closed.add(head.last)
+
+        expand_paths = calculate_cost(expand(head, map, stats), map, type_preference)
+        if heuristics:
+            expand_paths = calculate_heuristics(expand_paths, map, destination_id, type_preference, landmarks)
+        for path in expand_paths:
+            if path.g < best_g.get(path.last, math.inf):
+                best_g[path.last] = path.g
+                closed.discard(path.last)                   # reopened (only happens if h is not consistent)
+                path.update_f()
+                list_of_path.push(path, path.f if heuristics else path.g)
+            elif stats is not None:
+                stats.prune_redundant(1)
+        if stats is not None:
+            stats.frontier(len(list_of_path))
+
+    return None
+
+
 def coord2station(coord, map : Map):
     """
         From coordinates, it searches the closest station.
@@ -390,21 +693,58 @@ def coord2station(coord, map : Map):
         Returns:
             possible_origins (list): List of the Indexes of stations, which corresponds to the closest station
     """
-    possible_origins = []
-    closest_distance = INF
+    return map.station_index().nearest(coord)          # grid over the stations, ties in the order of map.stations
 
-    for k, v in map.stations.items():
-        distance = euclidean_dist([v["x"], v["y"]], coord)
-        if ( distance == closest_distance ):
-            possible_origins.append(k)
-        elif ( distance < closest_distance ):
-            possible_origins = [ k ]
-            closest_distance = distance
 
-    return possible_origins
+@timed('search')
+def Astar_station2station(origin_id, destination_id, map, type_preference=0, landmarks=None, graph_search=False, stats=None):
+    """
+     A* Search algorithm between two stations
+     If the map has cost tables (map.cost_tables, see CostTables.py) the route is read from them and
+     nothing is searched: graph_search and landmarks are ignored and stats only gets the search time
+     and the result (no expansions are counted).
+     Format of the parameter is:
+        Args:
+            origin_id (int): Starting station id
+            destination_id (int): Final station id
+            map (object of Map class): All the map information
+            type_preference: INTEGER Value to indicate the preference selected (see Astar)
+            landmarks (Landmarks): Optional landmark heuristic (see calculate_heuristics)
+            graph_search (bool): If True, use best_first_graph_search instead of remove_redundant_paths
+            stats (SearchStats): Optional counters, timers and trace of the search (see Instrumentation.py)
+        Returns:
+            list_of_path[0] (Path Class): The route that goes from origin_id to destination_id
+    """
+    if origin_id in map.closed or destination_id in map.closed:    # closed stations have no routes (see Map.close_station)
+        return None
+    if map.cost_tables is not None:                     # precomputed all-pairs tables, no search needed
+        return map.cost_tables.path(origin_id, destination_id, map, type_preference)
+    if graph_search:
+        return best_first_graph_search(origin_id, destination_id, map, type_preference, heuristics=True, landmarks=landmarks, stats=stats)
+
+    list_of_path = PathHeap()                           # ordered by f, popping the best path is O(log n)
+    list_of_path.push(Path(origin_id), 0)
+    visited_stations_cost = {}
+    visited_stations_cost[origin_id] = 0
+
+    while (len(list_of_path) > 0 and list_of_path.peek().last != destination_id):
+        head = list_of_path.pop()
+        expand_paths = expand(head, map, stats)
+        expand_paths = remove_cycles(expand_paths, stats)
+        expand_paths = calculate_cost(expand_paths, map, type_preference)
+        expand_paths = calculate_heuristics(expand_paths, map, destination_id, type_preference, landmarks)
+        expand_paths = update_f(expand_paths)
+        expand_paths, list_of_path, visited_stations_cost = remove_redundant_paths(expand_paths, list_of_path, visited_stations_cost, stats)
+        list_of_path = insert_cost_f(expand_paths, list_of_path)
+        if stats is not None:
+            stats.frontier(len(list_of_path))
+    if (len(list_of_path) > 0):
+        return list_of_path.peek().materialize()
+    else:
+        return None
 
 
-def Astar(origin_coor, dest_coor, map, type_preference=0):
+def Astar(origin_coor, dest_coor, map, type_preference=0, landmarks=None, graph_search=False, stats=None):
     """
      A* Search algorithm
      Format of the parameter is:
@@ -417,40 +757,41 @@ def Astar(origin_coor, dest_coor, map, type_preference=0):
                             1 - minimum Time
                             2 - minimum Distance
                             3 - minimum Transfers
+            landmarks (Landmarks): Optional landmark heuristic (see calculate_heuristics)
+            graph_search (bool): If True, use best_first_graph_search instead of remove_redundant_paths
+            stats (SearchStats): Optional counters, timers ('coord2station' and 'search') and trace of the search
         Returns:
             list_of_path[0] (Path Class): The route that goes from origin_id to destination_id
     """
-    def Astar_station2station(origin_id, destination_id, map, type_preference):
-        list_of_path = [ Path(origin_id) ]
-        visited_stations_cost = {}
-        visited_stations_cost[origin_id] = 0
-
-        while (list_of_path != [] and list_of_path[0].last != destination_id):
-            head = list_of_path.pop(0)
-            print("Working on: {}, \t Cost: {}".format(head.route, head.g))
-            expand_paths = expand(head, map)
-            expand_paths = remove_cycles(expand_paths)
-            expand_paths = calculate_cost(expand_paths, map, type_preference)
-            expand_paths = calculate_heuristics(expand_paths, map, destination_id, type_preference)
-            expand_paths = update_f(expand_paths)
-            expand_paths, list_of_path, visited_stations_cost = remove_redundant_paths(expand_paths, list_of_path, visited_stations_cost)
-            list_of_path = insert_cost_f(expand_paths, list_of_path)
-        if (list_of_path != []):
-            return list_of_path[0]
-        else:
-            return None
+    if stats is None:
+        possible_dest = coord2station(dest_coor, map)
+        possible_origins = coord2station(origin_coor, map)[:1]      # use only the first origin because if not the tests fail
+    else:
+        with stats.phase('coord2station'):
+            possible_dest = coord2station(dest_coor, map)
+            possible_origins = coord2station(origin_coor, map)[:1]
 
-    possible_dest = coord2station(dest_coor, map)
-    possible_origins = coord2station(origin_coor, map)[:1]          # use only the first origin because if not the tests fail
+    return Astar_stations(possible_origins, possible_dest, map, type_preference, landmarks, graph_search, stats=stats)
 
-    print("origins: ", possible_origins)
 
+@timed('search')
+def Astar_stations(possible_origins, possible_dest, map, type_preference=0, landmarks=None, graph_search=False, stats=None):
+    """
+     Best A* route between any of the possible origins and any of the possible destinations
+     (the stations coord2station gives for the coordinates of Astar)
+     Format of the parameter is:
+        Args:
+            possible_origins (list): Starting station ids
+            possible_dest (list): Final station ids
+            map, type_preference, landmarks, graph_search, stats: see Astar
+        Returns:
+            best_route (Path Class): The cheapest of the routes, with h = 0
+    """
     best_routes = []
     for origin in possible_origins:
         for destination in possible_dest:
-            best_route = Astar_station2station(origin, destination, map, type_preference)
+            best_route = Astar_station2station(origin, destination, map, type_preference, landmarks, graph_search, stats=stats)
             best_routes.append(best_route)
-    print_list_of_path_with_cost(best_routes)
 
     best_route = [ route for route in best_routes if route is not None ][0]
     for route in [ route for route in best_routes if route is not None ]:
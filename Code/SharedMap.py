@@ -0,0 +1,123 @@
+# A Map exported to shared memory as flat arrays, so many worker processes can use one copy of it.
+#
+# _________________________________________________________________________________________
+# Intel.ligencia Artificial
+# Grau en Enginyeria Informatica
+# Curs 2021 - 2022
+# Universitat Autonoma de Barcelona
+# _________________________________________________________________________________________
+
+from SubwayMap import *
+from multiprocessing import shared_memory
+import sys
+import numpy as np
+
+
+def map_arrays(map):
+    """
+    Flat arrays with all the information of a Map:
+        ids: station ids in the order of map.stations
+        x, y, line, velocity: indexed by station id
+        names, name_offsets: utf-8 names, the name of the i-th station of ids is names[name_offsets[i]:name_offsets[i+1]]
+        velocities: velocity of every line (line l is velocities[l - 1])
+        csr_offsets, csr_indices, csr_weights: connections (see Map.build_csr)
+    """
+    offsets, indices, weights = map.csr_arrays()
+    size = len(offsets) - 1
+    stations = map.stations
+    ids = np.array(stations.ids, dtype=np.int64)
+    x = np.zeros(size)
+    y = np.zeros(size)
+    line = np.zeros(size, dtype=np.int64)
+    velocity = np.zeros(size)
+    x[ids], y[ids], line[ids], velocity[ids] = stations.x[ids], stations.y[ids], stations.line[ids], stations.velocity[ids]
+    names = [stations.name[k].encode('utf-8') for k in stations.ids]
+    name_offsets = np.zeros(len(names) + 1, dtype=np.int64)
+    np.cumsum([len(name) for name in names], out=name_offsets[1:])
+    velocities = np.array([getattr(map, 'velocity', {}).get(l + 1, 0) for l in range(len(getattr(map, 'velocity', {})))], dtype=np.float64)
+
+    return {'ids': ids, 'x': x, 'y': y, 'line': line, 'velocity': velocity,
+            'names': np.frombuffer(b''.join(names), dtype=np.uint8), 'name_offsets': name_offsets,
+            'velocities': velocities,
+            'csr_offsets': np.asarray(offsets, dtype=np.int64),
+            'csr_indices': np.asarray(indices, dtype=np.int32),
+            'csr_weights': np.asarray(weights, dtype=np.float64)}
+
+
+class SharedMap:
+    """
+    Owner of the shared memory block with a Map (see map_arrays). self.handle is a small picklable
+    dictionary that workers give to attach_map to get a read-only view of the same memory.
+    Usage:
+        >>> with SharedMap(map) as shared:
+        ...     view = attach_map(shared.handle)          # in any process
+    """
+    def __init__(self, map):
+        arrays = map_arrays(map)
+        layout = {}
+        position = 0
+        for name, array in arrays.items():
+            layout[name] = (position, array.dtype.str, array.shape)
+            position += (array.nbytes + 7) // 8 * 8     # keep every array 8 byte aligned
+        self.shm = shared_memory.SharedMemory(create=True, size=max(position, 1))
+        for name, array in arrays.items():
+            offset, dtype, shape = layout[name]
+            np.ndarray(shape, dtype=dtype, buffer=self.shm.buf, offset=offset)[...] = array
+        self.handle = {'name': self.shm.name, 'layout': layout}
+
+    def close(self):
+        self.shm.close()
+        self.shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def station_table(arrays):
+    # StationTable over the arrays of map_arrays (x, y, line and velocity are not copied, the ids and names are Python lists)
+    names = bytes(arrays['names'])
+    offsets = arrays['name_offsets'].tolist()
+    return StationTable.from_arrays(arrays['ids'].tolist(), [names[offsets[i]:offsets[i + 1]].decode('utf-8') for i in range(len(offsets) - 1)],
+                                    arrays['line'], arrays['x'], arrays['y'], arrays['velocity'])
+
+
+class SharedMapView(Map):
+    """
+    Read-only Map over the arrays of a SharedMap, so it can be given to any search function. Modifying it
+    raises TypeError. The x, y, line, velocity and CSR arrays read the shared memory, but every worker
+    keeps its own Python copies of what the searches index one element at a time, which is several times
+    faster than indexing NumPy arrays:
+        - the station ids and the decoded names (built when the view is attached)
+        - map.stations.lists(), the first time a search calls calculate_cost or calculate_heuristics
+        - cost_graph(view, ...) and its lists() for every type_preference used (see Routing.py)
+    With 100000 stations (SyntheticCity) that is about 11 MB and 0.7 s to attach, 11 MB and 0.3 s for
+    the station lists and 22 MB and 0.5 s per cost graph, against 9 MB of shared memory.
+    """
+    def __init__(self, handle):
+        super().__init__()
+        if sys.version_info >= (3, 13):
+            self.shm = shared_memory.SharedMemory(name=handle['name'], track=False)
+        else:
+            self.shm = shared_memory.SharedMemory(name=handle['name'])
+        self.arrays = {}
+        for name, (offset, dtype, shape) in handle['layout'].items():
+            array = np.ndarray(shape, dtype=dtype, buffer=self.shm.buf, offset=offset)
+            array.flags.writeable = False
+            self.arrays[name] = array
+        self.stations = station_table(self.arrays)
+        self.connections = CSRConnections(self.arrays['csr_offsets'], self.arrays['csr_indices'], self.arrays['csr_weights'])
+        self.velocity = {l + 1: v for l, v in enumerate(self.arrays['velocities'].tolist())}
+        self.add_csr(self.arrays['csr_offsets'], self.arrays['csr_indices'], self.arrays['csr_weights'])
+
+    def read_only(self, *args):
+        raise TypeError("SharedMapView is read-only")
+
+    add_station = add_connection = add_velocity = combine_dicts = read_only
+    close_station = reopen_station = update_connection = read_only
+
+
+def attach_map(handle):
+    return SharedMapView(handle)
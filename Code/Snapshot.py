@@ -0,0 +1,73 @@
+# Binary snapshot of a fully built Map (stations, velocities and connections) for fast start-up.
+#
+# _________________________________________________________________________________________
+# Intel.ligencia Artificial
+# Grau en Enginyeria Informatica
+# Curs 2021 - 2022
+# Universitat Autonoma de Barcelona
+# _________________________________________________________________________________________
+
+from SubwayMap import *
+from utils import *
+from SharedMap import map_arrays, station_table
+import argparse
+import hashlib
+import numpy as np
+
+# Bump it when the arrays stored in a snapshot change
+SNAPSHOT_VERSION = 1
+
+
+def arrays_checksum(arrays):
+    # sha256 of the names, types, shapes and contents of the arrays
+    digest = hashlib.sha256()
+    for name in sorted(arrays):
+        array = np.ascontiguousarray(arrays[name])
+        digest.update('{}:{}:{}'.format(name, array.dtype.str, array.shape).encode())
+        digest.update(array.tobytes())
+    return digest.hexdigest()
+
+
+def write_snapshot(map, filename):
+    """
+     Writes the map as an uncompressed .npz with the arrays of map_arrays (see SharedMap.py),
+     a format version and a checksum of the arrays.
+    """
+    arrays = map_arrays(map)
+    np.savez(filename, format_version=SNAPSHOT_VERSION, checksum=arrays_checksum(arrays), **arrays)
+
+
+def read_snapshot(filename, verify=True):
+    """
+     Builds a Map from a snapshot written by write_snapshot
+     Format of the parameter is:
+        Args:
+            filename (str): The snapshot file
+            verify (bool): Check the checksum of the arrays
+        Returns:
+            map (object of Map class): The map, with its connections as CSR arrays (CSRConnections)
+    """
+    with np.load(filename) as data:
+        if 'format_version' not in data.files or int(data['format_version']) != SNAPSHOT_VERSION:
+            raise ValueError('{} is not a version {} map snapshot'.format(filename, SNAPSHOT_VERSION))
+        arrays = {name: data[name] for name in data.files if name not in ('format_version', 'checksum')}
+        if verify and arrays_checksum(arrays) != str(data['checksum']):
+            raise ValueError('{} is corrupted (checksum mismatch)'.format(filename))
+
+    map = Map()
+    map.stations = station_table(arrays)
+    map.velocity = {l + 1: v for l, v in enumerate(arrays['velocities'].tolist())}
+    map.add_connection(CSRConnections(arrays['csr_offsets'], arrays['csr_indices'], arrays['csr_weights']))
+    return map
+
+
+if __name__ == "__main__":
+    # python Snapshot.py ../CityInformation/Lyon_bigCity/ [output.npz]
+    parser = argparse.ArgumentParser(description='Writes the binary snapshot of a CityInformation/<city> folder')
+    parser.add_argument('root_folder')
+    parser.add_argument('output', nargs='?', help='snapshot file (root_folder/Map.npz by default)')
+    args = parser.parse_args()
+
+    output = args.output or os.path.join(args.root_folder, 'Map.npz')
+    write_snapshot(load_map(args.root_folder), output)
+    print('snapshot written to {}'.format(output))
@@ -0,0 +1,158 @@
+# Spatial index over the station coordinates of a Map (nearest, k-nearest and radius queries).
+#
+# _________________________________________________________________________________________
+# Intel.ligencia Artificial
+# Grau en Enginyeria Informatica
+# Curs 2021 - 2022
+# Universitat Autonoma de Barcelona
+# _________________________________________________________________________________________
+
+import numpy as np
+
+
+class StationIndex:
+    """
+    Uniform grid over the x/y coordinates of the stations, built once per Map (see Map.station_index).
+
+    Distances are the same euclidean distances coord2station used to compute, and stations at
+    the same distance are returned in the order of map.stations, so nearest() keeps the tie
+    semantics of the old linear scan.
+    Usage:
+        >>> index = StationIndex(map.stations)
+        >>> index.nearest([105, 205])            # every station at the minimum distance
+        >>> index.k_nearest([105, 205], 3)
+        >>> index.radius([105, 205], 50)
+        >>> index.nearest_many([[105, 205], [10, 11]])
+    """
+    # above this number of stations nearest_many() queries the grid one coordinate at a time
+    # instead of computing the full distance matrix
+    BRUTE_FORCE_STATIONS = 4096
+    # number of distances computed at once by nearest_many()
+    CHUNK_SIZE = 1 << 20
+
+    def __init__(self, stations, closed=()):
+        # closed: station ids left out of the index (see Map.close_station)
+        items = [(k, v) for k, v in stations.items() if k not in closed]
+        self.ids = np.array([k for k, _ in items], dtype=np.int64)
+        self.x = np.array([v["x"] for _, v in items], dtype=np.float64)
+        self.y = np.array([v["y"] for _, v in items], dtype=np.float64)
+
+        if len(self.ids) == 0:
+            self.min_x = self.min_y = 0.0
+            self.cell = 1.0
+            self.nx = self.ny = 1
+        else:
+            self.min_x, self.min_y = self.x.min(), self.y.min()
+            width = max(self.x.max() - self.min_x, 1.0)
+            height = max(self.y.max() - self.min_y, 1.0)
+            self.cell = max(np.sqrt(width * height * 2 / len(self.ids)), 1e-9)   # around two stations per cell
+            self.nx = int(width // self.cell) + 1
+            self.ny = int(height // self.cell) + 1
+
+        # stations sorted by cell, the stations of cell c are order[cell_start[c]:cell_start[c + 1]]
+        cells = self.cell_of(self.x, self.y)
+        self.order = np.argsort(cells, kind='stable')
+        self.cell_start = np.searchsorted(cells[self.order], np.arange(self.nx * self.ny + 1))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def cell_of(self, x, y):
+        cx = np.clip(((np.asarray(x) - self.min_x) // self.cell).astype(np.int64), 0, self.nx - 1)
+        cy = np.clip(((np.asarray(y) - self.min_y) // self.cell).astype(np.int64), 0, self.ny - 1)
+        return cx * self.ny + cy
+
+    def distances(self, coord, positions):
+        dx = self.x[positions] - coord[0]
+        dy = self.y[positions] - coord[1]
+        return np.sqrt(dx * dx + dy * dy)
+
+    def ring(self, cx, cy, r):
+        # positions (in station order) of the stations in the cells at Chebyshev distance r of (cx, cy)
+        if r == 0:
+            cells = [(cx, cy)]
+        else:
+            cells = [(i, cy - r) for i in range(cx - r, cx + r + 1)] + [(i, cy + r) for i in range(cx - r, cx + r + 1)]
+            cells += [(cx - r, j) for j in range(cy - r + 1, cy + r)] + [(cx + r, j) for j in range(cy - r + 1, cy + r)]
+        slices = [self.order[self.cell_start[i * self.ny + j]:self.cell_start[i * self.ny + j + 1]]
+                  for i, j in cells if 0 <= i < self.nx and 0 <= j < self.ny]
+        return np.concatenate(slices) if slices else np.empty(0, dtype=np.int64)
+
+    def ring_bound(self, coord, cx, cy, r):
+        # lower bound of the distance from coord to any station in a ring >= r
+        if r == 0:
+            return 0.0
+        left = self.min_x + (cx - r + 1) * self.cell
+        right = self.min_x + (cx + r) * self.cell
+        bottom = self.min_y + (cy - r + 1) * self.cell
+        top = self.min_y + (cy + r) * self.cell
+        return max(0.0, min(coord[0] - left, right - coord[0], coord[1] - bottom, top - coord[1]))
+
+    def search(self, coord, done):
+        """
+        Visits the rings around coord until done(candidates, distances, bound) is True, where bound is
+        a lower bound of the distance of any station not seen yet. Returns all the candidates seen so far
+        sorted by (distance, station order).
+        """
+        cell = int(self.cell_of(coord[0], coord[1]))
+        cx, cy = divmod(cell, self.ny)
+        positions, distances = [], []
+        max_ring = max(cx, self.nx - 1 - cx, cy, self.ny - 1 - cy)
+        r = 0
+        while True:
+            found = self.ring(cx, cy, r)
+            if len(found):
+                positions.append(found)
+                distances.append(self.distances(coord, found))
+            r += 1
+            if r > max_ring:
+                break
+            if positions:
+                bound = self.ring_bound(coord, cx, cy, r)
+                if done(np.concatenate(distances), bound):
+                    break
+
+        if not positions:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        positions = np.concatenate(positions)
+        distances = np.concatenate(distances)
+        sort = np.lexsort((positions, distances))
+        return positions[sort], distances[sort]
+
+    def nearest(self, coord):
+        # ids of every station at the minimum distance of coord (in the order of map.stations)
+        positions, distances = self.search(coord, lambda distances, bound: distances.min() < bound)
+        if len(positions) == 0:
+            return []
+        return self.ids[positions[distances == distances[0]]].tolist()
+
+    def k_nearest(self, coord, k):
+        # ids of the k closest stations, ties broken by the order of map.stations
+        positions, distances = self.search(coord, lambda distances, bound: len(distances) >= k and np.partition(distances, k - 1)[k - 1] < bound)
+        return self.ids[positions[:k]].tolist()
+
+    def radius(self, coord, radius):
+        # ids of the stations at a distance <= radius of coord, closest first
+        positions, distances = self.search(coord, lambda distances, bound: bound > radius)
+        return self.ids[positions[distances <= radius]].tolist()
+
+    def nearest_many(self, coords):
+        """
+        nearest() of many coordinates at once. For maps up to BRUTE_FORCE_STATIONS stations the whole
+        distance matrix is computed with NumPy (in chunks of CHUNK_SIZE distances).
+        Returns a list with the list of closest ids of each coordinate.
+        """
+        coords = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+        if len(self.ids) > self.BRUTE_FORCE_STATIONS or len(self.ids) == 0:
+            return [self.nearest(coord) for coord in coords]
+
+        result = []
+        rows = max(1, self.CHUNK_SIZE // len(self.ids))
+        for start in range(0, len(coords), rows):
+            chunk = coords[start:start + rows]
+            dx = self.x[None, :] - chunk[:, 0, None]
+            dy = self.y[None, :] - chunk[:, 1, None]
+            distances = np.sqrt(dx * dx + dy * dy)
+            closest = distances == distances.min(axis=1, keepdims=True)
+            result += [self.ids[row].tolist() for row in closest]
+        return result
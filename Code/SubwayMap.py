@@ -7,11 +7,16 @@ __group__='TO_BE_FILLED'
 # Universitat Autonoma de Barcelona
 # _________________________________________________________________________________________
 
+import numpy as np
+from collections.abc import Mapping
+
+
 class Map:
     """
     A class for keeping all the data regarding stations and their connections
 
-    self.stations: is a dictionary of dictionary with the format of
+    self.stations: the attributes of the stations as arrays indexed by station id (see StationTable),
+            that can still be read as a dictionary of dictionary with the format of
             {station_id: {"name": name_value, "line": line_value, ...}
 
     self.connectipns: is a dictionary of dictionary holding all the connection information with the format of
@@ -20,24 +25,345 @@ class Map:
                 station_2 : {first_connection_to_station_2: cost_2_1, second_connection_to_station_1: cost_2_2}
                 ....
             }
+
+    self.csr_offsets, self.csr_indices, self.csr_weights: optional compressed sparse row copy of
+            self.connections (see build_csr), used by neighbours() when present
+
+    self.version: incremented every time the map is modified, so caches of results can tell they are stale
+
+    self.closed: stations closed with close_station. A closed station is out of the map for routing: it has
+            no connections (neighbours() and the cost graphs skip it), it can't be the origin or the
+            destination of a route (every search returns no route) and coordinates don't snap to it
+
+    self.changes: log of the changes made with close_station, reopen_station and update_connection since
+            the last bigger change (add_connection, add_velocity, ...), see changes_since
     """
     def __init__(self):
-        self.stations = {}
+        self.stations = StationTable()
         self.connections = {}
+        self.csr_offsets = None                 # CSR copy of the connections, see build_csr
+        self.csr_indices = None
+        self.csr_weights = None
+        self.index = None
+        self.cost_graphs = {}                   # weighted CSR graphs per type_preference, see Routing.cost_graph
+        self.cost_tables = None                 # all-pairs tables, see CostTables.load_cost_tables
+        self.version = 0
+        self.closed = set()
+        self.changes = []
+        self.reset_version = 0
+
+    def changed(self, change=None):
+        # Drops everything computed from the old map. change is a (kind, ...) tuple for the change log,
+        # None for changes that are not logged (anything computed from the map has to be redone)
+        self.version += 1
+        self.cost_graphs = {}
+        self.cost_tables = None
+        if change is None:
+            self.changes = []
+            self.reset_version = self.version
+        else:
+            self.changes.append((self.version,) + change)
+
+    def changes_since(self, version):
+        """
+        Changes made after version as (version, kind, ...) tuples:
+            (version, 'close', station), (version, 'reopen', station),
+            (version, 'connection', origin, destination, old_cost, new_cost)
+        None if there was a change that is not logged since then (everything has to be recomputed).
+        """
+        if version < self.reset_version:
+            return None
+        return [change for change in self.changes if change[0] > version]
+
+    def close_station(self, station):
+        # The station can't be used by any route until reopen_station (its connections are kept)
+        if station not in self.closed:
+            self.closed.add(station)
+            self.index = None                               # coordinates can't snap to it
+            self.changed(('close', station))
+
+    def reopen_station(self, station):
+        if station in self.closed:
+            self.closed.discard(station)
+            self.index = None
+            self.changed(('reopen', station))
+
+    def update_connection(self, origin, destination, cost):
+        """
+        Changes the cost of the connection origin -> destination (it is added if there was none).
+        Only that connection changes: the CSR arrays are updated in place when the connection is in them.
+        """
+        if isinstance(self.connections, CSRConnections):    # memory-mapped arrays can't be written, use dictionaries
+            self.connections = {station: self.connections[station] for station in self.connections}
+        old_cost = self.connections.get(origin, {}).get(destination)
+        self.connections.setdefault(origin, {})[destination] = cost
+
+        if self.csr_offsets is not None:
+            position = []
+            if origin < len(self.csr_offsets) - 1:
+                start, end = self.csr_offsets[origin], self.csr_offsets[origin + 1]
+                position = np.flatnonzero(np.asarray(self.csr_indices[start:end]) == destination)
+            if len(position):
+                if not self.csr_weights.flags.writeable:
+                    self.csr_weights = np.array(self.csr_weights)
+                self.csr_weights[start + position[0]] = cost
+            else:
+                self.csr_offsets = None                     # a new connection, build_csr() has to be called again
+        self.changed(('connection', origin, destination, old_cost, cost))
 
     def add_station(self, id, name, line, x, y):
-        self.stations[id] = {'name': name, 'line': int(line), 'x': x, 'y': y}
+        self.stations.add(id, name, int(line), x, y)
+        self.index = None
+        self.changed()
+
+    def add_cost_tables(self, tables):
+        self.cost_tables = tables
+
+    def station_index(self):
+        # Spatial index over the station coordinates, built the first time it is needed and again after
+        # the coordinates change (x or y written through map.stations[id], see StationTable.coordinates_version)
+        stations = self.stations
+        if self.index is None or self.index_stations is not stations or self.index_version != stations.coordinates_version:
+            from SpatialIndex import StationIndex
+            self.index = StationIndex(stations, self.closed)
+            self.index_stations, self.index_version = stations, stations.coordinates_version
+        return self.index
 
     def add_connection(self, connections):
         self.connections = connections
+        self.changed()
+        if isinstance(connections, CSRConnections):
+            self.add_csr(connections.offsets, connections.indices, connections.weights)
+        else:
+            self.csr_offsets = None             # the CSR copy (if any) is stale, build_csr() has to be called again
+
+    def build_csr(self):
+        """
+        Builds a compressed sparse row copy of self.connections (see csr_arrays):
+            self.csr_offsets: int64 array, the neighbours of station s are in [csr_offsets[s], csr_offsets[s+1])
+            self.csr_indices: int32 array with the neighbour station ids
+            self.csr_weights: float64 array with the cost of each connection
+        Rows are indexed directly by station id and keep the order of self.connections.
+        Once built, neighbours() reads from these arrays instead of the dictionaries.
+        """
+        self.add_csr(*self.csr_arrays())
+
+    def csr_arrays(self):
+        # (offsets, indices, weights) of the connections: the CSR copy if the map has one, otherwise they
+        # are built without giving them to the map (it keeps using its dictionaries)
+        if self.csr_offsets is not None:
+            return self.csr_offsets, self.csr_indices, self.csr_weights
+        size = max(list(self.stations.keys()) + list(self.connections.keys()), default=0) + 1
+        counts = np.zeros(size, dtype=np.int64)
+        for station, neighbours in self.connections.items():
+            counts[station] = len(neighbours)
+        offsets = np.zeros(size + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+
+        indices = np.empty(offsets[-1], dtype=np.int32)
+        weights = np.empty(offsets[-1], dtype=np.float64)
+        for station, neighbours in self.connections.items():
+            start = offsets[station]
+            indices[start:start + len(neighbours)] = list(neighbours.keys())
+            weights[start:start + len(neighbours)] = list(neighbours.values())
+        return offsets, indices, weights
+
+    def add_csr(self, offsets, indices, weights):
+        self.csr_offsets = offsets
+        self.csr_indices = indices
+        self.csr_weights = weights
+
+    def neighbours(self, station):
+        # Ids of the stations connected to station, in the same order as self.connections[station]
+        if self.csr_offsets is None:
+            neighbours = self.connections[station].keys()
+        else:
+            neighbours = self.csr_indices[self.csr_offsets[station]:self.csr_offsets[station + 1]].tolist()
+        if self.closed:
+            if station in self.closed:
+                return []
+            return [k for k in neighbours if k not in self.closed]
+        return neighbours
 
     def combine_dicts(self):
-        for k, v in self.stations.items():
-            v.update({'velocity': self.velocity[v['line']]})
+        # Velocity of every station, the one of its line
+        self.stations.set_velocity([self.velocity[line] for line in self.stations.line[self.stations.ids].tolist()])
 
     def add_velocity(self, velocity):
         self.velocity = {ix+1: v for ix, v in enumerate(velocity)}
         self.combine_dicts()
+        self.changed()
+
+
+class StationTable(Mapping):
+    """
+    Attributes of the stations of a Map as arrays indexed by station id (ids without a station are 0):
+        x, y, velocity: float64 arrays, line: int64 array, name: list of names (None without a station)
+        ids: the station ids in the order they were added
+    It keeps the interface of the old dictionary of dictionaries: map.stations[id]["x"],
+    map.stations.items(), ... give StationViews that read (and write) the arrays. Loops that read
+    stations one at a time should use lists(), Python lists of the arrays that are much faster to
+    index element by element than NumPy (see CostGraph.lists).
+    """
+    FIELDS = ('name', 'line', 'x', 'y', 'velocity')
+
+    def __init__(self):
+        self.ids = []
+        self.name = []
+        self.coordinates_version = 0                    # incremented when a station is added or moved (see Map.station_index)
+        self.present = np.zeros(0, dtype=bool)
+        self.has_velocity = np.zeros(0, dtype=bool)     # stations added after add_velocity have no 'velocity'
+        self.line = np.zeros(0, dtype=np.int64)
+        self.x = np.zeros(0)
+        self.y = np.zeros(0)
+        self.velocity = np.zeros(0)
+        self.python_lists = None
+        self.velocity_known = None
+        self.views = {}
+
+    @classmethod
+    def from_arrays(cls, ids, names, line, x, y, velocity):
+        # Table over existing arrays indexed by station id (nothing is copied, e.g. shared memory)
+        table = cls()
+        table.ids = list(ids)
+        table.name = [None] * len(x)
+        for k, name in zip(table.ids, names):
+            table.name[k] = name
+        table.present = np.zeros(len(x), dtype=bool)
+        table.present[table.ids] = True
+        table.has_velocity = table.present.copy()
+        table.line, table.x, table.y, table.velocity = line, x, y, velocity
+        return table
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        return iter(self.ids)
+
+    def __contains__(self, station):
+        return 0 <= station < len(self.name) and self.name[station] is not None
+
+    def __getitem__(self, station):
+        view = self.views.get(station)
+        if view is None:                                # views hold no data, one per station is kept
+            if not (0 <= station < len(self.name) and self.name[station] is not None):
+                raise KeyError(station)
+            view = self.views[station] = StationView(self, station)
+        return view
+
+    def grow(self, size):
+        # Room for station ids up to size - 1, doubling the arrays so adding stations one by one is amortized O(1)
+        capacity = max(size, 2 * len(self.present))
+        for field in ('present', 'has_velocity', 'line', 'x', 'y', 'velocity'):
+            old = getattr(self, field)
+            array = np.zeros(capacity, dtype=old.dtype)
+            array[:len(old)] = old
+            setattr(self, field, array)
+        self.name += [None] * (capacity - len(self.name))
+
+    def add(self, station, name, line, x, y):
+        if station >= len(self.present):
+            self.grow(station + 1)
+        if not self.present[station]:
+            self.ids.append(station)
+        self.present[station] = True
+        self.has_velocity[station] = False
+        self.name[station], self.line[station], self.x[station], self.y[station] = name, line, x, y
+        self.velocity[station] = 0.0
+        self.coordinates_version += 1
+        self.python_lists = None
+
+    def set(self, station, field, value):
+        if field == 'name':
+            self.name[station] = value
+        elif field in self.FIELDS:
+            getattr(self, field)[station] = value
+            if field == 'velocity':
+                self.has_velocity[station] = True
+            elif field in ('x', 'y'):
+                self.coordinates_version += 1
+        else:
+            raise KeyError(field)
+        self.python_lists = None
+
+    def set_velocity(self, velocity):
+        # velocity of every station, in the order of self.ids
+        self.velocity[self.ids] = velocity
+        self.has_velocity[self.ids] = True
+        self.python_lists = None
+
+    def lists(self):
+        # (x, y, line, velocity) as Python lists indexed by station id
+        if self.python_lists is None:
+            self.python_lists = (self.x.tolist(), self.y.tolist(), self.line.tolist(), self.velocity.tolist())
+            self.velocity_known = self.has_velocity.tolist()
+        return self.python_lists
+
+
+class StationView(Mapping):
+    # map.stations[id]: the dictionary of a station, read from (and written to) the arrays of its StationTable
+    __slots__ = ('table', 'station')
+
+    def __init__(self, table, station):
+        self.table = table
+        self.station = station
+
+    COLUMNS = {'x': 0, 'y': 1, 'line': 2, 'velocity': 3}   # position in StationTable.lists()
+
+    def keys(self):
+        return StationTable.FIELDS if self.table.has_velocity[self.station] else StationTable.FIELDS[:-1]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __getitem__(self, field):
+        if field == 'name':
+            return self.table.name[self.station]
+        columns = self.table.python_lists or self.table.lists()
+        if field == 'velocity' and not self.table.velocity_known[self.station]:
+            raise KeyError(field)
+        return columns[self.COLUMNS[field]][self.station]
+
+    def __setitem__(self, field, value):
+        self.table.set(self.station, field, value)
+
+    def update(self, values):
+        for field, value in values.items():
+            self.table.set(self.station, field, value)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+class CSRConnections(Mapping):
+    """
+    Read-only view with the same interface as Map.connections over CSR arrays
+    (offsets, indices, weights), for maps loaded from a sparse or memory-mapped file.
+    connections[station] builds the {neighbour: cost} dictionary of that row when it is asked for.
+    Usage:
+        >>> map.add_connection(CSRConnections(offsets, indices, weights))
+        >>> map.connections[12]
+    """
+    def __init__(self, offsets, indices, weights):
+        self.offsets = offsets
+        self.indices = indices
+        self.weights = weights
+
+    def __getitem__(self, station):
+        if not 0 <= station < len(self.offsets) - 1 or self.offsets[station] == self.offsets[station + 1]:
+            raise KeyError(station)
+        start, end = self.offsets[station], self.offsets[station + 1]
+        return dict(zip(self.indices[start:end].tolist(), self.weights[start:end].tolist()))
+
+    def __iter__(self):
+        return iter(np.flatnonzero(np.diff(self.offsets)).tolist())
+
+    def __len__(self):
+        return int(np.count_nonzero(np.diff(self.offsets)))
 
 
 class Path:
@@ -52,16 +378,42 @@ class Path:
         >>> path.update_g(10)
         # You can reach the last and penultimate station of a path
         >>> path.last, path.penultimate
+        # A child path can share the route of its parent instead of copying it
+        >>> child = Path(7, parent=path)
+        >>> child.route
+        [2, 5, 7]
+
+    When a parent is given, the path only stores its last station and a pointer to the
+    parent, so building it is O(1). self.route is rebuilt from the chain the first time it
+    is read. contains(station) walks the chain up to the first path with a route: it is O(length
+    of the route), not O(1). Building self.simple walks the chain of the parent once, so the cycle
+    check of remove_cycles is paid when the path is built and remove_redundant_paths costs
+    O(frontier x route length). An O(1) check would need a set per path, and copying it for every
+    child is O(N) for a bitset of the station ids (what Path used to keep) or O(length) for a set,
+    and a persistent set would keep O(log N) nodes per path; routes are short, so the walk is kept.
+    Paths have __slots__ (no __dict__): searches create millions of them.
     """
-    def __init__(self, route):
-        if type(route) is list:
-            self.route = route
+    __slots__ = ('parent', '_route', 'head', 'last', 'penultimate', 'simple', 'g', 'h', 'f')
+
+    def __init__(self, route, parent=None):
+        if parent is not None:
+            self.parent = parent
+            self._route = None
+            self.head = parent.head
+            self.last = route
+            self.penultimate = parent.last
+            self.simple = parent.simple and not parent.contains(route)
         else:
-            self.route = [route]
+            self.parent = None
+            if type(route) is list:
+                self._route = route
+            else:
+                self._route = [route]
 
-        self.head = self.route[0]
-        self.last = self.route[-1]
-        if len(self.route) >= 2: self.penultimate = self.route[-2]
+            self.head = self._route[0]
+            self.last = self._route[-1]
+            if len(self._route) >= 2: self.penultimate = self._route[-2]
+            self.simple = len(set(self._route)) == len(self._route)
         # Real cost
         self.g = 0
         # Heuristic cost
@@ -69,6 +421,43 @@ class Path:
         # Combination of the two
         self.f = 0
 
+    @property
+    def route(self):
+        if self._route is None:
+            tail = []
+            node = self
+            while node._route is None:
+                tail.append(node.last)
+                node = node.parent
+            tail.reverse()
+            self._route = node._route + tail
+        return self._route
+
+    def contains(self, station):
+        # True if station is in the route (the route is not built)
+        node = self
+        while node._route is None:
+            if node.last == station:
+                return True
+            node = node.parent
+        return station in node._route
+
+    @route.setter
+    def route(self, route):
+        self._route = route
+
+    def copy(self):
+        # Independent copy (own route list) with the same costs
+        path = Path(list(self.route))
+        path.g, path.h, path.f = self.g, self.h, self.f
+        return path
+
+    def materialize(self):
+        # Drops the parent chain so the path no longer keeps its ancestors alive
+        self.route
+        self.parent = None
+        return self
+
     def __eq__(self, other):
         if other is not None:
             return self.route == other.route
@@ -87,3 +476,4 @@ class Path:
         self.route.append(children)
         self.penultimate = self.route[-2]
         self.last = self.route[-1]
+        self.simple = self.simple and children not in self.route[:-1]
@@ -0,0 +1,177 @@
+# Synthetic metro maps of any size, written in the CityInformation layout, for benchmarks.
+#
+# _________________________________________________________________________________________
+# Intel.ligencia Artificial
+# Grau en Enginyeria Informatica
+# Curs 2021 - 2022
+# Universitat Autonoma de Barcelona
+# _________________________________________________________________________________________
+
+from SubwayMap import *
+from utils import *
+import argparse
+import random
+
+# Biggest map written as a dense Time.txt matrix by write_city(format='auto'), the rest get an Edges.bin
+DENSE_LIMIT = 2000
+
+GEOMETRIES = ('random', 'radial', 'grid')
+
+
+def generate_city(stations, lines=None, transfers=0.3, geometry='random', spacing=10, transfer_time=10,
+                  velocities=(3, 10, 14, 45), seed=0):
+    """
+     Builds a random metro map. Every line is a walk of about stations / lines stops over a square
+     of side spacing * sqrt(stations). When a stop falls in the same cell as a stop of another line,
+     with probability transfers it is moved onto it and both become a transfer (same coordinates and
+     name, connected with cost transfer_time, as CHARPENNES or PART-DIEU in Lyon).
+     Format of the parameter is:
+        Args:
+            stations (int): Number of stations
+            lines (int): Number of lines (about sqrt(stations) / 2 by default)
+            transfers (float): Probability of turning a stop close to another line into a transfer
+            geometry (str): 'random' (lines wander), 'radial' (lines cross the centre) or 'grid' (horizontal
+                            and vertical lines)
+            spacing (int): Mean distance between consecutive stops
+            transfer_time (float): Cost of the connections between the stations of a transfer
+            velocities (tuple): Velocities the lines are given (at random)
+            seed (int): Seed of the random generator, the same arguments always give the same map
+        Returns:
+            map (object of Map class): The map, with stations, connections (cost = distance / velocity) and velocities
+    """
+    if geometry not in GEOMETRIES:
+        raise ValueError("unknown geometry: {} (use one of {})".format(geometry, ', '.join(GEOMETRIES)))
+    rng = random.Random(seed)
+    lines = lines or max(1, round(math.sqrt(stations) / 2))
+    side = spacing * max(math.sqrt(stations), 2)
+    velocity = [rng.choice(velocities) for _ in range(lines)]
+
+    position = []                                       # (x, y) of station id - 1
+    names = []
+    line_of = []
+    cells = {}                                          # (cx, cy) -> station ids in that cell
+    connections = {}
+
+    def connect(a, b, cost):
+        connections.setdefault(a, {})[b] = cost
+        connections.setdefault(b, {})[a] = cost
+
+    for line in range(1, lines + 1):
+        length = stations // lines + (1 if line <= stations % lines else 0)
+        x, y, heading = start(rng, geometry, side, spacing)
+        previous = None
+        for _ in range(length):
+            station = len(position) + 1
+            point = (int(round(x)), int(round(y)))
+            name = 'STATION {}'.format(station)
+            cell = (point[0] // spacing, point[1] // spacing)
+            others = [s for s in cells.get(cell, ()) if line_of[s - 1] != line]
+            if others and rng.random() < transfers:
+                other = rng.choice(others)
+                if previous is None or position[other - 1] != position[previous - 1]:
+                    point, name = position[other - 1], names[other - 1]
+            position.append(point)
+            names.append(name)
+            line_of.append(line)
+            cells.setdefault(cell, []).append(station)
+
+            for other in cells[cell]:
+                if other != station and line_of[other - 1] != line and position[other - 1] == point:
+                    connect(station, other, float(transfer_time))
+            if previous is not None:
+                distance = max(euclidean_dist(position[previous - 1], point), 1)
+                connect(previous, station, distance / velocity[line - 1])
+            previous = station
+            x, y, heading = step(rng, geometry, x, y, heading, side, spacing)
+
+    map = Map()
+    for station, ((x, y), name, line) in enumerate(zip(position, names, line_of), start=1):
+        map.add_station(station, name, line, x, y)
+    map.add_connection(connections)
+    map.add_velocity(velocity)
+    return map
+
+
+def start(rng, geometry, side, spacing):
+    # First stop and direction of a line
+    if geometry == 'random':
+        return rng.uniform(0, side), rng.uniform(0, side), rng.uniform(0, 2 * math.pi)
+    if geometry == 'radial':
+        angle = rng.uniform(0, 2 * math.pi)             # from the border, heading to the centre
+        return side / 2 * (1 + math.cos(angle)), side / 2 * (1 + math.sin(angle)), angle + math.pi
+    offset = rng.randrange(0, int(side) + 1, spacing)   # grid: stops on multiples of spacing, so crossings coincide
+    if rng.random() < 0.5:
+        return 0, offset, 0.0
+    return offset, 0, math.pi / 2
+
+
+def step(rng, geometry, x, y, heading, side, spacing):
+    # Next stop of a line, it turns back into the square at the border
+    if geometry == 'grid':
+        x, y = x + spacing * round(math.cos(heading)), y + spacing * round(math.sin(heading))
+        if not (0 <= x <= side and 0 <= y <= side):
+            x, y = x - spacing * round(math.cos(heading)), y - spacing * round(math.sin(heading))
+            heading += math.pi / 2 if rng.random() < 0.5 else -math.pi / 2
+            return step(rng, geometry, x, y, heading, side, spacing)
+        return x, y, heading
+
+    heading += rng.gauss(0, 0.3 if geometry == 'random' else 0.05)
+    distance = spacing * rng.uniform(0.5, 1.5)
+    x, y = x + distance * math.cos(heading), y + distance * math.sin(heading)
+    if not 0 <= x <= side:
+        x, heading = min(max(x, 0), side), math.pi - heading
+    if not 0 <= y <= side:
+        y, heading = min(max(y, 0), side), -heading
+    return x, y, heading
+
+
+def write_city(map, root_folder, format='auto'):
+    """
+     Writes a map in the CityInformation layout: Stations.txt, InfoVelocity.txt and the connections as
+     a dense Time.txt matrix (format='dense'), a sparse Edges.txt (format='txt') or a binary Edges.bin
+     (format='bin'). 'auto' is dense up to DENSE_LIMIT stations and bin for bigger maps.
+     load_map(root_folder) reads it back.
+    """
+    if format == 'auto':
+        format = 'dense' if len(map.stations) <= DENSE_LIMIT else 'bin'
+    os.makedirs(root_folder, exist_ok=True)
+
+    with open(os.path.join(root_folder, 'Stations.txt'), 'w') as fp:
+        for k, v in map.stations.items():
+            fp.write('{}\t{}\t{}\t{}\t{}\n'.format(k, v['name'], v['line'], int(v['x']), int(v['y'])))   # integer coordinates, as read_station_information reads them
+    with open(os.path.join(root_folder, 'InfoVelocity.txt'), 'w') as fp:
+        for line, velocity in sorted(map.velocity.items()):
+            fp.write(' Vel. line {} : {}\n'.format(line, velocity))
+
+    if format == 'dense':
+        size = max(map.stations)
+        matrix = np.zeros((size, size))
+        for origin, neighbours in map.connections.items():
+            for destination, cost in neighbours.items():
+                matrix[origin - 1, destination - 1] = cost
+        np.savetxt(os.path.join(root_folder, 'Time.txt'), matrix, fmt='%.5f')
+    elif format == 'txt':
+        write_edge_list(map.connections, os.path.join(root_folder, 'Edges.txt'))
+    elif format == 'bin':
+        write_edge_binary(map.connections, os.path.join(root_folder, 'Edges.bin'))
+    else:
+        raise ValueError("unknown format: {} (use auto, dense, txt or bin)".format(format))
+
+
+if __name__ == "__main__":
+    # python SyntheticCity.py ../CityInformation/Synthetic_10k --stations 10000 --lines 40 --geometry radial
+    parser = argparse.ArgumentParser(description='Writes a synthetic city in the CityInformation layout')
+    parser.add_argument('root_folder')
+    parser.add_argument('--stations', type=int, default=1000)
+    parser.add_argument('--lines', type=int, default=None)
+    parser.add_argument('--transfers', type=float, default=0.3)
+    parser.add_argument('--geometry', choices=GEOMETRIES, default='random')
+    parser.add_argument('--spacing', type=int, default=10)
+    parser.add_argument('--format', choices=('auto', 'dense', 'txt', 'bin'), default='auto')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    map = generate_city(args.stations, args.lines, args.transfers, args.geometry, args.spacing, seed=args.seed)
+    write_city(map, args.root_folder, args.format)
+    print('{} stations, {} connections written to {}'.format(
+        len(map.stations), sum(len(v) for v in map.connections.values()), args.root_folder))
@@ -2,8 +2,26 @@ import unittest
 from SearchAlgorithm import *
 from SubwayMap import *
 from utils import *
+from Routing import *
+from CostTables import *
+from ContractionHierarchy import *
+from Landmarks import *
+from RouteCache import *
+from ParallelRouting import route_batch
+from SharedMap import *
+from RoutingService import RoutingService, request
+from Snapshot import write_snapshot, read_snapshot
+from Instrumentation import *
+from SyntheticCity import generate_city, write_city
+from Benchmark import run_benchmark
+from MemoryBoundedSearch import *
+from IncrementalSearch import *
+from Timetable import *
+from AlternativeRoutes import *
+import asyncio
 import os
 import random
+import tempfile
 
 
 class TestCases(unittest.TestCase):
@@ -31,6 +49,31 @@ class TestCases(unittest.TestCase):
                                           Path([14, 13, 8, 12, 11]),
                                           Path([14, 13, 8, 12, 13])])
 
+    def test_csr_connections(self):
+        costs = [uniform_cost_search(9, 3, self.map, type_preference).g for type_preference in range(4)]
+        self.assertIsNone(self.map.csr_offsets)         # cost graphs don't switch the map to CSR
+        self.map.build_csr()
+        self.assertEqual(list(self.map.neighbours(12)), list(self.map.connections[12].keys()))
+        self.assertEqual(self.map.csr_indices.dtype, np.int32)
+        self.assertEqual(expand(Path([13, 12]), self.map), [Path([13, 12, 8]), Path([13, 12, 11]), Path([13, 12, 13])])
+        self.assertEqual(uniform_cost_search(9, 3, self.map, 1), Path([9, 8, 12, 11, 10, 2, 3]))
+        self.assertEqual([uniform_cost_search(9, 3, self.map, type_preference).g for type_preference in range(4)], costs)
+
+    def test_sparse_cost_tables(self):
+        with tempfile.TemporaryDirectory() as folder:
+            for name in ['Edges.txt', 'Edges.bin']:
+                convert_cost_table(os.path.join(self.ROOT_FOLDER, 'Time.txt'), os.path.join(folder, name))
+            connections = read_edge_list(os.path.join(folder, 'Edges.txt'))
+            self.assertEqual(connections, self.map.connections)
+            connections = read_edge_binary(os.path.join(folder, 'Edges.bin'))
+            self.assertEqual(dict(connections), self.map.connections)
+
+            map = read_station_information(os.path.join(self.ROOT_FOLDER, 'Stations.txt'))
+            map.add_connection(connections)
+            map.add_velocity(read_information(os.path.join(self.ROOT_FOLDER, 'InfoVelocity.txt')))
+            self.assertEqual(uniform_cost_search(9, 3, map, 2), Path([9, 8, 12, 11, 10, 2, 3]))
+            del map, connections                    # release the memory map before the folder is removed
+
     def test_RemoveCycles(self):
         expanded_paths = expand(Path(7), self.map)
         expanded_paths = remove_cycles(expanded_paths)
@@ -44,6 +87,15 @@ class TestCases(unittest.TestCase):
         expanded_paths = remove_cycles(expanded_paths)
         self.assertEqual(expanded_paths, [Path([14, 13, 8, 12, 11])])
 
+    def test_path_parent_chain(self):
+        path = Path([14, 13])
+        child = Path(8, parent=path)
+        grandchild = Path(13, parent=child)
+        self.assertEqual((child.last, child.penultimate, child.head), (8, 13, 14))
+        self.assertEqual(grandchild.route, [14, 13, 8, 13])
+        self.assertEqual([child.simple, grandchild.simple], [True, False])
+        self.assertEqual(path.route, [14, 13])
+
     def test_depth_first_search(self):
         route1 = depth_first_search(2, 7, self.map)
         route2 = depth_first_search(13, 1, self.map)
@@ -66,6 +118,15 @@ class TestCases(unittest.TestCase):
         self.assertEqual(route3, Path([5, 10, 11, 12]))
         self.assertEqual(route4, Path([14, 13, 12, 11, 10]))
 
+    def test_graph_search_bfs_dfs(self):
+        self.assertEqual(breadth_first_search(13, 1, self.map, graph_search=True), Path([13, 12, 11, 10, 2, 1]))
+        self.assertEqual(breadth_first_search(14, 10, self.map, graph_search=True), Path([14, 13, 12, 11, 10]))
+        self.assertEqual(breadth_first_search(4, 4, self.map, graph_search=True), Path(4))
+        for origin, destination in [(2, 7), (13, 1), (5, 12), (14, 10)]:
+            route = depth_first_search(origin, destination, self.map, graph_search=True)
+            self.assertEqual((route.head, route.last), (origin, destination))
+            self.assertEqual(len(set(route.route)), len(route.route))
+
     def test_calculate_cost(self):
         list_of_path = [Path([7, 6]), Path([7, 8])]
         updated_paths = calculate_cost(list_of_path, self.map, type_preference=0)
@@ -97,6 +158,72 @@ class TestCases(unittest.TestCase):
         route = uniform_cost_search(9, 3, self.map, 3)
         self.assertEqual(route, Path([9, 8, 7, 6, 5, 2, 3]))
 
+    def test_path_heap(self):
+        list_of_path = PathHeap()
+        list_of_path = insert_cost([self.create_path_with_g([1, 2], 3), self.create_path_with_g([1, 3], 1)], list_of_path)
+        list_of_path = insert_cost([self.create_path_with_g([1, 4], 3), self.create_path_with_g([1, 5], 1)], list_of_path)
+        list_of_path.remove(list_of_path.peek())
+        # equal costs keep insertion order, removed paths are skipped
+        self.assertEqual([list_of_path.pop() for _ in range(len(list_of_path))], [Path([1, 5]), Path([1, 2]), Path([1, 4])])
+
+    def test_route_many(self):
+        result = route_many([9, 9, 5], [3, 9], self.map, 1)
+        self.assertEqual(result.costs.shape, (3, 2))
+        self.assertEqual(result.costs[0, 0], uniform_cost_search(9, 3, self.map, 1).g)
+        self.assertEqual(result.costs[1, 1], 0)
+        self.assertEqual(result.route(0, 0), Path([9, 8, 12, 11, 10, 2, 3]))
+        self.assertEqual(result.route(2, 0), uniform_cost_search(5, 3, self.map, 1))
+
+    def test_cost_tables(self):
+        with tempfile.TemporaryDirectory() as folder:
+            map = load_cost_tables(self.ROOT_FOLDER, cache_folder=folder)
+            self.assertEqual(len(os.listdir(folder)), 1)
+            map = load_cost_tables(self.ROOT_FOLDER, cache_folder=folder)     # second time from the cache
+        self.assertEqual(uniform_cost_search(9, 3, map, 1), Path([9, 8, 12, 11, 10, 2, 3]))
+        self.assertEqual(uniform_cost_search(9, 3, map, 1).g, uniform_cost_search(9, 3, self.map, 1).g)
+        stats = SearchStats()
+        self.assertEqual(Astar_station2station(9, 3, map, 1, graph_search=True, stats=stats), Path([9, 8, 12, 11, 10, 2, 3]))
+        self.assertEqual((stats.expanded, list(stats.phases)), (0, ['search']))      # read from the tables, not searched
+        optimal_path = Astar([82, 217], [140, 27], map, 2)
+        self.assertEqual(optimal_path, Path([9, 8, 12, 11, 10, 5, 4]))
+        self.assertEqual(optimal_path.f, 326.53992)
+        with tempfile.TemporaryDirectory() as folder:
+            load_cost_tables(self.ROOT_FOLDER, cache_folder=folder)
+            self.map.update_connection(10, 2, 500.0)
+            load_cost_tables(self.ROOT_FOLDER, self.map, cache_folder=folder)
+            self.assertEqual(len(os.listdir(folder)), 2)                    # a changed map gets its own tables
+        self.assertEqual(uniform_cost_search(9, 3, self.map, 1).g, best_first_graph_search(9, 3, self.map, 1).g)
+
+    def test_contraction_hierarchy(self):
+        hierarchy = ContractionHierarchy.build(self.map, type_preference=1)
+        with tempfile.TemporaryDirectory() as folder:
+            hierarchy.save(os.path.join(folder, 'hierarchy.npz'))
+            hierarchy = ContractionHierarchy.load(os.path.join(folder, 'hierarchy.npz'))
+        route = hierarchy.query(9, 3)
+        self.assertEqual(route, Path([9, 8, 12, 11, 10, 2, 3]))
+        self.assertEqual(route.g, uniform_cost_search(9, 3, self.map, 1).g)
+        self.assertEqual(hierarchy.query(4, 4), Path(4))
+
+    def test_graph_search_cost(self):
+        for type_preference in range(4):
+            route = uniform_cost_search(9, 3, self.map, type_preference)
+            self.assertEqual(uniform_cost_search(9, 3, self.map, type_preference, graph_search=True).g, route.g)
+            self.assertEqual(Astar_station2station(9, 3, self.map, type_preference, graph_search=True).g, route.g)
+
+        optimal_path = Astar([82, 217], [140, 27], self.map, 2, graph_search=True)
+        self.assertEqual(optimal_path, Path([9, 8, 12, 11, 10, 5, 4]))
+        self.assertEqual(optimal_path.f, 326.53992)
+
+    def test_bidirectional_search(self):
+        route = bidirectional_uniform_cost_search(9, 3, self.map, 1)
+        self.assertEqual(route, Path([9, 8, 12, 11, 10, 2, 3]))
+        self.assertEqual(route.g, uniform_cost_search(9, 3, self.map, 1).g)
+        self.assertEqual(bidirectional_uniform_cost_search(9, 9, self.map, 1), Path(9))
+
+        route = bidirectional_breadth_first_search(13, 1, self.map)
+        self.assertEqual(route.g, 5)
+        self.assertEqual((route.head, route.last), (13, 1))
+
     def test_calculate_heuristics(self):
         expanded_paths = [Path([12, 8, 7]), Path([12, 8, 9]), Path([12, 8, 13])]
         updated_paths = calculate_heuristics(expanded_paths, self.map, destination_id=9, type_preference=0)
@@ -114,6 +241,266 @@ class TestCases(unittest.TestCase):
         updated_paths = calculate_heuristics(expanded_paths, self.map, destination_id=9, type_preference=3)
         self.assertEqual([path.h for path in updated_paths], [0, 0, 1])
 
+    def test_landmark_heuristics(self):
+        landmarks = build_landmarks(self.map, 3, type_preference=1)
+        self.assertEqual(len(landmarks.landmarks), 3)
+        expanded_paths = [Path([12, 8, 7]), Path([12, 8, 9]), Path([12, 8, 13])]
+        updated_paths = calculate_heuristics(expanded_paths, self.map, 9, 1, landmarks)
+        for path in updated_paths:
+            self.assertLessEqual(path.h, uniform_cost_search(path.last, 9, self.map, 1).g + 1e-9)
+        self.assertEqual(updated_paths[1].h, 0)
+
+        optimal_path = Astar([140, 56], [140, 115], self.map, 1, landmarks)
+        self.assertEqual(optimal_path, Path([2, 5, 6]))
+        self.assertEqual(optimal_path.f, 27.14286)
+
+    def test_route_cache(self):
+        cache = RouteCache(self.map, max_size=2)
+        route = cache.uniform_cost_search(9, 3, 1)
+        route.update_g(100)                                 # the cached copy is not modified
+        self.assertEqual(cache.uniform_cost_search(9, 3, 1).g, uniform_cost_search(9, 3, self.map, 1).g)
+        self.assertEqual((cache.routes.hits, cache.routes.misses), (1, 1))
+
+        optimal_path = cache.Astar([82, 217], [140, 27], 2)
+        self.assertEqual(optimal_path, Path([9, 8, 12, 11, 10, 5, 4]))
+        self.assertEqual(cache.Astar([82, 217], [140, 27], 2).f, 326.53992)
+        cache.uniform_cost_search(5, 3, 1)                  # evicts (9, 3)
+        self.assertEqual(len(cache.routes), 2)
+
+        self.map.add_velocity(read_information(os.path.join(self.ROOT_FOLDER, 'InfoVelocity.txt')))
+        cache.Astar([82, 217], [140, 27], 2)
+        self.assertEqual(cache.stats()['size'], 1)
+
+    def test_route_batch(self):
+        queries = [(9, 3, 0), (9, 3, 1), (5, 12, 2), (14, 10, 3)]
+        results = route_batch(queries, self.ROOT_FOLDER, max_workers=2)
+        self.assertEqual([path for path, _ in results], [uniform_cost_search(*query[:2], self.map, query[2]) for query in queries])
+        self.assertTrue(all(seconds >= 0 for _, seconds in results))
+
+    def test_shared_map(self):
+        with SharedMap(self.map) as shared:
+            view = attach_map(shared.handle)
+            self.assertEqual(dict(view.stations), self.map.stations)
+            self.assertEqual(dict(view.connections), self.map.connections)
+            self.assertEqual(uniform_cost_search(9, 3, view, 2), Path([9, 8, 12, 11, 10, 2, 3]))
+            self.assertEqual(Astar([82, 217], [140, 27], view, 2), Path([9, 8, 12, 11, 10, 5, 4]))
+            self.assertRaises(TypeError, view.add_connection, {})
+
+            results = route_batch([(9, 3, 1), (5, 12, 2)], shared=shared.handle, max_workers=2)
+            self.assertEqual([path for path, _ in results], [uniform_cost_search(9, 3, self.map, 1), uniform_cost_search(5, 12, self.map, 2)])
+            del view
+
+    def test_routing_service(self):
+        service = RoutingService({'small': self.ROOT_FOLDER}, max_concurrency=2)
+
+        async def run():
+            server = await service.start_tcp('127.0.0.1', 0)
+            async with server:
+                host, port = server.sockets[0].getsockname()[:2]
+                return await request(host, port, [
+                    {'id': 1, 'city': 'small', 'origin': 9, 'destination': 3, 'type_preference': 1},
+                    {'id': 2, 'algorithm': 'Astar', 'origin': [82, 217], 'destination': [140, 27], 'type_preference': 2},
+                    {'id': 3, 'batch': [{'id': 4, 'origin': 13, 'destination': 1, 'algorithm': 'breadth_first_search'}]},
+                    {'id': 5, 'city': 'big', 'origin': 9, 'destination': 3}])
+
+        answers = asyncio.run(run())
+        self.assertEqual(answers[0]['route'], [9, 8, 12, 11, 10, 2, 3])
+        self.assertEqual(answers[0]['cost'], uniform_cost_search(9, 3, self.map, 1).g)
+        self.assertEqual(answers[1]['route'], [9, 8, 12, 11, 10, 5, 4])
+        self.assertEqual(answers[2]['results'][0]['route'], [13, 12, 11, 10, 2, 1])
+        self.assertIn('error', answers[3])
+
+        service = RoutingService({'small': self.ROOT_FOLDER}, max_concurrency=1, processes=True)
+
+        async def run():
+            first = asyncio.ensure_future(service.handle({'id': 6, 'origin': 9, 'destination': 3, 'deadline': 0}))
+            second = await service.handle({'id': 7, 'origin': 9, 'destination': 3, 'type_preference': 1, 'deadline': 60})
+            return await first, second
+
+        try:
+            late, answer = asyncio.run(run())
+        finally:
+            service.executor.shutdown()
+        self.assertEqual(late, {'id': 6, 'error': 'deadline exceeded'})
+        self.assertEqual(answer['route'], [9, 8, 12, 11, 10, 2, 3])
+
+    def test_snapshot(self):
+        with tempfile.TemporaryDirectory() as folder:
+            filename = os.path.join(folder, 'Map.npz')
+            write_snapshot(self.map, filename)
+            map = read_snapshot(filename)
+        self.assertEqual(map.stations, self.map.stations)
+        self.assertEqual(dict(map.connections), self.map.connections)
+        self.assertEqual(map.velocity, self.map.velocity)
+        self.assertEqual(uniform_cost_search(9, 3, map, 2), Path([9, 8, 12, 11, 10, 2, 3]))
+
+    def test_search_stats(self):
+        trace = ListTrace()
+        stats = SearchStats(trace)
+        path = Astar_station2station(9, 3, self.map, 1, stats=stats)
+        self.assertEqual(path, Astar_station2station(9, 3, self.map, 1))
+        self.assertEqual(stats.expanded, len([event for event in trace.events if event['event'] == 'expand']))
+        self.assertEqual(stats.generated, 30)
+        self.assertEqual(stats.pruned_cycles + stats.pruned_redundant, 17)
+        self.assertGreater(stats.peak_frontier, 0)
+        self.assertEqual(list(stats.phases), ['search'])
+        self.assertEqual(trace.events[-1], {'event': 'result', 'route': path.route, 'g': path.g})
+
+        stats = SearchStats()
+        uniform_cost_search(9, 3, self.map, 1, graph_search=True, stats=stats)   # best_first_graph_search is not timed twice
+        self.assertEqual(stats.expanded, 12)
+        Astar([108, 206], [67, 79], self.map, 1, stats=stats)
+        self.assertEqual(set(stats.phases), {'search', 'coord2station'})
+        stats = SearchStats()
+        bidirectional_uniform_cost_search(9, 3, self.map, 1, stats)                 # stats given by position
+        self.assertEqual(list(stats.phases), ['search'])
+
+    def test_synthetic_city(self):
+        map = generate_city(300, lines=6, geometry='radial', seed=1)
+        self.assertEqual(len(map.stations), 300)
+        self.assertEqual(set(map.velocity), set(range(1, 7)))
+        with tempfile.TemporaryDirectory() as folder:
+            for format in ('dense', 'bin'):
+                write_city(map, os.path.join(folder, format), format)
+                loaded = load_map(os.path.join(folder, format))
+                self.assertEqual(loaded.stations, map.stations)
+                self.assertEqual(uniform_cost_search(1, 300, loaded, 1).route, uniform_cost_search(1, 300, map, 1).route)
+
+            report = run_benchmark(os.path.join(folder, 'bin'), queries=3, algorithms=['breadth_first_search', 'Astar'], memory=False)
+        self.assertEqual(report['stations'], 300)
+        self.assertEqual(set(report['results']['Astar']), {'0', '1', '2', '3'})
+        self.assertEqual(report['results']['breadth_first_search']['None']['solved'], 3)
+        self.assertGreater(report['results']['Astar']['1']['expanded']['total'], 0)
+        report = run_benchmark(self.ROOT_FOLDER, queries=2, algorithms=['SMAstar', 'uniform_cost_search'], memory=False, graph_search=True)
+        self.assertEqual(report['results']['SMAstar']['1']['solved'], 2)
+        self.assertEqual(report['results']['SMAstar']['1']['options'], {})             # SMAstar has no graph_search
+        self.assertEqual(report['results']['uniform_cost_search']['1']['options'], {'graph_search': True})
+
+    def test_memory_bounded_search(self):
+        for type_preference in range(4):
+            best = Astar_station2station(9, 3, self.map, type_preference, graph_search=True)
+            path = iterative_deepening_Astar(9, 3, self.map, type_preference)
+            self.assertAlmostEqual(path.g, best.g)
+            self.assertEqual(path.route[0], 9)
+            self.assertEqual(path.route[-1], 3)
+            for max_nodes in (len(best.route) + 1, 1000):
+                stats = SearchStats()
+                path = SMAstar(9, 3, self.map, type_preference, max_nodes=max_nodes, stats=stats)
+                self.assertAlmostEqual(path.g, best.g)
+                self.assertLessEqual(stats.peak_frontier, max_nodes)
+        self.assertIsNone(SMAstar(9, 3, self.map, 1, max_nodes=5))           # the route has 7 stations
+
+    def test_incremental_search(self):
+        cache = RouteCache(self.map)
+        kept = cache.uniform_cost_search(1, 2, 1)
+        through = cache.uniform_cost_search(9, 3, 1)
+        planners = [LPAstar(self.map, 9, 3, type_preference) for type_preference in range(4)]
+        for change in (lambda: self.map.close_station(through.route[2]), lambda: self.map.update_connection(10, 2, 500.0),
+                       lambda: self.map.reopen_station(through.route[2])):
+            change()
+            for type_preference, planner in enumerate(planners):
+                best = uniform_cost_search(9, 3, self.map, type_preference)
+                path = planner.search()
+                self.assertAlmostEqual(path.g, best.g)
+                self.assertEqual(path.route[0], 9)
+                self.assertEqual(path.route[-1], 3)
+                self.assertFalse(self.map.closed & set(path.route))
+            if len(self.map.changes) == 1:              # the closure only drops the route through the station
+                cache.check_version()
+                self.assertEqual(len(cache.routes), 1)
+                self.assertEqual(cache.uniform_cost_search(1, 2, 1).route, kept.route)
+                self.assertNotIn(through.route[2], cache.uniform_cost_search(9, 3, 1).route)
+
+    def test_closed_origin(self):
+        self.map.close_station(9)
+        engines = [depth_first_search, breadth_first_search, bidirectional_breadth_first_search,
+                   lambda o, d, map: depth_first_search(o, d, map, graph_search=True),
+                   lambda o, d, map: breadth_first_search(o, d, map, graph_search=True)]
+        engines += [lambda o, d, map, search=search: search(o, d, map, 1) for search in (
+            uniform_cost_search, bidirectional_uniform_cost_search, Astar_station2station, best_first_graph_search,
+            iterative_deepening_Astar, SMAstar)]
+        engines += [lambda o, d, map: uniform_cost_search(o, d, map, 1, graph_search=True),
+                    lambda o, d, map: Astar_station2station(o, d, map, 1, graph_search=True),
+                    lambda o, d, map: LPAstar(map, o, d, 1).search()]
+        for engine in engines:
+            self.assertIsNone(engine(9, 3, self.map))
+            self.assertIsNone(engine(3, 9, self.map))
+            self.assertIsNone(engine(9, 9, self.map))
+        self.assertEqual(k_shortest_paths(9, 3, self.map), [])
+        self.assertEqual(alternative_routes(3, 9, self.map), [])
+        self.assertTrue(np.isinf(route_many([9, 3], [9, 3], self.map).costs[[0, 0, 1], [0, 1, 0]]).all())
+        self.assertTrue(np.isinf(isochrone(9, self.map)).all())
+        self.assertNotIn(9, coord2station([self.map.stations[9]['x'], self.map.stations[9]['y']], self.map))
+        self.map.reopen_station(9)
+        self.assertEqual(coord2station([self.map.stations[9]['x'], self.map.stations[9]['y']], self.map), [9])
+
+    def test_timetable(self):
+        with tempfile.TemporaryDirectory() as folder:
+            write_timetable(build_timetable(self.map, first=420.0, last=660.0), os.path.join(folder, TIMETABLE_FILE))
+            timetable = load_timetable(folder, self.map)
+        best = uniform_cost_search(9, 3, self.map, 1)
+        path = earliest_arrival(timetable, 9, 3, 480.0)
+        self.assertEqual(path.route[0], 9)
+        self.assertEqual(path.route[-1], 3)
+        self.assertGreaterEqual(path.g, best.g - 1e-6)              # waiting for the trains is added
+        self.assertAlmostEqual(earliest_arrival_times(timetable, 9, 480.0)[3], 480.0 + path.g)
+        pairs = profile(timetable, 9, 3, 480.0, 540.0)
+        self.assertTrue(pairs)
+        for departure, arrival in pairs:
+            self.assertAlmostEqual(departure + earliest_arrival(timetable, 9, 3, departure).g, arrival)
+        self.assertEqual(pairs[0][1], 480.0 + path.g)
+        self.assertIsNone(earliest_arrival(timetable, 9, 3, 2000.0))  # after the last train
+        with self.assertRaises(ValueError):
+            Timetable([(2, 0, 1, 0.0, 0.0), (2, 0, 2, 5.0, 5.0)], self.map)
+
+    def test_alternative_routes(self):
+        for type_preference in range(4):
+            best = uniform_cost_search(9, 3, self.map, type_preference)
+            paths = k_shortest_paths(9, 3, self.map, 4, type_preference)
+            self.assertEqual(len(paths), 4)
+            self.assertAlmostEqual(paths[0].g, best.g)
+            for path, following in zip(paths, paths[1:]):
+                self.assertLessEqual(path.g, following.g + 1e-9)
+            self.assertEqual(len({tuple(p.route) for p in paths}), 4)
+            for path in paths:
+                self.assertEqual(len(set(path.route)), len(path.route))
+            alternatives = alternative_routes(9, 3, self.map, 3, type_preference)
+            self.assertAlmostEqual(alternatives[0].g, best.g)
+            self.assertEqual(len({tuple(p.route) for p in alternatives}), len(alternatives))
+        self.assertEqual(len(k_shortest_paths(1, 14, self.map, 100, 1)), 8)      # every route there is
+
+    def test_isochrone(self):
+        for type_preference in range(4):
+            cost = isochrone(9, self.map, type_preference)
+            for destination in (1, 3, 14):
+                self.assertAlmostEqual(cost[destination], uniform_cost_search(9, destination, self.map, type_preference).g)
+        cost = isochrone(9, self.map, 1)
+        bounded = isochrone(9, self.map, 1, cutoff=100)
+        np.testing.assert_array_equal(bounded, np.where(cost <= 100, cost, np.inf))
+        no_transfers = np.flatnonzero(isochrone(9, self.map, 3, cutoff=0) == 0)
+        self.assertEqual(no_transfers.tolist(), [k for k, v in self.map.stations.items() if v['line'] == 2])
+        closest = [isochrone(station, self.map, 1) for station in coord2station([204, 97], self.map)]
+        np.testing.assert_array_equal(isochrone([204, 97], self.map, 1), np.min(closest, axis=0))
+        origins = [9, 1, [204, 97]]
+        costs = isochrone_matrix(origins, self.map, 1, cutoff=150)
+        self.assertEqual(costs.shape, (3, len(cost)))
+        for row, origin in zip(costs, origins):
+            np.testing.assert_allclose(row, isochrone(origin, self.map, 1, cutoff=150))
+
+    def test_station_table(self):
+        stations = self.map.stations
+        self.assertEqual(stations[9]['x'], stations.x[9])
+        self.assertEqual(stations[9], {'name': 'PARTDIEU SERVIENT', 'line': 2, 'x': 82, 'y': 217, 'velocity': 14})
+        self.assertEqual(list(stations), list(range(1, 15)))
+        self.assertNotIn(0, stations)
+        stations[9]['x'] = 90
+        self.assertEqual(stations.x[9], 90)
+        self.assertEqual(stations.lists()[0][9], 90)
+        map = Map()
+        map.add_station(3, 'A', 1, 0, 0)
+        self.assertNotIn('velocity', map.stations[3])
+        self.assertFalse(hasattr(Path([1, 2]), '__dict__'))
+
     def create_path_with_g(self, r, g):
         path = Path(r)
         path.g = g
@@ -160,6 +547,17 @@ class TestCases(unittest.TestCase):
         stationID = coord2station([10, 11], self.map)
         self.assertEqual(stationID, [1])
 
+    def test_station_index(self):
+        index = self.map.station_index()
+        self.assertEqual(index.nearest([105, 205]), [8, 12, 13])
+        self.assertEqual(index.k_nearest([105, 205], 4)[:3], [8, 12, 13])
+        self.assertEqual(index.radius([10, 11], 0), [])
+        self.assertEqual(index.nearest_many([[105, 205], [300, 111], [10, 11]]), [[8, 12, 13], [3], [1]])
+        self.map.stations[3]['x'] = 105                 # moving a station rebuilds the index
+        self.map.stations[3]['y'] = 205
+        self.assertEqual(self.map.station_index().nearest([105, 205]), [3])
+        self.assertEqual(coord2station([105, 205], self.map), [3])
+
     def test_Astar(self):
 
         # If you want to see the optimal_path's route and f-cost,
@@ -0,0 +1,392 @@
+# Timetables and time-dependent routing with the connection scan algorithm (CSA).
+#
+# _________________________________________________________________________________________
+# Intel.ligencia Artificial
+# Grau en Enginyeria Informatica
+# Curs 2021 - 2022
+# Universitat Autonoma de Barcelona
+# _________________________________________________________________________________________
+
+from SubwayMap import *
+from utils import *
+from bisect import bisect_left, bisect_right
+import argparse
+import heapq
+import math
+import numpy as np
+
+# File of a CityInformation folder with its timetable (see read_timetable)
+TIMETABLE_FILE = 'Timetable.txt'
+
+
+class Timetable:
+    """
+    Departures of a city as connections: a train of trip trip[c] leaves dep_station[c] at dep_time[c]
+    and stops next at arr_station[c] at arr_time[c]. The connections are sorted by dep_time (then
+    arr_time), so a query is a single pass over the ones after its departure time.
+        dep_station, arr_station, trip: int32 arrays, dep_time, arr_time: float64 arrays (times in the
+            unit of Time.txt)
+        trip_offsets, trip_connections: connections of trip t, in order, are
+            trip_connections[trip_offsets[t]:trip_offsets[t+1]]; trip_position[c] is where c is in them
+        transfer_offsets, transfer_indices, transfer_times: CSR of the transfers of the map (connections
+            between stations of different lines, such as CHARPENNES 1 -> CHARPENNES 2), with their cost in
+            Time.txt; they are taken at any time and already chained (two transfers are a single one)
+    Stations are map ids, so routes can be used with the rest of the code (Path, calculate_cost, ...).
+    The timetable doesn't follow later changes of the map (close_station, ...), it has to be built again.
+    Usage:
+        >>> timetable = load_timetable('../CityInformation/Lyon_smallCity/', map)
+        >>> earliest_arrival(timetable, 9, 3, 480.0)
+        >>> profile(timetable, 9, 3, 480.0, 540.0)
+    """
+    def __init__(self, stops, map):
+        """
+         Format of the parameter is:
+            Args:
+                stops (list): (line, trip, station, arrival, departure) of every stop, the stops of a trip in
+                              the order the train makes them (see read_timetable)
+                map (object of Map class): The map of the city, for its stations and transfers
+        """
+        self.size = max(map.stations) + 1
+        trips = {}                                      # trip -> its stops
+        for line, trip, station, arrival, departure in stops:
+            if station not in map.stations:
+                raise ValueError("unknown station {} in trip {}".format(station, trip))
+            if map.stations[station]['line'] != line:
+                raise ValueError("station {} is not on line {} (trip {})".format(station, line, trip))
+            trips.setdefault(trip, []).append((station, arrival, departure))
+
+        dep_station, arr_station, dep_time, arr_time, trip_of = [], [], [], [], []
+        for number, trip_stops in enumerate(trips.values()):
+            for (origin, _, departure), (destination, arrival, _) in zip(trip_stops, trip_stops[1:]):
+                if arrival < departure:
+                    raise ValueError("trip {} arrives at {} before leaving {}".format(number, destination, origin))
+                dep_station.append(origin)
+                arr_station.append(destination)
+                dep_time.append(departure)
+                arr_time.append(arrival)
+                trip_of.append(number)
+        self.trips = len(trips)
+        self.trip_names = list(trips)                   # trip number -> trip id of the file
+
+        dep_time, arr_time = np.array(dep_time, dtype=np.float64), np.array(arr_time, dtype=np.float64)
+        order = np.lexsort((arr_time, dep_time))
+        self.dep_station = np.array(dep_station, dtype=np.int32)[order]
+        self.arr_station = np.array(arr_station, dtype=np.int32)[order]
+        self.dep_time = dep_time[order]
+        self.arr_time = arr_time[order]
+        self.trip = np.array(trip_of, dtype=np.int32)[order]
+
+        self.trip_connections = np.argsort(self.trip, kind='stable').astype(np.int32)
+        self.trip_offsets = np.zeros(self.trips + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.trip, minlength=self.trips), out=self.trip_offsets[1:])
+        self.trip_position = np.empty(len(order), dtype=np.int64)
+        self.trip_position[self.trip_connections] = np.arange(len(order))
+
+        self.transfer_offsets, self.transfer_indices, self.transfer_times = transfer_arrays(map, self.size)
+        self.python_lists = None
+
+    def __len__(self):
+        return len(self.dep_time)
+
+    def lists(self):
+        # The arrays as Python lists, much faster than NumPy in the loops of the scans (see CostGraph.lists)
+        if self.python_lists is None:
+            self.python_lists = tuple(array.tolist() for array in (
+                self.dep_station, self.arr_station, self.dep_time, self.arr_time, self.trip,
+                self.trip_connections, self.trip_position,
+                self.transfer_offsets, self.transfer_indices, self.transfer_times))
+        return self.python_lists
+
+
+def transfer_arrays(map, size):
+    # CSR of the cheapest chain of transfers (connections between different lines) between every two stations
+    line = {k: v['line'] for k, v in map.stations.items()}
+    transfers = {}
+    for origin in map.connections:
+        for destination, cost in map.connections[origin].items():
+            if line.get(origin) != line.get(destination):
+                transfers.setdefault(origin, {})[destination] = float(cost)
+
+    offsets, indices, times = [0] * (size + 1), [], []
+    for station in range(size):
+        reached = {station: 0.0}                        # Dijkstra over the transfers only, the groups are tiny
+        heap = [(0.0, station)]
+        while heap:
+            time, current = heapq.heappop(heap)
+            if time > reached[current]:
+                continue
+            for neighbour, cost in transfers.get(current, {}).items():
+                if time + cost < reached.get(neighbour, math.inf):
+                    reached[neighbour] = time + cost
+                    heapq.heappush(heap, (time + cost, neighbour))
+        del reached[station]
+        for neighbour in sorted(reached):
+            indices.append(neighbour)
+            times.append(reached[neighbour])
+        offsets[station + 1] = len(indices)
+    return np.array(offsets, dtype=np.int64), np.array(indices, dtype=np.int32), np.array(times, dtype=np.float64)
+
+
+def scan(timetable, origin_id, departure_time, destination_id=None):
+    """
+     Earliest arrival connection scan: the connections leaving from departure_time on are read in
+     order and a train is taken when it leaves a station that was already reached (or it was taken
+     before). With destination_id it stops once no connection can arrive there earlier.
+     Format of the parameter is:
+        Args:
+            timetable (Timetable): The connections of the city
+            origin_id (int): Starting station id
+            departure_time (float): Time the journey starts at origin_id
+            destination_id (int): Optional final station id
+        Returns:
+            arrival (list): Earliest arrival time at every station (math.inf if it can't be reached)
+            reached_by (list): Connection that gets to every station (-1 for the origin and transfers)
+            boarded (list): Connection where the train of reached_by was taken
+            walked_from (list): Station the transfer to every station comes from (-1 if none)
+    """
+    dep_station, arr_station, dep_time, arr_time, trip, _, _, transfer_offsets, transfer_indices, transfer_times = timetable.lists()
+    arrival = [math.inf] * timetable.size
+    reached_by = [-1] * timetable.size
+    boarded = [-1] * timetable.size
+    walked_from = [-1] * timetable.size
+    trip_boarded = [-1] * timetable.trips               # connection where every trip was taken (-1 if it wasn't)
+
+    arrival[origin_id] = departure_time
+    for e in range(transfer_offsets[origin_id], transfer_offsets[origin_id + 1]):
+        arrival[transfer_indices[e]] = departure_time + transfer_times[e]
+        walked_from[transfer_indices[e]] = origin_id
+
+    for c in range(bisect_left(dep_time, departure_time), len(dep_time)):
+        if destination_id is not None and dep_time[c] >= arrival[destination_id]:
+            break                                       # the rest leave too late to improve it
+        t = trip[c]
+        if trip_boarded[t] < 0:
+            if arrival[dep_station[c]] > dep_time[c]:
+                continue                                # the train can't be taken
+            trip_boarded[t] = c
+        station, time = arr_station[c], arr_time[c]
+        if time < arrival[station]:
+            arrival[station] = time
+            reached_by[station], boarded[station], walked_from[station] = c, trip_boarded[t], -1
+            for e in range(transfer_offsets[station], transfer_offsets[station + 1]):
+                neighbour = transfer_indices[e]
+                if time + transfer_times[e] < arrival[neighbour]:
+                    arrival[neighbour] = time + transfer_times[e]
+                    reached_by[neighbour], walked_from[neighbour] = -1, station
+    return arrival, reached_by, boarded, walked_from
+
+
+def earliest_arrival_times(timetable, origin_id, departure_time):
+    # Earliest arrival time at every station (np.inf if it can't be reached that day) leaving origin_id at departure_time
+    return np.array(scan(timetable, origin_id, departure_time)[0])
+
+
+def earliest_arrival(timetable, origin_id, destination_id, departure_time):
+    """
+     Route that gets to destination_id as soon as possible leaving origin_id at departure_time
+     Format of the parameter is:
+        Args:
+            timetable (Timetable): The connections of the city
+            origin_id (int): Starting station id
+            destination_id (int): Final station id
+            departure_time (float): Time the journey starts at origin_id
+        Returns:
+            path (Path Class): The stations of the journey (the ones the trains stop at and the transfers),
+                               g is the time it takes (waits included); None if it can't be done
+    """
+    arrival, reached_by, boarded, walked_from = scan(timetable, origin_id, departure_time, destination_id)
+    if arrival[destination_id] == math.inf:
+        return None
+    dep_station, _, _, _, _, trip_connections, trip_position = timetable.lists()[:7]
+
+    route = [destination_id]
+    station = destination_id
+    while station != origin_id:
+        if reached_by[station] < 0:                     # a transfer
+            station = walked_from[station]
+            route.append(station)
+        else:                                           # the stops of the train, back to where it was taken
+            for position in range(trip_position[reached_by[station]], trip_position[boarded[station]] - 1, -1):
+                route.append(dep_station[trip_connections[position]])
+            station = route[-1]
+    route.reverse()
+    path = Path(route)
+    path.g = arrival[destination_id] - departure_time
+    path.update_f()
+    return path
+
+
+def profile(timetable, origin_id, destination_id, start=-math.inf, end=math.inf):
+    """
+     Every useful departure from origin_id to destination_id between start and end: (departure, arrival)
+     pairs where leaving later arrives later, so any other departure time waits for the next one of them.
+     It is a single backwards connection scan that keeps, for every station, the pairs of its own
+     journeys to destination_id. Journeys that only use transfers, without any train, are left out.
+     Format of the parameter is:
+        Args:
+            timetable (Timetable): The connections of the city
+            origin_id (int): Starting station id
+            destination_id (int): Final station id
+            start (float): First departure time of interest
+            end (float): Last departure time of interest
+        Returns:
+            pairs (list): (departure, arrival) tuples sorted by departure
+    """
+    dep_station, arr_station, dep_time, arr_time, trip, _, _, transfer_offsets, transfer_indices, transfer_times = timetable.lists()
+    to_destination = {}                                 # station -> transfer time to destination_id
+    for station in range(timetable.size):
+        for e in range(transfer_offsets[station], transfer_offsets[station + 1]):
+            if transfer_indices[e] == destination_id:
+                to_destination[station] = transfer_times[e]
+    to_destination[destination_id] = 0.0
+
+    departures = [[] for _ in range(timetable.size)]    # -departure of the pairs of every station (increasing)
+    arrivals = [[] for _ in range(timetable.size)]
+    trip_arrival = [math.inf] * timetable.trips         # arrival at destination_id staying on every trip
+
+    def evaluate(station, time):
+        # Arrival of the first pair of station leaving at time or later
+        i = bisect_right(departures[station], -time) - 1
+        return arrivals[station][i] if i >= 0 else math.inf
+
+    for c in range(len(dep_time) - 1, bisect_left(dep_time, start) - 1, -1):
+        station, time = arr_station[c], arr_time[c]
+        best = min(time + to_destination.get(station, math.inf), trip_arrival[trip[c]], evaluate(station, time))
+        for e in range(transfer_offsets[station], transfer_offsets[station + 1]):
+            best = min(best, evaluate(transfer_indices[e], time + transfer_times[e]))
+        if best == math.inf:
+            continue
+        trip_arrival[trip[c]] = min(trip_arrival[trip[c]], best)
+        origin = dep_station[c]
+        if best < (arrivals[origin][-1] if arrivals[origin] else math.inf):
+            if departures[origin] and departures[origin][-1] == -dep_time[c]:
+                arrivals[origin][-1] = best
+            else:
+                departures[origin].append(-dep_time[c])
+                arrivals[origin].append(best)
+
+    candidates = [(-d, a) for d, a in zip(departures[origin_id], arrivals[origin_id])]
+    for e in range(transfer_offsets[origin_id], transfer_offsets[origin_id + 1]):   # a transfer before the first train
+        candidates += [(-d - transfer_times[e], a) for d, a in zip(departures[transfer_indices[e]], arrivals[transfer_indices[e]])]
+    pairs = []
+    for departure, arrival in sorted(candidates, key=lambda pair: (-pair[0], pair[1])):
+        if not pairs or arrival < pairs[-1][1]:
+            pairs.append((departure, arrival))
+    return [(departure, arrival) for departure, arrival in reversed(pairs) if start <= departure <= end]
+
+
+def line_patterns(map):
+    """
+     Stations of every line in the order the trains stop at them: a walk along the connections between
+     stations of the line from one of its ends (a new walk for every branch, starting at the station
+     where it joins the rest).
+        Returns:
+            patterns (list): (line, [station ids]) tuples
+    """
+    stations = {}
+    for k, v in sorted(map.stations.items()):
+        stations.setdefault(v['line'], []).append(k)
+    patterns = []
+    for line, members in sorted(stations.items()):
+        neighbours = {k: sorted(n for n in map.connections.get(k, {}) if map.stations[n]['line'] == line) for k in members}
+        visited = set()
+        while len(visited) < len(members):
+            remaining = [k for k in members if k not in visited]
+            ends = [k for k in remaining if sum(n not in visited for n in neighbours[k]) <= 1]
+            station = (ends or remaining)[0]
+            joins = [n for n in neighbours[station] if n in visited]
+            pattern = joins[:1] + [station]             # a branch starts at the station where it joins
+            visited.add(station)
+            while True:
+                following = [n for n in neighbours[pattern[-1]] if n not in pattern]
+                if not following:
+                    break
+                pattern.append(following[0])
+                if following[0] in visited:
+                    break
+                visited.add(following[0])
+            if len(pattern) > 1:
+                patterns.append((line, pattern))
+    return patterns
+
+
+def build_timetable(map, headway=10.0, first=0.0, last=1440.0, dwell=0.0):
+    """
+     Synthetic timetable of a map (the cities come without one): trains run along every line pattern
+     in both directions every headway from first to last, taking the cost of Time.txt between stops
+     and waiting dwell at each one. The second direction starts headway / 2 later.
+     Format of the parameter is:
+        Args:
+            map (object of Map class): All the map information
+            headway (float): Time between trains, in the unit of Time.txt
+            first (float): Departure of the first train
+            last (float): No train departs after it
+            dwell (float): Time the trains stay at every intermediate stop
+        Returns:
+            stops (list): (line, trip, station, arrival, departure) tuples, see Timetable
+    """
+    stops = []
+    trip = 0
+    for line, pattern in line_patterns(map):
+        for direction, stations in enumerate((pattern, pattern[::-1])):
+            if any(b not in map.connections.get(a, {}) for a, b in zip(stations, stations[1:])):
+                continue                                # the line can't be run in this direction
+            departure = first + direction * headway / 2
+            while departure <= last:
+                time = departure
+                for i, station in enumerate(stations):
+                    if i > 0:
+                        time += float(map.connections[stations[i - 1]][station])
+                    wait = dwell if 0 < i < len(stations) - 1 else 0.0
+                    stops.append((line, trip, station, time, time + wait))
+                    time += wait
+                trip += 1
+                departure += headway
+    return stops
+
+
+def read_timetable(filename):
+    """
+    Reads a timetable file: one stop per line with the format
+        line<TAB>trip<TAB>station_id<TAB>arrival<TAB>departure
+    the stops of every trip in order; lines starting with # are comments.
+    Returns the (line, trip, station, arrival, departure) tuples that Timetable takes.
+    """
+    stops = []
+    with open(filename, 'r') as fp:
+        for line in fp:
+            information = line.split()
+            if not information or information[0].startswith('#'):
+                continue
+            stops.append((int(information[0]), int(information[1]), int(information[2]),
+                          float(information[3]), float(information[4])))
+    return stops
+
+
+def write_timetable(stops, filename):
+    with open(filename, 'w') as fp:
+        fp.write('# line\ttrip\tstation\tarrival\tdeparture\n')
+        for line, trip, station, arrival, departure in stops:
+            fp.write('{}\t{}\t{}\t{:.5f}\t{:.5f}\n'.format(line, trip, station, arrival, departure))
+
+
+def load_timetable(root_folder, map):
+    # Timetable of a CityInformation folder (its TIMETABLE_FILE) for the map load_map gives
+    return Timetable(read_timetable(os.path.join(root_folder, TIMETABLE_FILE)), map)
+
+
+if __name__ == "__main__":
+    # python Timetable.py ../CityInformation/Lyon_smallCity/ --headway 5
+    parser = argparse.ArgumentParser(description='Writes a synthetic timetable for a CityInformation/<city> folder')
+    parser.add_argument('root_folder')
+    parser.add_argument('--headway', type=float, default=10.0)
+    parser.add_argument('--first', type=float, default=0.0)
+    parser.add_argument('--last', type=float, default=1440.0)
+    parser.add_argument('--dwell', type=float, default=0.0)
+    parser.add_argument('-o', '--output', help='timetable file (root_folder/{} by default)'.format(TIMETABLE_FILE))
+    args = parser.parse_args()
+
+    stops = build_timetable(load_map(args.root_folder), args.headway, args.first, args.last, args.dwell)
+    output = args.output or os.path.join(args.root_folder, TIMETABLE_FILE)
+    write_timetable(stops, output)
+    print('{} stops written to {}'.format(len(stops), output))
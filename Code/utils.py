@@ -1,5 +1,9 @@
 from SubwayMap import *
 import numpy as np
+import os
+import sys
+import heapq
+import itertools
 import math
 import signal
 import time
@@ -45,6 +49,106 @@ def read_cost_table(filename):
     return connections
 
 
+def read_edge_list(filename):
+    """
+    Reads a sparse cost table: one connection per line with the format
+        origin_id<TAB>destination_id<TAB>cost
+    Returns the same dictionary of dictionaries as read_cost_table, but the work and
+    memory grow with the number of connections instead of N^2.
+    """
+    connections = {}
+    with open(filename, 'r') as fp:
+        for line in fp:
+            information = line.split()
+            if not information:
+                continue
+            origin, destination = int(information[0]), int(information[1])
+            if origin not in connections:
+                connections[origin] = {destination: float(information[2])}
+            else:
+                connections[origin][destination] = float(information[2])
+
+    return connections
+
+
+def write_edge_list(connections, filename):
+    with open(filename, 'w') as fp:
+        for origin, neighbours in connections.items():
+            for destination, cost in neighbours.items():
+                fp.write('{}\t{}\t{}\n'.format(origin, destination, repr(float(cost))))
+
+
+# Binary cost table: a header of 4 int64 (magic, version, rows, connections) followed by the CSR arrays
+# offsets (int64[rows + 1]), indices (int32[connections], padded to 8 bytes) and weights (float64[connections])
+EDGE_BINARY_MAGIC = 0x52534359415742    # 'BWAYCSR'
+EDGE_BINARY_VERSION = 1
+
+
+def write_edge_binary(connections, filename):
+    map = Map()
+    map.add_connection(connections)
+    offsets, indices, weights = map.csr_arrays()
+    offsets = np.ascontiguousarray(offsets, dtype=np.int64)
+    indices = np.ascontiguousarray(indices, dtype=np.int32)
+    weights = np.ascontiguousarray(weights, dtype=np.float64)
+
+    with open(filename, 'wb') as fp:
+        np.array([EDGE_BINARY_MAGIC, EDGE_BINARY_VERSION, len(offsets) - 1, len(indices)], dtype=np.int64).tofile(fp)
+        offsets.tofile(fp)
+        indices.tofile(fp)
+        if len(indices) % 2:
+            np.zeros(1, dtype=np.int32).tofile(fp)
+        weights.tofile(fp)
+
+
+def read_edge_binary(filename):
+    """
+    Memory-maps a binary cost table written by write_edge_binary.
+    Nothing is read until it is used, so loading is O(1) and only the touched pages end up in memory.
+    Returns a CSRConnections to be given to Map.add_connection.
+    """
+    magic, version, rows, edges = np.fromfile(filename, dtype=np.int64, count=4)
+    if magic != EDGE_BINARY_MAGIC or version != EDGE_BINARY_VERSION:
+        raise ValueError('{} is not a version {} binary cost table'.format(filename, EDGE_BINARY_VERSION))
+
+    position = 4 * 8
+    offsets = np.memmap(filename, dtype=np.int64, mode='r', offset=position, shape=(rows + 1,))
+    position += (rows + 1) * 8
+    indices = np.memmap(filename, dtype=np.int32, mode='r', offset=position, shape=(edges,))
+    position += (edges + edges % 2) * 4
+    weights = np.memmap(filename, dtype=np.float64, mode='r', offset=position, shape=(edges,))
+
+    return CSRConnections(offsets, indices, weights)
+
+
+def convert_cost_table(filename, output):
+    # Converts a dense Time.txt matrix into a sparse table: binary if output ends in .bin, text otherwise
+    connections = read_cost_table(filename)
+    if output.endswith('.bin'):
+        write_edge_binary(connections, output)
+    else:
+        write_edge_list(connections, output)
+
+
+def load_map(root_folder):
+    """
+    Builds the Map of a CityInformation folder. The connections are read from the first file found of
+    Edges.bin (binary, memory-mapped), Edges.txt (sparse edge list) and Time.txt (dense matrix).
+    """
+    map = read_station_information(os.path.join(root_folder, 'Stations.txt'))
+    if os.path.exists(os.path.join(root_folder, 'Edges.bin')):
+        connections = read_edge_binary(os.path.join(root_folder, 'Edges.bin'))
+    elif os.path.exists(os.path.join(root_folder, 'Edges.txt')):
+        connections = read_edge_list(os.path.join(root_folder, 'Edges.txt'))
+    else:
+        connections = read_cost_table(os.path.join(root_folder, 'Time.txt'))
+    map.add_connection(connections)
+
+    infoVelocity_clean = read_information(os.path.join(root_folder, 'InfoVelocity.txt'))
+    map.add_velocity(infoVelocity_clean)
+    return map
+
+
 def print_list_of_path(pathList):
     for p in pathList:
         print("Route: {}".format(p.route))
@@ -55,6 +159,56 @@ def print_list_of_path_with_cost(pathList):
         print("Route: {}, \t Cost: {}".format(p.route, p.g))
 
 
+class PathHeap:
+    """
+    Binary heap used as the frontier of the cost based searches.
+
+    Paths are ordered by the priority given when they are pushed (g for UCS, f for A*).
+    Ties are broken by insertion order, so paths with the same priority come out in the
+    same order the old sorted list kept them (new paths go after the equal ones).
+    remove() only marks a path; marked paths are skipped once they reach the top.
+    Usage:
+        >>> frontier = PathHeap()
+        >>> frontier.push(Path(2), 0)
+        >>> frontier.peek().last, frontier.pop().last
+    """
+    def __init__(self):
+        self.heap = []
+        self.removed = set()
+        self.counter = itertools.count()
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        # live paths, in heap (not priority) order
+        for _, _, path in self.heap:
+            if id(path) not in self.removed:
+                yield path
+
+    def push(self, path, priority):
+        heapq.heappush(self.heap, (priority, next(self.counter), path))
+        self.size += 1
+
+    def pop(self):
+        self.discard_removed()
+        self.size -= 1
+        return heapq.heappop(self.heap)[2]
+
+    def peek(self):
+        self.discard_removed()
+        return self.heap[0][2]
+
+    def remove(self, path):
+        self.removed.add(id(path))
+        self.size -= 1
+
+    def discard_removed(self):
+        while self.heap and id(self.heap[0][2]) in self.removed:
+            self.removed.discard(id(heapq.heappop(self.heap)[2]))
+
+
 class TestTimeout(Exception):
     pass
 
@@ -74,3 +228,11 @@ class test_timeout:
 
   def __exit__(self, exc_type, exc_val, exc_tb):
     signal.alarm(0)
+
+
+if __name__ == "__main__":
+    # python utils.py ../CityInformation/Lyon_bigCity/Time.txt ../CityInformation/Lyon_bigCity/Edges.bin
+    if len(sys.argv) != 3:
+        print("usage: python utils.py <dense Time.txt> <output .txt edge list or .bin>")
+        sys.exit(1)
+    convert_cost_table(sys.argv[1], sys.argv[2])